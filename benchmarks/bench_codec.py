@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+"""
+Compare the encoding of fund infos in the cache by `quickfund.codec` with the formats
+it replaced: pickle, used by the local backend, and JSON, used by the network backend.
+Both the encoded size and the time to encode and decode are reported.
+
+Usage: python benchmarks/bench_codec.py [-n NUMBER] [-r REPEAT]
+"""
+
+import math
+import pickle
+import sys
+import timeit
+from collections.abc import Callable
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any
+
+import attr
+import click
+
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from quickfund.codec import decode_fund_info, encode_fund_info
+from quickfund.models import FundInfo
+from quickfund.utils.decoding import dumps, loads, parse_date, parse_datetime
+
+
+FUND_INFO = FundInfo(
+    净值日期=date(2021, 12, 17),
+    单位净值=3.1709,
+    日增长率=-0.0113,
+    分红送配="",
+    上一天净值=3.2071,
+    上一天净值日期=date(2021, 12, 16),
+    基金代码="000478",
+    基金名称="建信中证500指数增强A",
+    估算日期=datetime(2021, 12, 20, 11, 2),
+    实时估值=3.1345,
+    估算增长率=-0.0115,
+    同类排名截止日期=date(2021, 12, 17),
+    近1周同类排名="435/1778",
+    近1月同类排名="282/1720",
+    近3月同类排名="1317/1632",
+    近6月同类排名="204/1378",
+    今年来同类排名="157/1190",
+    近1年同类排名="203/1174",
+    近2年同类排名="247/924",
+    近3年同类排名="261/670",
+)  # type: ignore # FIXME https://github.com/python-attrs/attrs/issues/795
+
+
+def encode_pickle(fund_info: FundInfo) -> bytes:
+    return pickle.dumps(fund_info, pickle.HIGHEST_PROTOCOL)
+
+
+def decode_pickle(data: bytes) -> FundInfo:
+    return pickle.loads(data)
+
+
+FLOAT_FIELDS = [field.name for field in attr.fields(FundInfo) if field.type == "float"]
+
+FIELD_DECODERS = {"date": parse_date, "datetime": parse_datetime}
+
+
+def encode_json(fund_info: FundInfo) -> bytes:
+    obj = attr.asdict(fund_info)
+    for name in FLOAT_FIELDS:
+        if math.isnan(obj[name]):
+            obj[name] = None
+    return dumps(obj)
+
+
+def decode_json(data: bytes) -> FundInfo:
+    obj = loads(data)
+    for field in attr.fields(FundInfo):
+        # Field types are strings, since models.py postpones evaluating annotations
+        if isinstance(field.type, str) and field.type in FIELD_DECODERS:
+            obj[field.name] = FIELD_DECODERS[field.type](obj[field.name])
+        elif field.type == "float" and obj[field.name] is None:
+            obj[field.name] = math.nan
+    return FundInfo(**obj)
+
+
+FORMATS: dict[str, tuple[Callable[[FundInfo], bytes], Callable[[bytes], FundInfo]]] = {
+    "pickle": (encode_pickle, decode_pickle),
+    "json": (encode_json, decode_json),
+    "codec": (encode_fund_info, decode_fund_info),
+}
+
+
+def measure(func: Callable[[], Any], number: int, repeat: int) -> float:
+    """Return the best time, in seconds, per call"""
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+@click.command()
+@click.option("-n", "--number", default=20_000, show_default=True)
+@click.option("-r", "--repeat", default=5, show_default=True)
+def main(number: int, repeat: int) -> None:
+
+    print(f"{'format':<8} {'size':>6} {'encode':>10} {'decode':>10}")
+
+    for name, (encode, decode) in FORMATS.items():
+        data = encode(FUND_INFO)
+        assert decode(data) == FUND_INFO, f"{name} doesn't round-trip"
+
+        encode_time = measure(lambda: encode(FUND_INFO), number, repeat)
+        decode_time = measure(lambda: decode(data), number, repeat)
+
+        print(
+            f"{name:<8} {len(data):>5}B"
+            f" {encode_time * 1e6:>8.2f}us {decode_time * 1e6:>8.2f}us"
+        )
+
+
+if __name__ == "__main__":
+    main()  # pylint: disable=no-value-for-parameter
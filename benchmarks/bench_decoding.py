@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+"""
+Compare the decoding layer of `quickfund.utils.decoding` with the path it replaced, on
+the hot spot of decoding responses of the estimate API, as in watch mode.
+
+The decoding layer uses orjson if it's installed, so run the benchmark with and without
+orjson installed to see the gain of each part.
+
+See `bench_codec.py` for the encoding of fund infos in the cache.
+
+Usage: python benchmarks/bench_decoding.py [-n NUMBER] [-r REPEAT]
+"""
+
+import json
+import sys
+import timeit
+from collections.abc import Callable
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+import click
+import regex
+
+
+ROOT = Path(__file__).resolve().parent.parent
+
+sys.path.insert(0, str(ROOT))
+
+from quickfund.utils.decoding import loads, orjson, parse_minute_datetime, strip_jsonp
+
+
+ESTIMATE_TEXT = (ROOT / "mocks" / "estimate_api_response_text.txt").read_text(
+    encoding="utf-8"
+)
+
+
+def decode_estimate_baseline() -> Any:
+    pattern = r"jsonpgz\((?P<json>.*)\);"
+    data = json.loads(regex.fullmatch(pattern, ESTIMATE_TEXT).group("json"))
+    gztime = datetime.strptime(data["gztime"], "%Y-%m-%d %H:%M")
+    return data, gztime
+
+
+def decode_estimate_layer() -> Any:
+    data = loads(strip_jsonp(ESTIMATE_TEXT, "jsonpgz"))
+    gztime = parse_minute_datetime(data["gztime"])
+    return data, gztime
+
+
+def measure(func: Callable[[], Any], number: int, repeat: int) -> float:
+    """Return the best time, in seconds, per call"""
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def report(title: str, number: int, repeat: int, *cases: Callable[[], Any]) -> None:
+    print(f"{title}:")
+
+    assert len({repr(case()) for case in cases}) == 1, "cases disagree"
+
+    baseline = measure(cases[0], number, repeat)
+    print(f"  {cases[0].__name__:<32} {baseline * 1e6:8.2f} us")
+
+    for case in cases[1:]:
+        elapsed = measure(case, number, repeat)
+        print(
+            f"  {case.__name__:<32} {elapsed * 1e6:8.2f} us"
+            f"  speedup {baseline / elapsed:5.1f}x"
+        )
+
+
+@click.command()
+@click.option("-n", "--number", default=20_000, show_default=True)
+@click.option("-r", "--repeat", default=5, show_default=True)
+def main(number: int, repeat: int) -> None:
+
+    print(f"orjson: {'installed' if orjson else 'not installed'}")
+
+    report(
+        "Decode estimate API response",
+        number,
+        repeat,
+        decode_estimate_baseline,
+        decode_estimate_layer,
+    )
+
+
+if __name__ == "__main__":
+    main()  # pylint: disable=no-value-for-parameter
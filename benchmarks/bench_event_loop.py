@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+"""
+Compare the overhead per request of the event loops selectable by `--event-loop`, by
+sending requests with `FundInfoFetcher.GET_text()` to a local server that serves the
+mocked estimate API response.
+
+The server runs on its own asyncio event loop in a background thread, so that only
+the event loop of the client varies. Rate limiting and warm-up are disabled.
+
+Usage: python benchmarks/bench_event_loop.py [-n REQUESTS] [-r REPEAT]
+"""
+
+import asyncio
+import sys
+import threading
+import time
+from pathlib import Path
+
+import click
+from aiohttp import web
+
+
+ROOT = Path(__file__).resolve().parent.parent
+
+sys.path.insert(0, str(ROOT))
+
+from quickfund.fetcher import FundInfoFetcher
+from quickfund.session import SessionConfig
+from quickfund.utils.eventloop import set_event_loop_kind, uvloop
+
+
+ESTIMATE_TEXT = (ROOT / "mocks" / "estimate_api_response_text.txt").read_text(
+    encoding="utf-8"
+)
+
+SESSION_CONFIG = SessionConfig(warm_up_connections=0, rate_limit_per_host=0)
+
+
+def start_server() -> str:
+    """Start the server in a background thread. Return its base URL."""
+
+    async def handle(_: web.Request) -> web.Response:
+        return web.Response(text=ESTIMATE_TEXT, content_type="application/javascript")
+
+    app = web.Application()
+    app.router.add_get("/js/{fund_code}.js", handle)
+
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(app, access_log=None)
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    loop.run_until_complete(site.start())
+    port = site._server.sockets[0].getsockname()[1]  # type: ignore
+
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+
+    return f"http://127.0.0.1:{port}"
+
+
+async def send_requests(base_url: str, n: int) -> float:
+    """Return the elapsed time, in seconds, of sending n requests concurrently"""
+
+    async with FundInfoFetcher(result_ttl=0, session_config=SESSION_CONFIG) as fetcher:
+
+        # Open the connections beforehand, which is not what is measured
+        await fetcher.GET_text(f"{base_url}/js/000000.js")
+
+        start = time.perf_counter()
+        await asyncio.gather(
+            *(
+                fetcher.GET_text(f"{base_url}/js/{i:06}.js", fund_code=f"{i:06}")
+                for i in range(n)
+            )
+        )
+        return time.perf_counter() - start
+
+
+@click.command()
+@click.option("-n", "--requests", "n", default=2000, show_default=True)
+@click.option("-r", "--repeat", default=5, show_default=True)
+def main(n: int, repeat: int) -> None:
+
+    base_url = start_server()
+
+    kinds = ["asyncio", "uvloop"] if uvloop else ["asyncio"]
+    if not uvloop:
+        print("uvloop: not installed")
+
+    baseline = None
+
+    for kind in kinds:
+        set_event_loop_kind(kind)  # type: ignore
+        elapsed = min(asyncio.run(send_requests(base_url, n)) for _ in range(repeat))
+        per_request = elapsed / n
+
+        line = f"{kind:<8} {per_request * 1e6:8.1f} us/request"
+        if baseline is None:
+            baseline = per_request
+        else:
+            line += f"  speedup {baseline / per_request:4.2f}x"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()  # pylint: disable=no-value-for-parameter
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+
+"""
+Compare the latencies of requests sent with `FundInfoFetcher.GET_text()`, with and
+without hedging, to a local server that serves the mocked estimate API response, and
+occasionally stalls, like Eastmoney does.
+
+The server runs on its own asyncio event loop in a background thread. Requests are
+sent by a fixed number of concurrent clients, so that the latencies are not dominated
+by waiting for the connection pool. Rate limiting and warm-up are disabled.
+
+Usage: python benchmarks/bench_hedging.py [-n REQUESTS] [-c CONCURRENCY]
+    [--stall-rate RATE] [--stall SECONDS] [-p PERCENTILE] [-b BUDGET]
+"""
+
+import asyncio
+import random
+import sys
+import threading
+import time
+from pathlib import Path
+
+import click
+from aiohttp import web
+
+
+ROOT = Path(__file__).resolve().parent.parent
+
+sys.path.insert(0, str(ROOT))
+
+from quickfund.fetcher import FundInfoFetcher
+from quickfund.session import SessionConfig
+
+
+ESTIMATE_TEXT = (ROOT / "mocks" / "estimate_api_response_text.txt").read_text(
+    encoding="utf-8"
+)
+
+# The latency of the server when it doesn't stall, in seconds
+BASE_LATENCY = 0.02
+
+
+def start_server(stall_rate: float, stall: float) -> str:
+    """Start the server in a background thread. Return its base URL."""
+
+    async def handle(_: web.Request) -> web.Response:
+        stalled = random.random() < stall_rate
+        await asyncio.sleep(stall if stalled else BASE_LATENCY * random.uniform(0.5, 2))
+        return web.Response(text=ESTIMATE_TEXT, content_type="application/javascript")
+
+    app = web.Application()
+    app.router.add_get("/js/{fund_code}.js", handle)
+
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(app, access_log=None)
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    loop.run_until_complete(site.start())
+    port = site._server.sockets[0].getsockname()[1]  # type: ignore
+
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+
+    return f"http://127.0.0.1:{port}"
+
+
+async def send_requests(
+    base_url: str, n: int, concurrency: int, session_config: SessionConfig
+) -> tuple[list[float], FundInfoFetcher]:
+    """Return the latencies, in seconds, of the requests, and the fetcher"""
+
+    latencies = []
+    fund_codes = iter(range(n))
+
+    async with FundInfoFetcher(
+        result_ttl=0, session_config=session_config
+    ) as fetcher:
+
+        async def client() -> None:
+            for i in fund_codes:
+                start = time.perf_counter()
+                await fetcher.GET_text(f"{base_url}/js/{i:06}.js", fund_code=f"{i:06}")
+                latencies.append(time.perf_counter() - start)
+
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+
+    return latencies, fetcher
+
+
+def percentile(latencies: list[float], p: float) -> float:
+    latencies = sorted(latencies)
+    return latencies[min(int(p / 100 * len(latencies)), len(latencies) - 1)]
+
+
+@click.command()
+@click.option("-n", "--requests", "n", default=2000, show_default=True)
+@click.option("-c", "--concurrency", default=20, show_default=True)
+@click.option("--stall-rate", default=0.02, show_default=True)
+@click.option("--stall", default=1.0, show_default=True)
+@click.option("-p", "--hedge-percentile", default=95.0, show_default=True)
+@click.option("-b", "--hedge-budget", default=0.05, show_default=True)
+def main(
+    n: int,
+    concurrency: int,
+    stall_rate: float,
+    stall: float,
+    hedge_percentile: float,
+    hedge_budget: float,
+) -> None:
+
+    base_url = start_server(stall_rate, stall)
+
+    configs = {
+        "plain": SessionConfig(warm_up_connections=0, rate_limit_per_host=0),
+        "hedged": SessionConfig(
+            warm_up_connections=0,
+            rate_limit_per_host=0,
+            hedge_percentile=hedge_percentile,
+            hedge_budget=hedge_budget,
+        ),
+    }
+
+    print(f"{'':<8} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8} {'hedges':>8}")
+
+    for name, session_config in configs.items():
+        latencies, fetcher = asyncio.run(
+            send_requests(base_url, n, concurrency, session_config)
+        )
+        print(
+            f"{name:<8}"
+            + "".join(
+                f" {percentile(latencies, p) * 1000:6.0f}ms" for p in (50, 95, 99, 100)
+            )
+            + f" {fetcher.stats.hedges:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()  # pylint: disable=no-value-for-parameter
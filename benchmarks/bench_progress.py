@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+
+"""
+Compare the overhead of progress reporting by `quickfund.utils.progress` with that of
+the tqdm path it replaced, on the two hot spots: enumerating rows written to Excel
+document, and gathering many cheap coroutines, e.g., cache hits.
+
+Progress is rendered to the null device as progress bars, so that terminal rendering
+speed doesn't skew the comparison.
+
+Usage: python benchmarks/bench_progress.py [-n ROWS] [-c COROUTINES] [-r REPEAT]
+"""
+
+import asyncio
+import os
+import sys
+import timeit
+from collections.abc import Callable
+from contextlib import redirect_stderr
+from pathlib import Path
+
+import click
+from tqdm.asyncio import tqdm_asyncio
+from tqdm.contrib import tenumerate
+
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from quickfund.utils.progress import penumerate, pgather, set_progress_mode
+
+
+def enumerate_baseline(n: int) -> None:
+    for _ in enumerate(range(n)):
+        pass
+
+
+def enumerate_tqdm(n: int) -> None:
+    for _ in tenumerate(range(n)):
+        pass
+
+
+def enumerate_progress(n: int) -> None:
+    for _ in penumerate(range(n)):
+        pass
+
+
+async def cache_hit() -> None:
+    pass
+
+
+def gather_baseline(n: int) -> None:
+    async def main() -> None:
+        await asyncio.gather(*(cache_hit() for _ in range(n)))
+
+    asyncio.run(main())
+
+
+def gather_tqdm(n: int) -> None:
+    async def main() -> None:
+        await tqdm_asyncio.gather(*(cache_hit() for _ in range(n)))
+
+    asyncio.run(main())
+
+
+def gather_progress(n: int) -> None:
+    async def main() -> None:
+        await pgather(*(cache_hit() for _ in range(n)))
+
+    asyncio.run(main())
+
+
+def measure(func: Callable[[int], None], n: int, repeat: int) -> float:
+    """Return the best time, in seconds, of the runs"""
+    return min(timeit.repeat(lambda: func(n), number=1, repeat=repeat))
+
+
+def report(title: str, n: int, repeat: int, *cases: Callable[[int], None]) -> None:
+    print(f"{title} (n={n}):")
+
+    baseline = measure(cases[0], n, repeat)
+    print(f"  {cases[0].__name__:<20} {baseline * 1000:8.1f} ms")
+
+    for case in cases[1:]:
+        elapsed = measure(case, n, repeat)
+        overhead = (elapsed - baseline) / n * 1e9
+        print(
+            f"  {case.__name__:<20} {elapsed * 1000:8.1f} ms"
+            f"  overhead {overhead:7.1f} ns per item"
+        )
+
+
+@click.command()
+@click.option("-n", "--rows", default=100_000, show_default=True)
+@click.option("-c", "--coroutines", default=10_000, show_default=True)
+@click.option("-r", "--repeat", default=5, show_default=True)
+def main(rows: int, coroutines: int, repeat: int) -> None:
+
+    set_progress_mode("bar")
+
+    with open(os.devnull, "w", encoding="utf-8") as devnull, redirect_stderr(devnull):
+        run_benchmarks(rows, coroutines, repeat)
+
+
+def run_benchmarks(rows: int, coroutines: int, repeat: int) -> None:
+    report(
+        "Enumerate",
+        rows,
+        repeat,
+        enumerate_baseline,
+        enumerate_tqdm,
+        enumerate_progress,
+    )
+    report(
+        "Gather",
+        coroutines,
+        repeat,
+        gather_baseline,
+        gather_tqdm,
+        gather_progress,
+    )
+
+
+if __name__ == "__main__":
+    main()  # pylint: disable=no-value-for-parameter
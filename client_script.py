@@ -1,50 +1,66 @@
 #!/usr/bin/env python3
 
-import asyncio
-import atexit
-import functools
+"""
+The launcher of QuickFund, distributed to users as a standalone script.
+
+Only the cost of `cli_entry` is on the hot path of launching. Updates are checked in a
+detached background process, which downloads the latest QuickFund and its
+dependencies as wheels into a local wheel cache. The next launch then installs them
+from the wheel cache, offline, before importing QuickFund.
+"""
+
+import json
+import os
+import re
+import shutil
 import subprocess
 import sys
-from collections.abc import Callable, Iterator, Sequence
-from concurrent.futures import ProcessPoolExecutor
-from datetime import datetime
+import time
+from importlib.metadata import PackageNotFoundError, version
+from importlib.util import find_spec
+from pathlib import Path
 from subprocess import CalledProcessError, TimeoutExpired
-from typing import TYPE_CHECKING, TypeVar
+from typing import Optional
 
 
-try:
-    from tqdm import trange
-except ModuleNotFoundError:
+INSTALL_TIMEOUT = 60  # seconds
+APPLY_UPDATE_TIMEOUT = 60  # seconds
 
-    def trange_shim(n: int) -> Iterator[int]:
-        for i in range(n):
-            yield i
-            # TODO
-            raise NotImplementedError
+UPDATE_PERIOD = 5  # days
+UPDATE_TIMEOUT = 300  # seconds
 
-    trange = trange_shim
+# The command line flag to run the launcher as the background update checker
+CHECK_UPDATE_FLAG = "--check-update"
 
-if TYPE_CHECKING:
-    from typing_extensions import ParamSpec
-else:
-    try:
-        from typing_extensions import ParamSpec
-    except ModuleNotFoundError:
-        ParamSpec = TypeVar
 
+def launcher_dir() -> Path:
+    if os.name == "nt":
+        base = Path(os.environ.get("LOCALAPPDATA", Path.home() / "AppData" / "Local"))
+        return base / "MapleCCC" / "QuickFund" / "Launcher"
 
-P = ParamSpec("P")
-R = TypeVar("R")
+    base = Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache"))
+    return base / "QuickFund" / "launcher"
 
 
-INSTALL_TIMEOUT = 60  # seconds
+LAUNCHER_DIR = launcher_dir()
 
-UPDATE_PERIOD = 5  # days
-UPDATE_TIMEOUT = 20  # seconds
+# The local wheel cache, which serves as the package index when applying update
+WHEEL_DIR = LAUNCHER_DIR / "wheels"
+
+# Written by the update checker when a newer version is ready in the wheel cache
+PENDING_UPDATE_PATH = LAUNCHER_DIR / "pending-update.json"
+
+# Touched by the update checker on success
+LAST_CHECK_PATH = LAUNCHER_DIR / "last-check"
 
+# Held by the running update checker, to avoid concurrent checks
+CHECK_LOCK_PATH = LAUNCHER_DIR / "check.lock"
 
-INSTALL_COMMAND = UPDATE_COMMAND = [
-    "pip",
+
+PIP_COMMAND = [sys.executable, "-m", "pip", "--disable-pip-version-check"]
+
+INSTALL_COMMAND = [
+    *PIP_COMMAND,
     "install",
     "--compile",
     "--upgrade-strategy",
@@ -53,48 +69,64 @@ INSTALL_COMMAND = UPDATE_COMMAND = [
     "quickfund",
 ]
 
+DOWNLOAD_COMMAND = [
+    *PIP_COMMAND,
+    "download",
+    "--only-binary",
+    ":all:",
+    "--dest",
+    str(WHEEL_DIR),
+    "quickfund",
+]
+
 
-process_pool_executor = ProcessPoolExecutor()
-atexit.register(process_pool_executor.shutdown)
+def apply_update_command(new_version: str) -> list[str]:
+    return [
+        *PIP_COMMAND,
+        "install",
+        "--compile",
+        "--no-index",
+        "--find-links",
+        str(WHEEL_DIR),
+        "--upgrade-strategy",
+        "eager",
+        "--upgrade",
+        f"quickfund=={new_version}",
+    ]
 
 
-async def asyncio_to_process(
-    func: Callable[P, R], /, *args: P.args, **kwargs: P.kwargs
-) -> R:
+def quickfund_wheels() -> list[Path]:
     """
-    Asynchronously run function `func` in a separate process.
-    Process version of the stdlib `asyncio.to_thread()`.
+    Return the wheels of QuickFund in the wheel cache. Wheel filenames keep the case of
+    the project name, i.e., "QuickFund-x.y.z-...", so they are matched
+    case-insensitively.
     """
 
-    loop = asyncio.get_running_loop()
-    pfunc = functools.partial(func, *args, **kwargs)
-
-    return await loop.run_in_executor(process_pool_executor, pfunc)
-
-
-def run_command_with_timeout_bar(command: Sequence[str], timeout: int) -> None:
-    """Run command as subprocess, while displaying progressbar showing elapse of timeout count"""
+    try:
+        return [
+            path
+            for path in WHEEL_DIR.iterdir()
+            if path.name.lower().startswith("quickfund-") and path.suffix == ".whl"
+        ]
+    except OSError:
+        return []
 
-    async def async_run_command(command: Sequence[str]) -> None:
-        await asyncio_to_process(subprocess.check_call, command)
 
-    async def display_timeout_bar(timeout: int) -> None:
-        for second in trange(timeout):
-            await asyncio.sleep(1)
+def installed_version() -> Optional[str]:
+    try:
+        return version("quickfund")
+    except PackageNotFoundError:
+        return None
 
-    async def main() -> None:
-        asyncio.gather(async_run_command(command), display_timeout_bar(timeout))
 
-    asyncio.run(main())
+def version_key(version_str: str) -> tuple[int, ...]:
+    """A crude ordering of release versions, enough for the versions of QuickFund"""
+    return tuple(int(part) for part in re.findall(r"\d+", version_str))
 
 
 def is_quickfund_installed() -> bool:
-    try:
-        import quickfund  # type: ignore
-    except ModuleNotFoundError:
-        return False
-    else:
-        return True
+    # Don't import the package, which is costly
+    return find_spec("quickfund") is not None
 
 
 def install_quickfund() -> None:
@@ -102,83 +134,150 @@ def install_quickfund() -> None:
     print("安装 QuickFund 库（这个过程大概执行十至六十秒）......")
 
     try:
-        run_command_with_timeout_bar(UPDATE_COMMAND, INSTALL_TIMEOUT)
+        subprocess.run(INSTALL_COMMAND, check=True, timeout=INSTALL_TIMEOUT)
 
     except (CalledProcessError, TimeoutExpired):
         raise RuntimeError("安装 QuickFund 库失败，请重试")
 
     else:
-        from quickfund import __version__
-
-        print(f"成功安装 QuickFund 库最新版本 {__version__}")
-
+        print(f"成功安装 QuickFund 库最新版本 {installed_version()}")
 
-def should_update() -> bool:
-    return datetime.now().toordinal() % UPDATE_PERIOD == 0
 
+def apply_pending_update() -> None:
+    """Install the update downloaded by the last update check, if any, offline"""
 
-def invalidate_import_cache(module_name: str) -> None:
+    try:
+        pending_update = json.loads(PENDING_UPDATE_PATH.read_text(encoding="utf-8"))
+        new_version = pending_update["version"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return
 
-    if module_name not in sys.modules:
+    if new_version == installed_version():
+        PENDING_UPDATE_PATH.unlink(missing_ok=True)
         return
 
-    del sys.modules[module_name]
+    print(f"安装已下载的更新 {new_version}......")
+
+    try:
+        subprocess.run(
+            apply_update_command(new_version),
+            check=True,
+            timeout=APPLY_UPDATE_TIMEOUT,
+            stdout=subprocess.DEVNULL,
+        )
 
-    # Handle alias
-    module = sys.modules[module_name]
-    if module.__name__ != module_name:
-        del sys.modules[module.__name__]
+    except (CalledProcessError, TimeoutExpired):
+        # The wheel cache may be corrupted. Discard it, and download afresh.
+        print("更新失败，下次检查更新时将重新下载")
+        PENDING_UPDATE_PATH.unlink(missing_ok=True)
+        shutil.rmtree(WHEEL_DIR, ignore_errors=True)
 
-    # Handle submodules
-    submodules = []
-    for mod in sys.modules.keys():
-        if mod.startswith(module_name + "."):
-            submodules.append(mod)
-    for mod in submodules:
-        del sys.modules[mod]
+    else:
+        print(f"更新完毕：QuickFund 库已更新至最新版本 {new_version}")
+        PENDING_UPDATE_PATH.unlink(missing_ok=True)
+        # The wheels of dependencies are kept, so that the next download is smaller
+        for wheel in quickfund_wheels():
+            wheel.unlink(missing_ok=True)
 
-    # Handle ascendants
-    ascendants = []
-    for mod in sys.modules.keys():
-        if module_name.startswith(mod + "."):
-            ascendants.append(mod)
-    for mod in ascendants:
-        del sys.modules[mod]
 
+def should_check_update() -> bool:
+    try:
+        last_check = LAST_CHECK_PATH.stat().st_mtime
+    except OSError:
+        return True
+    return time.time() - last_check >= UPDATE_PERIOD * 24 * 60 * 60
 
-def update_quickfund() -> None:
 
-    if not should_update():
-        return
+def spawn_update_check() -> None:
+    """Check update in a detached background process, which outlives the launcher"""
 
-    print("检查更新（这个过程大概执行十至二十秒）......")
+    command = [sys.executable, os.path.abspath(__file__), CHECK_UPDATE_FLAG]
+    kwargs: dict = dict(
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        close_fds=True,
+    )
 
-    from quickfund import __version__ as old_version
+    if os.name == "nt":
+        kwargs["creationflags"] = (
+            subprocess.DETACHED_PROCESS  # type: ignore
+            | subprocess.CREATE_NEW_PROCESS_GROUP  # type: ignore
+        )
+    else:
+        kwargs["start_new_session"] = True
 
     try:
-        run_command_with_timeout_bar(UPDATE_COMMAND, UPDATE_TIMEOUT)
+        subprocess.Popen(command, **kwargs)
+    except OSError:
+        # Failing to check update is no reason to fail the launch
+        pass
 
-    except (CalledProcessError, TimeoutExpired):
-        print("更新失败，下次运行时将再次尝试更新")
 
+def acquire_check_lock() -> bool:
+
+    try:
+        # A lock older than the timeout is left by a crashed check
+        if time.time() - CHECK_LOCK_PATH.stat().st_mtime > UPDATE_TIMEOUT * 2:
+            CHECK_LOCK_PATH.unlink(missing_ok=True)
+    except OSError:
+        pass
+
+    try:
+        os.close(os.open(CHECK_LOCK_PATH, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        return False
     else:
+        return True
+
 
-        invalidate_import_cache("quickfund")
+def check_update() -> None:
+    """
+    Download the latest QuickFund and its dependencies into the wheel cache, and mark
+    the update as pending if it's newer than the installed version.
+    """
 
-        from quickfund import __version__ as new_version
+    LAUNCHER_DIR.mkdir(parents=True, exist_ok=True)
 
-        if new_version == old_version:
-            print("当前已是最新版本")
-        else:
-            print(f"更新完毕：QuickFund 库已更新至最新版本 {new_version}")
+    if not acquire_check_lock():
+        return
+
+    try:
+        subprocess.run(DOWNLOAD_COMMAND, check=True, timeout=UPDATE_TIMEOUT)
+
+        wheel_versions = [wheel.name.split("-")[1] for wheel in quickfund_wheels()]
+        current_version = installed_version()
+        if wheel_versions and current_version is not None:
+            latest_version = max(wheel_versions, key=version_key)
+            if version_key(latest_version) > version_key(current_version):
+                tmp_path = PENDING_UPDATE_PATH.with_suffix(".tmp")
+                tmp_path.write_text(
+                    json.dumps({"version": latest_version}), encoding="utf-8"
+                )
+                os.replace(tmp_path, PENDING_UPDATE_PATH)
+
+        LAST_CHECK_PATH.touch()
+
+    except (CalledProcessError, TimeoutExpired, OSError):
+        # Retry on the next launch
+        pass
+
+    finally:
+        CHECK_LOCK_PATH.unlink(missing_ok=True)
 
 
 def main() -> None:
 
+    if sys.argv[1:] == [CHECK_UPDATE_FLAG]:
+        check_update()
+        return
+
     if not is_quickfund_installed():
         install_quickfund()
     else:
-        update_quickfund()
+        apply_pending_update()
+        if should_check_update():
+            spawn_update_check()
 
     from quickfund import cli_entry
 
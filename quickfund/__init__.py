@@ -1,5 +1,16 @@
 from .__version__ import __version__, __version_info__
+from .backends import open_backend
 from .cli import cli_entry
+from .fetcher import FundInfoFetcher
+from .getter import get_fund_infos, stream_fund_infos
 
 
-__all__ = ["cli_entry", "__version__", "__version_info__"]
+__all__ = [
+    "cli_entry",
+    "stream_fund_infos",
+    "get_fund_infos",
+    "FundInfoFetcher",
+    "open_backend",
+    "__version__",
+    "__version_info__",
+]
@@ -0,0 +1,354 @@
+from __future__ import annotations
+
+from collections.abc import Iterable, Mapping
+from datetime import date, datetime
+from pathlib import Path
+from types import TracebackType
+from typing import Optional, Protocol, TypeVar, Union
+from urllib.parse import urlsplit
+
+import attr
+from more_itertools import chunked
+
+from .cache import (
+    FUND_INFO_CACHE_DB_PATH,
+    VERSION_KEY,
+    CachePolicy,
+    import_legacy_cache,
+    load_entry,
+    maybe_compact_cache,
+    open_cache,
+    remove_obsolete_version_dirs,
+    touch,
+)
+from .codec import CODEC_VERSION, CodecError, decode_fund_info, encode_fund_info
+from .models import FundEstimateInfo, FundIARBCInfo, FundInfo, FundNetValueInfo
+from .utils.decoding import dumps, loads, parse_date, parse_datetime
+from .utils.misc import Logger
+from .utils.resp import Argument, RESPClient
+
+
+__all__ = [
+    "CacheBackend",
+    "Freshness",
+    "LocalBackend",
+    "NetworkBackend",
+    "NullBackend",
+    "open_backend",
+]
+
+
+T = TypeVar("T")
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class Freshness:
+    """
+    A dataclass to represent the freshness metadata of a cached fund info, i.e., the
+    dates of its sections.
+    """
+
+    净值日期: date
+    估算日期: datetime
+    同类排名截止日期: date
+
+    @classmethod
+    def of(cls, fund_info: FundInfo) -> Freshness:
+        return cls(fund_info.净值日期, fund_info.估算日期, fund_info.同类排名截止日期)
+
+    def to_json(self) -> str:
+        return dumps(attr.astuple(self)).decode()
+
+    @classmethod
+    def from_json(cls, s: Union[str, bytes]) -> Freshness:
+        net_value_date, estimate_datetime, IARBC_date = loads(s)
+        return cls(
+            parse_date(net_value_date),
+            parse_datetime(estimate_datetime),
+            parse_date(IARBC_date),
+        )
+
+    def is_anywhere_fresher_than(self, other: Freshness) -> bool:
+        """Check if any section is fresher than the other's"""
+        return any(a > b for a, b in zip(attr.astuple(self), attr.astuple(other)))
+
+
+def section_of(fund_info: FundInfo, section_type: type[T]) -> T:
+    """Extract a section, e.g., the net value info, from the fund info"""
+
+    fields = attr.fields(section_type)  # type: ignore
+    return section_type(
+        **{field.name: getattr(fund_info, field.name) for field in fields}
+    )
+
+
+def merge_fresher(stored: FundInfo, new: FundInfo) -> FundInfo:
+    """Merge two fund infos of the same fund, taking the fresher of each section"""
+
+    merged = attr.evolve(new)
+
+    if stored.净值日期 > new.净值日期:
+        merged.replace(net_value_info=section_of(stored, FundNetValueInfo))
+    if stored.估算日期 > new.估算日期:
+        merged.replace(estimate_info=section_of(stored, FundEstimateInfo))
+    if stored.同类排名截止日期 > new.同类排名截止日期:
+        merged.replace(IARBC_info=section_of(stored, FundIARBCInfo))
+
+    return merged
+
+
+class CacheBackend(Protocol):
+    """
+    The interface of fund info cache backends.
+
+    `put_many` never replaces a section of a cached fund info with a staler one, so
+    that concurrent writers sharing a backend don't roll back each other's updates.
+    """
+
+    def get_many(self, fund_codes: Iterable[str]) -> dict[str, FundInfo]:
+        """Return the cached fund infos of the fund codes, omitting absent ones"""
+        ...
+
+    def put_many(self, fund_infos: Mapping[str, FundInfo]) -> None:
+        ...
+
+    def freshness_many(self, fund_codes: Iterable[str]) -> dict[str, Freshness]:
+        """
+        Return the freshness metadata of the cached fund infos of the fund codes,
+        omitting absent ones. It's cheaper than `get_many`.
+        """
+        ...
+
+    def close(self) -> None:
+        ...
+
+    def __enter__(self: T) -> T:
+        ...
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] = None,
+        exc_value: BaseException = None,
+        traceback: TracebackType = None,
+    ) -> None:
+        ...
+
+
+class ClosingMixin:
+    def close(self) -> None:
+        pass
+
+    def __enter__(self: T) -> T:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] = None,
+        exc_value: BaseException = None,
+        traceback: TracebackType = None,
+    ) -> None:
+        self.close()  # type: ignore
+
+
+class NullBackend(ClosingMixin):
+    """A backend that caches nothing"""
+
+    def get_many(self, fund_codes: Iterable[str]) -> dict[str, FundInfo]:
+        return {}
+
+    def put_many(self, fund_infos: Mapping[str, FundInfo]) -> None:
+        pass
+
+    def freshness_many(self, fund_codes: Iterable[str]) -> dict[str, Freshness]:
+        return {}
+
+
+class LocalBackend(ClosingMixin):
+    """
+    A backend of a shelve database in the local cache directory.
+
+    Fund infos are stored encoded by the codec, which migrates entries of older codec
+    versions on decoding, so the cache survives version changes. Entries undecodable,
+    e.g., written by a newer version, are treated as absent.
+
+    On first opening, the fund infos pickled by versions before the codec are imported.
+    Cache directories left by other versions are removed on opening. The access times
+    of the entries accessed are recorded on closing, and then the cache is compacted
+    if it's grown beyond the size cap of the policy.
+    """
+
+    def __init__(
+        self, path: Path = FUND_INFO_CACHE_DB_PATH, policy: CachePolicy = CachePolicy()
+    ) -> None:
+        self._path = path
+        self._policy = policy
+        self._accessed: set[str] = set()
+        self._shelf = open_cache(path)
+
+        if path == FUND_INFO_CACHE_DB_PATH:
+            if VERSION_KEY not in self._shelf:
+                import_legacy_cache(self._shelf)
+            remove_obsolete_version_dirs()
+
+        self._shelf[VERSION_KEY] = CODEC_VERSION  # type: ignore # we don't trade simplicity of type annotation for a meta edgy case
+
+    __slots__ = ["_path", "_policy", "_accessed", "_shelf"]
+
+    def _load_many(self, fund_codes: Iterable[str]) -> dict[str, FundInfo]:
+        fund_infos = {}
+        for code in fund_codes:
+            fund_info = load_entry(self._shelf, code)
+            if fund_info is not None:
+                fund_infos[code] = fund_info
+        return fund_infos
+
+    def get_many(self, fund_codes: Iterable[str]) -> dict[str, FundInfo]:
+        fund_infos = self._load_many(fund_codes)
+        self._accessed.update(fund_infos)
+        return fund_infos
+
+    def put_many(self, fund_infos: Mapping[str, FundInfo]) -> None:
+        stored = self._load_many(fund_infos)
+
+        for fund_code, fund_info in fund_infos.items():
+            if fund_code in stored:
+                fund_info = merge_fresher(stored[fund_code], fund_info)
+            self._shelf[fund_code] = encode_fund_info(fund_info)
+
+        self._accessed.update(fund_infos)
+        self._shelf.sync()
+
+    def freshness_many(self, fund_codes: Iterable[str]) -> dict[str, Freshness]:
+        return {
+            code: Freshness.of(fund_info)
+            for code, fund_info in self._load_many(fund_codes).items()
+        }
+
+    def close(self) -> None:
+        touch(self._shelf, self._accessed)
+        self._shelf.close()
+
+        if self._path == FUND_INFO_CACHE_DB_PATH:
+            maybe_compact_cache(self._policy)
+
+
+class NetworkBackend(ClosingMixin):
+    """
+    A backend of a Redis-compatible key-value server, shared by multiple users, so that
+    one user's fetch warms everyone's cache.
+
+    Each fund info is stored in a hash with a `data` field of the fund info encoded by
+    the codec, and a `freshness` field of its freshness metadata. Keys are shared
+    across versions, since the codec migrates entries of older codec versions on
+    decoding. Entries undecodable, e.g., written by a newer version, are treated as
+    absent. Keys expire after being idle for `CachePolicy.max_idle`.
+
+    Merging with fresher sections on `put_many` is best-effort: a fresher section
+    written by another user in between the read and the write may be overwritten, in
+    which case it's refetched later.
+    """
+
+    # The number of commands sent per pipeline, to bound memory usage
+    PIPELINE_SIZE = 1000
+
+    def __init__(self, client: RESPClient, policy: CachePolicy = CachePolicy()) -> None:
+        self._client = client
+        self._namespace = "quickfund:fund-info:"
+        self._ttl = int(policy.max_idle.total_seconds())
+
+    __slots__ = ["_client", "_namespace", "_ttl"]
+
+    def _key(self, fund_code: str) -> str:
+        return self._namespace + fund_code
+
+    def _hget_many(self, fund_codes: list[str], field: str) -> dict[str, bytes]:
+        result = {}
+
+        for chunk in chunked(fund_codes, self.PIPELINE_SIZE):
+            commands = [("HGET", self._key(code), field) for code in chunk]
+            for code, reply in zip(chunk, self._client.pipeline(commands)):
+                if isinstance(reply, bytes):
+                    result[code] = reply
+
+        return result
+
+    def get_many(self, fund_codes: Iterable[str]) -> dict[str, FundInfo]:
+        data = self._hget_many(list(fund_codes), "data")
+
+        # Refresh the expiration of accessed entries
+        for chunk in chunked(data, self.PIPELINE_SIZE):
+            self._client.pipeline(
+                [("EXPIRE", self._key(code), self._ttl) for code in chunk]
+            )
+
+        fund_infos = {}
+        for code, value in data.items():
+            try:
+                fund_infos[code] = decode_fund_info(value)
+            except CodecError:
+                pass
+        return fund_infos
+
+    def freshness_many(self, fund_codes: Iterable[str]) -> dict[str, Freshness]:
+        metadata = self._hget_many(list(fund_codes), "freshness")
+        return {code: Freshness.from_json(value) for code, value in metadata.items()}
+
+    def put_many(self, fund_infos: Mapping[str, FundInfo]) -> None:
+
+        stored_freshness = self.freshness_many(fund_infos)
+        staler = [
+            code
+            for code, freshness in stored_freshness.items()
+            if freshness.is_anywhere_fresher_than(Freshness.of(fund_infos[code]))
+        ]
+        merged = {
+            code: merge_fresher(stored, fund_infos[code])
+            for code, stored in self.get_many(staler).items()
+        }
+
+        fund_infos = {**fund_infos, **merged}
+
+        for chunk in chunked(fund_infos.items(), self.PIPELINE_SIZE // 2):
+            commands: list[tuple[Argument, ...]] = []
+            for fund_code, fund_info in chunk:
+                key = self._key(fund_code)
+                data = encode_fund_info(fund_info)
+                freshness = Freshness.of(fund_info).to_json()
+                commands.append(("HSET", key, "data", data, "freshness", freshness))
+                commands.append(("EXPIRE", key, self._ttl))
+            self._client.pipeline(commands)
+
+    def close(self) -> None:
+        self._client.close()
+
+
+def open_backend(
+    url: Optional[str] = None,
+    policy: CachePolicy = CachePolicy(),
+    logger: Logger = Logger.null_logger(),
+) -> CacheBackend:
+    """
+    Open the cache backend at the URL. The local backend is opened if no URL is given.
+    A URL of form `redis://[[username]:password@]host[:port][/db]` opens the network
+    backend. Entries are evicted according to the policy.
+
+    If the server of the network backend is unreachable, the local backend is opened
+    instead, so that the run goes on, only without sharing.
+    """
+
+    if not url:
+        return LocalBackend(policy=policy)
+
+    scheme = urlsplit(url).scheme
+
+    if scheme != "redis":
+        raise ValueError(f"不支持的缓存地址：{url}")
+
+    try:
+        client = RESPClient.from_url(url)
+    except OSError:
+        host = urlsplit(url).hostname
+        logger.log(f"无法连接到共享缓存服务器 {host}，改用本地缓存")
+        return LocalBackend(policy=policy)
+
+    return NetworkBackend(client, policy)
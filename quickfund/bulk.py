@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Iterable, Mapping, Sequence
+from datetime import date, timedelta
+from typing import Optional
+
+import attr
+
+from .fetcher import FundInfoFetcher
+from .models import FundIARBCInfo, FundNetValueInfo
+from .utils.decoding import parse_date
+
+
+__all__ = ["BulkIndex", "fetch_bulk_index"]
+
+
+# Eastmoney's fund types of the rank lists, the more specific ones first, since a fund
+# may be listed under more than one type, e.g., an index fund is also a stock fund.
+FUND_TYPES = ["zs", "qdii", "fof", "gp", "hh", "zq"]
+
+# The leading columns of the records of the rank lists. The rest are not used.
+RANK_LIST_COLUMNS = [
+    "基金代码",
+    "基金简称",
+    "拼音",
+    "净值日期",
+    "单位净值",
+    "累计净值",
+    "日增长率",
+    "近1周",
+    "近1月",
+    "近3月",
+    "近6月",
+    "近1年",
+    "近2年",
+    "近3年",
+    "今年来",
+]
+
+# Map from the return columns of the rank lists to the IARBC fields ranking them
+RANK_FIELDS = {
+    "近1周": "近1周同类排名",
+    "近1月": "近1月同类排名",
+    "近3月": "近3月同类排名",
+    "近6月": "近6月同类排名",
+    "今年来": "今年来同类排名",
+    "近1年": "近1年同类排名",
+    "近2年": "近2年同类排名",
+    "近3年": "近3年同类排名",
+}
+
+
+def previous_weekday(_date: date) -> date:
+    _date -= timedelta(days=1)
+    while _date.weekday() >= 5:
+        _date -= timedelta(days=1)
+    return _date
+
+
+def net_value_info_of(record: Mapping[str, str]) -> Optional[FundNetValueInfo]:
+    """
+    Derive the net value info from a record of the rank lists, or None if the record
+    lacks the net value or the daily growth rate.
+
+    The rank lists don't carry the previous net value, so it's derived from the daily
+    growth rate, which is off on dividend days. The previous net value date is assumed
+    to be the previous weekday, which is off after holidays.
+    """
+
+    if not record["单位净值"] or not record["日增长率"]:
+        return None
+
+    net_value_date = parse_date(record["净值日期"])
+    net_value = float(record["单位净值"])
+    growth_rate = float(record["日增长率"]) * 0.01
+
+    return FundNetValueInfo(
+        净值日期=net_value_date,
+        单位净值=net_value,
+        日增长率=growth_rate,
+        分红送配="",
+        上一天净值=round(net_value / (1 + growth_rate), 4),
+        上一天净值日期=previous_weekday(net_value_date),
+    )  # type: ignore # FIXME https://github.com/python-attrs/attrs/issues/795
+
+
+def IARBC_infos_of(records: Sequence[Mapping[str, str]]) -> dict[str, FundIARBCInfo]:
+    """
+    Derive the IARBC infos of the funds of the same type, by ranking their returns in
+    each period. Funds without return in a period, e.g., too young, are not ranked.
+    """
+
+    ranks = {
+        record["基金代码"]: dict.fromkeys(RANK_FIELDS.values(), "") for record in records
+    }
+
+    for column, field in RANK_FIELDS.items():
+        returns = sorted(
+            (
+                (float(record[column]), record["基金代码"])
+                for record in records
+                if record[column]
+            ),
+            reverse=True,
+        )
+        for rank, (_, fund_code) in enumerate(returns, start=1):
+            ranks[fund_code][field] = f"{rank}/{len(returns)}"
+
+    return {
+        record["基金代码"]: FundIARBCInfo(
+            同类排名截止日期=parse_date(record["净值日期"]),
+            **ranks[record["基金代码"]],
+        )  # type: ignore # FIXME https://github.com/python-attrs/attrs/issues/795
+        for record in records
+    }
+
+
+@attr.s(auto_attribs=True)
+class BulkIndex:
+    """
+    An in-memory index of net value infos and IARBC infos by fund code, built from the
+    rank lists of Eastmoney, which cover hundreds of funds per page.
+
+    The infos are approximate. Notably, the IARBC ranks are ranked within Eastmoney's
+    broad fund types, rather than the finer categories that fund pages rank within.
+    Their cutoff date is approximated by the net value date of the records, i.e., the
+    last trading day, so they are never the latest, and may be older than the IARBC
+    infos fetched from fund pages. See also `net_value_info_of()`.
+    """
+
+    net_value_infos: dict[str, FundNetValueInfo] = attr.ib(factory=dict)
+    IARBC_infos: dict[str, FundIARBCInfo] = attr.ib(factory=dict)
+
+    def __len__(self) -> int:
+        return len(self.IARBC_infos)
+
+    @classmethod
+    def build(cls, rank_lists: Mapping[str, list[list[str]]]) -> BulkIndex:
+        """Build the index from the rank lists of fund types, in order of precedence"""
+
+        index = cls()
+
+        for fund_type in FUND_TYPES:
+            records = [
+                dict(zip(RANK_LIST_COLUMNS, values))
+                for values in rank_lists.get(fund_type, [])
+                if len(values) >= len(RANK_LIST_COLUMNS)
+            ]
+            records = [record for record in records if record["净值日期"]]
+
+            # Funds are ranked within the whole list of the type, including those
+            # indexed under a type of higher precedence
+            IARBC_infos = IARBC_infos_of(records)
+
+            for record in records:
+                fund_code = record["基金代码"]
+                if fund_code in index.IARBC_infos:
+                    continue
+
+                index.IARBC_infos[fund_code] = IARBC_infos[fund_code]
+
+                net_value_info = net_value_info_of(record)
+                if net_value_info is not None:
+                    index.net_value_infos[fund_code] = net_value_info
+
+        return index
+
+    def subset(self, fund_codes: Iterable[str]) -> BulkIndex:
+        fund_codes = set(fund_codes)
+        return BulkIndex(
+            {k: v for k, v in self.net_value_infos.items() if k in fund_codes},
+            {k: v for k, v in self.IARBC_infos.items() if k in fund_codes},
+        )
+
+    def net_value_info(self, fund_code: str) -> Optional[FundNetValueInfo]:
+        return self.net_value_infos.get(fund_code)
+
+    def IARBC_info(self, fund_code: str) -> Optional[FundIARBCInfo]:
+        return self.IARBC_infos.get(fund_code)
+
+
+async def fetch_bulk_index(fund_info_fetcher: FundInfoFetcher) -> BulkIndex:
+    """
+    Fetch the rank lists of all fund types, and build the index from them. Fund types
+    whose rank lists fail to be fetched are left out of the index, so that their funds
+    fall back to be fetched one by one.
+    """
+
+    results = await asyncio.gather(
+        *map(fund_info_fetcher.fetch_rank_list, FUND_TYPES), return_exceptions=True
+    )
+
+    rank_lists: dict[str, list[list[str]]] = {
+        fund_type: result
+        for fund_type, result in zip(FUND_TYPES, results)
+        if not isinstance(result, BaseException)
+    }
+
+    return BulkIndex.build(rank_lists)
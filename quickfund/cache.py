@@ -0,0 +1,391 @@
+from __future__ import annotations
+
+import pickle
+import re
+import shelve
+import shutil
+import time
+from collections.abc import Iterable
+from datetime import date, timedelta
+from pathlib import Path
+from shelve import Shelf
+from typing import Optional, cast
+
+import attr
+from platformdirs import user_cache_dir
+
+from .__version__ import __version__
+from .codec import CodecError, decode_fund_info, encode_fund_info
+from .models import FundInfo
+from .utils.datetime import china_now
+
+
+__all__ = [
+    "PERSISTENT_CACHE_DIR",
+    "JOURNAL_DIR",
+    "CachePolicy",
+    "CacheStats",
+    "open_cache",
+    "load_entry",
+    "import_legacy_cache",
+    "touch",
+    "cache_stats",
+    "compact_cache",
+    "maybe_compact_cache",
+    "purge_cache",
+    "remove_obsolete_version_dirs",
+]
+
+
+PERSISTENT_CACHE_DIR = Path(
+    user_cache_dir(appname="QuickFund", appauthor="MapleCCC", version=__version__)
+)
+PERSISTENT_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+
+# Each version has its own cache directory under this directory
+VERSIONS_DIR = PERSISTENT_CACHE_DIR.parent
+
+# Fund infos are encoded by the codec, which migrates entries of older versions, so
+# unlike the rest, they are not stored in the versioned cache directory, which is
+# abandoned on version change.
+FUND_INFO_CACHE_DIR = VERSIONS_DIR / "fund-infos"
+FUND_INFO_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+
+FUND_INFO_CACHE_DB_PATH = FUND_INFO_CACHE_DIR / "fund-infos"
+
+# Neither are the journals, so that a run interrupted before a version change can be
+# resumed after it
+JOURNAL_DIR = VERSIONS_DIR / "journals"
+
+# The database where versions before the codec stored pickled fund infos, in their
+# versioned cache directories
+LEGACY_DB_NAME = "fund-infos"
+
+SHELVE_CONFIG = {"protocol": pickle.HIGHEST_PROTOCOL, "writeback": True}
+
+# Keys of the cache database that are not fund codes
+VERSION_KEY = "version"  # The codec version that the database was created with
+ACCESS_TIMES_KEY = "access-times"
+RESERVED_KEYS = frozenset({VERSION_KEY, ACCESS_TIMES_KEY})
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class CachePolicy:
+    """
+    A dataclass to represent the eviction policy of the fund info cache.
+
+    An entry is evicted if it hasn't been accessed for `max_idle`, or if all its
+    sections are older than their respective TTLs, in which case nothing in it is
+    worth keeping. Then if the cache is still larger than `max_size` bytes, the least
+    recently used entries are evicted until it fits.
+    """
+
+    max_idle: timedelta = timedelta(days=90)
+    net_value_ttl: timedelta = timedelta(days=30)
+    estimate_ttl: timedelta = timedelta(days=7)
+    IARBC_ttl: timedelta = timedelta(days=30)
+    max_size: int = 64 * 1024 * 1024
+
+    def is_expired(self, fund_info: FundInfo, idle: float, today: date) -> bool:
+        """
+        `idle` is the time, in seconds, since the entry was last accessed. `today` is
+        the date of China timezone.
+        """
+
+        if idle > self.max_idle.total_seconds():
+            return True
+
+        return (
+            today - fund_info.净值日期 > self.net_value_ttl
+            and today - fund_info.估算日期.date() > self.estimate_ttl
+            and today - fund_info.同类排名截止日期 > self.IARBC_ttl
+        )
+
+
+@attr.s(auto_attribs=True)
+class CacheStats:
+    """
+    A dataclass to represent the statistics of the fund info cache.
+    """
+
+    entries: int
+    expired_entries: int
+    size: int
+    journals: int
+    obsolete_versions: int
+    obsolete_versions_size: int
+
+    def summary(self) -> str:
+        return (
+            f"缓存目录：{FUND_INFO_CACHE_DIR}\n"
+            f"缓存条目 {self.entries} 个（其中过期 {self.expired_entries} 个），"
+            f"占用 {self.size / 1024 / 1024:.1f} MB\n"
+            f"未完成的运行日志 {self.journals} 个\n"
+            f"旧版本缓存目录 {self.obsolete_versions} 个，"
+            f"占用 {self.obsolete_versions_size / 1024 / 1024:.1f} MB"
+        )
+
+
+def open_cache(path: Path = FUND_INFO_CACHE_DB_PATH) -> Shelf[bytes]:
+    return cast(Shelf[bytes], shelve.open(str(path), **SHELVE_CONFIG))
+
+
+def load_entry(fund_info_db: Shelf[bytes], fund_code: str) -> Optional[FundInfo]:
+    """
+    Load the fund info of the fund code from the cache database, or None if it's
+    absent, or undecodable, e.g., written by a newer version.
+    """
+
+    data = fund_info_db.get(fund_code)
+
+    if data is None:
+        return None
+
+    try:
+        return decode_fund_info(data)
+    except CodecError:
+        return None
+
+
+def import_legacy_cache(fund_info_db: Shelf[bytes]) -> int:
+    """
+    Import the fund infos pickled by versions before the codec, from the most recently
+    modified versioned cache directory, so that upgrading doesn't cost a cold cache.
+    Entries that fail to unpickle, e.g., of a stale class layout, are skipped. Return
+    the number of entries imported.
+    """
+
+    legacy_dbs = [
+        path / LEGACY_DB_NAME
+        for path in [*obsolete_version_dirs(), PERSISTENT_CACHE_DIR]
+        if cache_files(path / LEGACY_DB_NAME)
+    ]
+
+    if not legacy_dbs:
+        return 0
+
+    legacy_db_path = max(
+        legacy_dbs,
+        key=lambda path: max(p.stat().st_mtime for p in cache_files(path)),
+    )
+
+    count = 0
+
+    try:
+        with shelve.open(str(legacy_db_path), flag="r") as legacy_db:
+            for key in legacy_db.keys():
+                if key in RESERVED_KEYS or key in fund_info_db:
+                    continue
+                try:
+                    fund_info = legacy_db[key]
+                except Exception:
+                    continue
+                if isinstance(fund_info, FundInfo):
+                    fund_info_db[key] = encode_fund_info(fund_info)
+                    count += 1
+    except Exception:
+        # The legacy database is a best-effort source. It may be of a dbm backend
+        # unavailable here, or corrupted.
+        pass
+
+    # Legacy databases in obsolete version directories are removed along with them
+    for path in cache_files(PERSISTENT_CACHE_DIR / LEGACY_DB_NAME):
+        path.unlink()
+
+    return count
+
+
+def cache_files(path: Path = FUND_INFO_CACHE_DB_PATH) -> list[Path]:
+    """
+    Return the files of the cache database. The dbm backend chosen by shelve decides
+    the suffixes of the files.
+    """
+    return [p for p in path.parent.glob(path.name + "*") if p.is_file()]
+
+
+def disk_usage(paths: Iterable[Path]) -> int:
+    """Return the total size of the files and directories, in bytes"""
+
+    size = 0
+
+    for path in paths:
+        if path.is_dir():
+            size += disk_usage(path.iterdir())
+        elif path.is_file():
+            size += path.stat().st_size
+
+    return size
+
+
+def fund_codes_in(fund_info_db: Shelf[bytes]) -> list[str]:
+    return [key for key in fund_info_db.keys() if key not in RESERVED_KEYS]
+
+
+def touch(fund_info_db: Shelf[bytes], fund_codes: Iterable[str]) -> None:
+    """
+    Record the access time of the fund codes, for LRU eviction. The access times are
+    stored together, so it costs as much as rewriting all of them, and is better done
+    once for all the fund codes accessed in a session.
+    """
+
+    db = cast("Shelf[dict[str, float]]", fund_info_db)
+
+    now = time.time()
+    access_times = db.get(ACCESS_TIMES_KEY, {})
+    access_times.update(dict.fromkeys(fund_codes, now))
+    # Assign back, in case that the shelf doesn't write back mutated entries
+    db[ACCESS_TIMES_KEY] = access_times
+
+
+def idle_times_of(fund_info_db: Shelf[bytes]) -> dict[str, float]:
+    """
+    Return the map from fund codes to the time, in seconds, since they were last
+    accessed. Entries without access record, e.g. those cached before access tracking
+    existed, are considered just accessed.
+    """
+
+    now = time.time()
+    access_times = cast(dict, fund_info_db.get(ACCESS_TIMES_KEY, {}))
+    return {
+        code: now - access_times.get(code, now) for code in fund_codes_in(fund_info_db)
+    }
+
+
+def obsolete_version_dirs() -> list[Path]:
+    """Return the cache directories left by other versions"""
+
+    return [
+        path
+        for path in VERSIONS_DIR.iterdir()
+        if path.is_dir()
+        and path != PERSISTENT_CACHE_DIR
+        and re.fullmatch(r"v?\d+(\.\d+)*", path.name)
+    ]
+
+
+def remove_obsolete_version_dirs() -> int:
+    """Remove the cache directories left by other versions. Return the bytes freed."""
+
+    size = 0
+
+    for path in obsolete_version_dirs():
+        size += disk_usage([path])
+        shutil.rmtree(path, ignore_errors=True)
+
+    return size
+
+
+def is_evictable(
+    fund_info_db: Shelf[bytes],
+    fund_code: str,
+    idle: float,
+    today: date,
+    policy: CachePolicy,
+) -> bool:
+    """
+    Check if the entry is expired according to the policy, or undecodable, e.g.,
+    written by a newer version
+    """
+
+    fund_info = load_entry(fund_info_db, fund_code)
+    return fund_info is None or policy.is_expired(fund_info, idle, today)
+
+
+def cache_stats(policy: CachePolicy = CachePolicy()) -> CacheStats:
+
+    today = china_now().date()
+
+    with open_cache() as fund_info_db:
+        idle_times = idle_times_of(fund_info_db)
+        expired = sum(
+            is_evictable(fund_info_db, code, idle, today, policy)
+            for code, idle in idle_times.items()
+        )
+
+    obsolete_dirs = obsolete_version_dirs()
+
+    return CacheStats(
+        entries=len(idle_times),
+        expired_entries=expired,
+        size=disk_usage(cache_files()),
+        journals=len(list(JOURNAL_DIR.glob("*.journal"))),
+        obsolete_versions=len(obsolete_dirs),
+        obsolete_versions_size=disk_usage(obsolete_dirs),
+    )
+
+
+def compact_cache(policy: CachePolicy = CachePolicy()) -> tuple[int, int]:
+    """
+    Evict entries according to the policy, and rewrite the cache database to reclaim
+    the disk space, since dbm files don't shrink on deletion. Obsolete version
+    directories are removed as well. Return the numbers of entries before and after.
+
+    The cache is rewritten into a staging directory and then moved in place. If the
+    process is interrupted in between, the cache may be lost, which is harmless.
+    """
+
+    remove_obsolete_version_dirs()
+
+    today = china_now().date()
+    staging_dir = FUND_INFO_CACHE_DIR / "compacting"
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    staging_dir.mkdir()
+
+    with open_cache() as fund_info_db:
+
+        idle_times = idle_times_of(fund_info_db)
+
+        survivors = [
+            code
+            for code, idle in idle_times.items()
+            if not is_evictable(fund_info_db, code, idle, today, policy)
+        ]
+
+        # Most recently used first
+        survivors.sort(key=idle_times.__getitem__)
+
+        # Evict least recently used entries beyond the size cap. The on-disk size of an
+        # entry is estimated by its encoded size, scaled by the overhead of the dbm
+        # backend observed so far.
+        sizes = [len(fund_info_db[code]) for code in survivors]
+        overhead = max(disk_usage(cache_files()) / max(sum(sizes), 1), 1)
+        total = 0.0
+        for i, size in enumerate(sizes):
+            total += size * overhead
+            if total > policy.max_size:
+                del survivors[i:]
+                break
+
+        now = time.time()
+        with open_cache(staging_dir / FUND_INFO_CACHE_DB_PATH.name) as new_db:
+            if VERSION_KEY in fund_info_db:
+                new_db[VERSION_KEY] = fund_info_db[VERSION_KEY]
+            for code in survivors:
+                new_db[code] = fund_info_db[code]
+            new_db[ACCESS_TIMES_KEY] = {  # type: ignore
+                code: now - idle_times[code] for code in survivors
+            }
+
+    for path in cache_files():
+        path.unlink()
+    for path in cache_files(staging_dir / FUND_INFO_CACHE_DB_PATH.name):
+        shutil.move(str(path), FUND_INFO_CACHE_DIR / path.name)
+    staging_dir.rmdir()
+
+    return len(idle_times), len(survivors)
+
+
+def maybe_compact_cache(policy: CachePolicy = CachePolicy()) -> None:
+    """Compact the cache if it's grown beyond the size cap"""
+
+    if disk_usage(cache_files()) > policy.max_size:
+        compact_cache(policy)
+
+
+def purge_cache() -> None:
+    """Remove all the caches, of the current version and of other versions"""
+
+    remove_obsolete_version_dirs()
+    for directory in (PERSISTENT_CACHE_DIR, FUND_INFO_CACHE_DIR, JOURNAL_DIR):
+        shutil.rmtree(directory, ignore_errors=True)
+        directory.mkdir(parents=True, exist_ok=True)
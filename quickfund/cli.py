@@ -1,22 +1,42 @@
 #!/usr/bin/env python3
 
+import asyncio
 import re
 import shutil
 import traceback
+from collections import defaultdict
+from collections.abc import Iterator
+from contextlib import contextmanager
+from datetime import timedelta
+from itertools import chain
 from pathlib import Path
+from typing import Any, Optional
 
+import attr
 import click
 import colorama
 
 from .__version__ import __version__
-from .getter import get_fund_infos
+from .cache import CachePolicy, cache_stats, compact_cache, purge_cache
+from .getter import (
+    compact_net_value_histories,
+    get_fund_infos,
+    update_net_value_histories,
+)
+from .models import Section, sections_of
+from .session import SessionConfig
+from .utils.eventloop import set_event_loop_kind
 from .utils.misc import Logger, bright_blue, pause_at_exit, print_traceback_digest
-from .writter import write_to_xlsx
-
-
-# TODO
-# GUI feature of tqdm is experimental. And our application is too fast for the plot to render.
-# from tqdm.gui import tqdm, trange
+from .utils.progress import set_progress_mode
+from .watch import watch_estimates
+from .writter import (
+    SCHEMA,
+    plan_increment,
+    select_schema,
+    write_many_to_xlsx,
+    write_portfolios_to_xlsx,
+    write_to_xlsx,
+)
 
 
 __all__ = ["cli_entry"]
@@ -52,18 +72,267 @@ def is_fund_code(s: str) -> bool:
     return bool(re.fullmatch(r"[0-9]{6}", s))
 
 
-@click.command(
+def read_fund_codes(in_file: Path) -> list[str]:
+    """Read fund codes from a file containing one fund code per line"""
+    lines = in_file.read_text(encoding="utf-8").splitlines()
+    return [line.strip() for line in lines if is_fund_code(line.strip())]
+
+
+def read_manifest(manifest: Path) -> list[Path]:
+    """
+    Read input file paths from a manifest file containing one path per line.
+
+    Blank lines and lines starting with "#" are ignored. Relative paths are relative to
+    the directory of the manifest file.
+    """
+
+    lines = manifest.read_text(encoding="utf-8").splitlines()
+    paths = [line.strip() for line in lines]
+    return [
+        manifest.parent / path for path in paths if path and not path.startswith("#")
+    ]
+
+
+def plan_outputs(
+    in_files: list[Path], output: Path, output_dir: Path
+) -> list[tuple[Path, Path]]:
+    """
+    Pair each input file with its output file.
+
+    A single input file is written to `output`. Otherwise each input file is written to
+    a namesake Excel document under `output_dir`.
+    """
+
+    if len(in_files) == 1:
+        return [(in_files[0], output)]
+
+    out_files = [output_dir / in_file.with_suffix(".xlsx").name for in_file in in_files]
+
+    if len(set(out_files)) != len(out_files):
+        raise click.UsageError("Input files must have distinct names in batch mode")
+
+    return list(zip(in_files, out_files))
+
+
+def parse_session_options(
+    _: click.Context, __: click.Parameter, options: tuple[str, ...]
+) -> SessionConfig:
+    """Parse the KEY=VALUE session options into a session config"""
+
+    fields = attr.fields_dict(SessionConfig)
+    changes = {}
+
+    for option in options:
+        key, sep, value = option.partition("=")
+        key = key.strip().replace("-", "_")
+
+        if not sep or key not in fields:
+            raise click.BadParameter(
+                f"{option!r} is not of form KEY=VALUE, where KEY is one of "
+                + ", ".join(fields)
+            )
+
+        field_type = type(fields[key].default)
+
+        try:
+            if field_type is bool:
+                changes[key] = click.BOOL.convert(value, None, None)
+            else:
+                changes[key] = field_type(value)
+        except (ValueError, click.BadParameter):
+            raise click.BadParameter(
+                f"{value!r} is not a valid {field_type.__name__} for {key}"
+            ) from None
+
+    return attr.evolve(SessionConfig(), **changes)
+
+
+def parse_cache_policy_options(
+    _: click.Context, __: click.Parameter, options: tuple[str, ...]
+) -> CachePolicy:
+    """
+    Parse the KEY=VALUE cache policy options into a cache policy. Durations are in
+    days, and the size cap is in MB.
+    """
+
+    fields = attr.fields_dict(CachePolicy)
+    changes: dict[str, Any] = {}
+
+    for option in options:
+        key, sep, value = option.partition("=")
+        key = key.strip().replace("-", "_")
+
+        if not sep or key not in fields:
+            raise click.BadParameter(
+                f"{option!r} is not of form KEY=VALUE, where KEY is one of "
+                + ", ".join(fields)
+            )
+
+        try:
+            number = float(value)
+            if not number >= 0:
+                raise ValueError
+        except ValueError:
+            raise click.BadParameter(
+                f"{value!r} is not a valid non-negative number for {key}"
+            ) from None
+
+        if key == "max_size":
+            changes[key] = int(number * 1024 * 1024)
+        else:
+            changes[key] = timedelta(days=number)
+
+    return attr.evolve(CachePolicy(), **changes)
+
+
+def parse_columns(
+    _: click.Context, __: click.Parameter, columns: Optional[str]
+) -> list[dict[str, Any]]:
+    """Parse the comma separated column names into a selection of the schema"""
+
+    if not columns:
+        return SCHEMA
+
+    try:
+        return select_schema([column.strip() for column in re.split(r"[,，]", columns)])
+    except ValueError as exc:
+        raise click.BadParameter(str(exc)) from None
+
+
+def select_event_loop(_: click.Context, __: click.Parameter, kind: str) -> None:
+    try:
+        set_event_loop_kind(kind)  # type: ignore
+    except RuntimeError as exc:
+        raise click.BadParameter(str(exc)) from None
+
+
+def log_background_refresh(stale: dict[str, set[Section]]) -> None:
+    if stale:
+        logger.log("后台仍在刷新未完成的基金信息，完成后更新缓存，请稍候......")
+
+
+@contextmanager
+def graceful_failure() -> Iterator[None]:
+    """
+    Print a digest of the error raised within the context, and write the detailed
+    error to the log file, instead of bothering non-tech-savvy users with a traceback.
+    """
+
+    try:
+        yield
+
+    except Exception:
+
+        logger.log("Oops! 程序运行过程中遇到了错误，打印错误信息摘要如下：")
+        print_traceback_digest()
+
+        with open(ERR_LOG_FILE, "w", encoding="utf-8") as f:
+            traceback.print_exc(file=f)
+        logger.log(f'详细错误信息已写入日志文件 "{ERR_LOG_FILE}"，请将日志文件提交给开发者进行调试 debug')
+
+
+class DefaultCommandGroup(click.Group):
+    """
+    A command group that invokes the default command when the first argument is not a
+    subcommand, so that `quickfund <file>` keeps working alongside subcommands.
+    """
+
+    def __init__(self, *args: Any, default_command: str, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.default_command = default_command
+
+    def parse_args(self, ctx: click.Context, args: list[str]) -> list[str]:
+        group_options = {*ctx.help_option_names, "--version"}
+        if args and args[0] not in self.commands and args[0] not in group_options:
+            args = [self.default_command, *args]
+        return super().parse_args(ctx, args)
+
+
+no_color_option = click.option(
+    "--no-color",
+    is_flag=True,
+    help="Turn off the color output. For compatibility with environment without color code support.",
+)
+
+progress_option = click.option(
+    "--progress",
+    type=click.Choice(["auto", "bar", "json", "off"]),
+    default="auto",
+    show_default=True,
+    expose_value=False,
+    callback=lambda _, __, mode: set_progress_mode(mode),
+    help="How progress is reported on stderr. A progress bar is rendered on terminal, "
+    "and JSON progress events are emitted otherwise, unless specified.",
+)
+
+session_option = click.option(
+    "-S",
+    "--session-option",
+    "session_config",
+    multiple=True,
+    metavar="KEY=VALUE",
+    callback=parse_session_options,
+    help="Tune the HTTP session, e.g. dns_ttl=600, keepalive_timeout=60, limit=100, "
+    "limit_per_host=30, tls_session_reuse=true, warm_up_connections=4, "
+    "rate_limit_per_host=50.",
+)
+
+cache_policy_option = click.option(
+    "-P",
+    "--cache-policy",
+    "cache_policy",
+    multiple=True,
+    metavar="KEY=VALUE",
+    envvar="QUICKFUND_CACHE_POLICY",
+    callback=parse_cache_policy_options,
+    help="Tune the eviction of the cache, e.g. max_idle=90, net_value_ttl=30, "
+    "estimate_ttl=7, IARBC_ttl=30 in days, and max_size=64 in MB. Whitespace "
+    "separated options are read from the QUICKFUND_CACHE_POLICY environment variable.",
+)
+
+event_loop_option = click.option(
+    "--event-loop",
+    type=click.Choice(["asyncio", "uvloop"]),
+    default="asyncio",
+    show_default=True,
+    envvar="QUICKFUND_EVENT_LOOP",
+    expose_value=False,
+    callback=select_event_loop,
+    help="The event loop to run on. uvloop is opt-in, with no measured benefit so "
+    "far. It's optional, and unavailable on Windows.",
+)
+
+
+@click.group(
     name="QuickFund",
-    no_args_is_help=True,
+    cls=DefaultCommandGroup,
+    default_command="report",
     context_settings={"help_option_names": ["-h", "--help"]},
 )
+@click.version_option(version=__version__)
+def cli() -> None:
+    """
+    A script to fetch various fund information from https://fund.eastmoney.com/,
+    and structuralize into Excel document.
+
+    The "report" command is invoked when no command is given.
+    """
+
+
+@cli.command(name="report", no_args_is_help=True)
 @click.argument(
-    "file",
-    nargs=1,
-    metavar="<A file containing a sequence of newline separated fund codes>",
+    "files",
+    nargs=-1,
+    metavar="<Files each containing a sequence of newline separated fund codes>",
     # TODO how to use path_type argument to convert to pathlib.Path ?
     type=click.Path(exists=True, dir_okay=False),
 )
+@click.option(
+    "-m",
+    "--manifest",
+    type=click.Path(exists=True, dir_okay=False),
+    help="A file containing a sequence of newline separated input file paths.",
+)
 @click.option(
     "-o",
     "--output",
@@ -71,64 +340,377 @@ def is_fund_code(s: str) -> bool:
     show_default=True,
     # TODO how to use path_type argument to convert to pathlib.Path ?
     type=click.Path(dir_okay=False, writable=True),
-    help="The output file path.",
+    help="The output file path, when there is a single input file.",
 )
 @click.option(
-    "--no-color",
+    "--output-dir",
+    default=".",
+    show_default=True,
+    type=click.Path(file_okay=False, writable=True),
+    help="The output directory, when there are multiple input files. "
+    "Each input file is written to an Excel document of the same name.",
+)
+@click.option(
+    "--layout",
+    default="files",
+    show_default=True,
+    type=click.Choice(["files", "sheets"]),
+    help="With multiple input files, write each to its own Excel document (built in "
+    "parallel), or all to one Excel document at the output path, one sheet per input "
+    "file, after a summary sheet.",
+)
+@click.option(
+    "--incremental",
     is_flag=True,
-    help="Turn off the color output. For compatibility with environment without color code support.",
+    help="Skip writing an Excel document if its rows are unchanged since the last "
+    "incremental run, as recorded in a sidecar manifest.",
 )
+@click.option(
+    "--delta",
+    multiple=True,
+    type=click.Choice(["sheet", "csv"]),
+    help="In incremental mode, additionally write the changed rows to an extra sheet "
+    "of the document, or to a sidecar CSV file. Can be given multiple times.",
+)
+@no_color_option
+@progress_option
 @click.option("--disable-cache", is_flag=True)
+@click.option(
+    "--resume",
+    is_flag=True,
+    help="Resume the last interrupted run over the same fund codes, skipping finished work.",
+)
+@click.option(
+    "--checkpoint-interval",
+    default=100,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Flush the cache and journal the progress every so many fetched funds.",
+)
+@click.option(
+    "--cache-url",
+    envvar="QUICKFUND_CACHE_URL",
+    metavar="URL",
+    help="Use a shared cache server, e.g. redis://host:6379/0, instead of the local "
+    "cache, so that fetches by one user warm the cache for everyone.",
+)
+@click.option(
+    "-j",
+    "--workers",
+    default=1,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Fetch in so many worker processes, for very large lists of fund codes.",
+)
+@click.option(
+    "--bulk",
+    is_flag=True,
+    help="Fetch Eastmoney's rank lists in bulk, and serve net values and IARBC ranks "
+    "from them for the funds they cover, instead of fetching fund pages one by one. "
+    "Worthwhile for hundreds of funds or more. The ranks are approximate: ranked "
+    "within broad fund types, rather than the finer categories of fund pages.",
+)
+@click.option(
+    "--columns",
+    "schema",
+    envvar="QUICKFUND_COLUMNS",
+    metavar="NAMES",
+    callback=parse_columns,
+    help="Comma separated names of the columns to report, in order, e.g. "
+    "基金名称,实时估值,估算增长率. Only the endpoints serving them are fetched. The fund "
+    "code column is always reported. All columns by default.",
+)
+@click.option(
+    "--deadline",
+    type=click.FloatRange(min=0),
+    metavar="SECONDS",
+    help="Write the report within so many seconds, even if Eastmoney is slow. Funds "
+    "not refreshed in time are reported as last cached, grayed out in italics, and "
+    "keep being refreshed in the background to update the cache.",
+)
+@cache_policy_option
+@session_option
+@event_loop_option
 # @click.option("-q", "--quiet", is_flag=True, help="Suppress output except the error channel")
 # @click.option("-v", "--versbose", is_flag=True, help="Increase verboseness")
-@click.version_option(version=__version__)
 def main(
-    file: str,
+    files: tuple[str, ...],
+    manifest: str,
     output: str,
+    output_dir: str,
+    layout: str,
+    incremental: bool,
+    delta: tuple[str, ...],
     no_color: bool,
     disable_cache: bool,
+    resume: bool,
+    checkpoint_interval: int,
+    cache_url: str,
+    workers: int,
+    bulk: bool,
+    schema: list[dict[str, Any]],
+    deadline: Optional[float],
+    cache_policy: CachePolicy,
+    session_config: SessionConfig,
 ) -> None:
     """
-    A script to fetch various fund information from https://fund.eastmoney.com/,
-    and structuralize into Excel document.
+    Fetch various fund information, and structuralize into Excel document.
 
     Input file format: one fund code per line.
+
+    Multiple input files are processed in one batch, fetching the union of their fund
+    codes only once.
     """
 
+    in_files = [Path(file) for file in files]
+    if manifest:
+        in_files += read_manifest(Path(manifest))
+
+    if not in_files:
+        raise click.UsageError("No input file is given")
+
+    if delta and not incremental:
+        raise click.UsageError("--delta is only meaningful with --incremental")
+
+    if layout == "sheets" and incremental:
+        raise click.UsageError("--incremental is not supported with --layout sheets")
+
+    io_pairs = plan_outputs(in_files, Path(output), Path(output_dir))
+
     colorama.init(convert=not no_color)
 
     pause_at_exit(info=bright_blue("按任意键以退出 ..."))
 
-    try:
-        in_file = Path(file)
-        out_file = Path(output)
-
+    with graceful_failure():
         logger.log("获取基金代码列表......")
-        lines = in_file.read_text(encoding="utf-8").splitlines()
-        fund_codes = [line.strip() for line in lines if is_fund_code(line.strip())]
+        fund_code_lists = [read_fund_codes(in_file) for in_file, _ in io_pairs]
 
-        if not fund_codes:
+        # Deduplicate while preserving order
+        all_fund_codes = list(dict.fromkeys(chain.from_iterable(fund_code_lists)))
+
+        if not all_fund_codes:
             logger.log("没有发现基金代码")
             return
 
+        stale: defaultdict[str, set[Section]] = defaultdict(set)
+
         logger.log("获取基金相关信息......")
-        fund_infos = get_fund_infos(fund_codes, disable_cache=disable_cache)
+        all_fund_infos = get_fund_infos(
+            all_fund_codes,
+            disable_cache=disable_cache,
+            resume=resume,
+            checkpoint_interval=checkpoint_interval,
+            session_config=session_config,
+            logger=logger,
+            cache_url=cache_url,
+            cache_policy=cache_policy,
+            workers=workers,
+            bulk=bulk,
+            sections=sections_of(field["name"] for field in schema),
+            deadline=deadline,
+            on_stale=lambda fund_code, section: stale[fund_code].add(section),
+        )
+        fund_info_table = dict(zip(all_fund_codes, all_fund_infos))
+
+        if stale:
+            logger.log(
+                f"期限已到，{len(stale)} 个基金的信息未能及时刷新，"
+                "在文档中以灰色斜体标出其缓存中的旧信息"
+            )
 
         logger.log("将基金相关信息写入 Excel 文件......")
-        backup_old_outfile(out_file)
-        write_to_xlsx(fund_infos, out_file, logger)
+
+        if layout == "sheets" and len(io_pairs) > 1:
+            out_file = Path(output)
+            portfolios = [
+                (in_file.stem, [fund_info_table[fund_code] for fund_code in fund_codes])
+                for (in_file, _), fund_codes in zip(io_pairs, fund_code_lists)
+            ]
+            backup_old_outfile(out_file)
+            write_portfolios_to_xlsx(
+                portfolios, out_file, logger, schema=schema, stale=stale
+            )
+            log_background_refresh(stale)
+            logger.log("完满结束! ✨ 🍰 ✨")
+            return
+
+        jobs = []
+        for (_, out_file), fund_codes in zip(io_pairs, fund_code_lists):
+            fund_infos = [fund_info_table[fund_code] for fund_code in fund_codes]
+
+            increment = None
+            if incremental:
+                increment = plan_increment(
+                    fund_infos, out_file, delta, schema, stale
+                )
+                if increment.unchanged:
+                    logger.log(f'"{out_file}" 内容没有变化，跳过写入')
+                    continue
+                if increment.diff is not None:
+                    logger.log(f'"{out_file}" {increment.diff.summary()}')
+
+            backup_old_outfile(out_file)
+            jobs.append((fund_infos, out_file, increment))
+
+        if len(jobs) == 1:
+            fund_infos, out_file, increment = jobs[0]
+            write_to_xlsx(
+                fund_infos,
+                out_file,
+                logger,
+                increment=increment,
+                schema=schema,
+                stale=stale,
+            )
+        elif jobs:
+            Path(output_dir).mkdir(parents=True, exist_ok=True)
+            write_many_to_xlsx(jobs, schema, stale=stale)
+
+        log_background_refresh(stale)
 
         # The emoji takes inspiration from the black project (https://github.com/psf/black)
         logger.log("完满结束! ✨ 🍰 ✨")
 
-    except Exception:
 
-        logger.log("Oops! 程序运行过程中遇到了错误，打印错误信息摘要如下：")
-        print_traceback_digest()
+@cli.command(name="history", no_args_is_help=True)
+@click.argument(
+    "files",
+    nargs=-1,
+    metavar="<Files each containing a sequence of newline separated fund codes>",
+    type=click.Path(exists=True, dir_okay=False),
+)
+@no_color_option
+@progress_option
+@session_option
+@event_loop_option
+def history(
+    files: tuple[str, ...], no_color: bool, session_config: SessionConfig
+) -> None:
+    """
+    Fetch net value histories of the funds into the local history store.
 
-        with open(ERR_LOG_FILE, "w", encoding="utf-8") as f:
-            traceback.print_exc(file=f)
-        logger.log(f'详细错误信息已写入日志文件 "{ERR_LOG_FILE}"，请将日志文件提交给开发者进行调试 debug')
+    Only records newer than the stored ones are fetched.
+    """
+
+    colorama.init(convert=not no_color)
+
+    with graceful_failure():
+        logger.log("获取基金代码列表......")
+        fund_codes = list(
+            dict.fromkeys(chain.from_iterable(read_fund_codes(Path(f)) for f in files))
+        )
+
+        logger.log("获取基金历史净值......")
+        count = update_net_value_histories(
+            fund_codes, session_config=session_config, logger=logger
+        )
+
+        logger.log(f"新增 {count} 条历史净值记录")
+
+
+@cli.command(name="watch", no_args_is_help=True)
+@click.argument(
+    "files",
+    nargs=-1,
+    metavar="<Files each containing a sequence of newline separated fund codes>",
+    type=click.Path(exists=True, dir_okay=False),
+)
+@click.option(
+    "-n",
+    "--interval",
+    default=30.0,
+    show_default=True,
+    type=click.FloatRange(min=1),
+    help="Seconds between refreshes.",
+)
+@no_color_option
+@session_option
+@event_loop_option
+def watch(
+    files: tuple[str, ...],
+    interval: float,
+    no_color: bool,
+    session_config: SessionConfig,
+) -> None:
+    """
+    Watch the estimates of the funds, refreshed on an interval, in a terminal table
+    sorted by estimate growth rate.
+
+    Only the estimates are fetched, and only the changed cells are redrawn.
+    """
+
+    colorama.init(convert=not no_color)
+
+    with graceful_failure():
+        fund_codes = list(
+            dict.fromkeys(chain.from_iterable(read_fund_codes(Path(f)) for f in files))
+        )
+
+        if not fund_codes:
+            logger.log("没有发现基金代码")
+            return
+
+        try:
+            asyncio.run(watch_estimates(fund_codes, interval, session_config))
+        except KeyboardInterrupt:
+            pass
+
+
+@cli.group(name="cache")
+def cache() -> None:
+    """
+    Inspect and maintain the persistent fund info cache.
+
+    Entries not accessed for a long time, or with all sections long outdated, are
+    evicted on compaction. The cache is also compacted automatically after a run if it
+    has grown beyond the size cap. See the --cache-policy option to tune them.
+    """
+
+
+@cache.command(name="stats")
+@no_color_option
+@cache_policy_option
+def stats(no_color: bool, cache_policy: CachePolicy) -> None:
+    """Show the statistics of the cache."""
+
+    colorama.init(convert=not no_color)
+
+    with graceful_failure():
+        logger.log(cache_stats(cache_policy).summary())
+
+
+@cache.command(name="compact")
+@no_color_option
+@cache_policy_option
+def compact(no_color: bool, cache_policy: CachePolicy) -> None:
+    """
+    Evict expired entries and reclaim the disk space. The local history store is
+    compacted as well.
+    """
+
+    colorama.init(convert=not no_color)
+
+    with graceful_failure():
+        logger.log("压缩缓存......")
+        before, after = compact_cache(cache_policy)
+        logger.log(f"清除 {before - after} 个缓存条目，剩余 {after} 个")
+
+        logger.log("压缩历史净值存储......")
+        before, after = compact_net_value_histories()
+        logger.log(f"回收 {(before - after) / 1024 / 1024:.1f} MB")
+
+
+@cache.command(name="purge")
+@no_color_option
+@click.confirmation_option(prompt="Are you sure to remove all the caches?")
+def purge(no_color: bool) -> None:
+    """Remove all the caches."""
+
+    colorama.init(convert=not no_color)
+
+    with graceful_failure():
+        purge_cache()
+        logger.log("已清空缓存")
 
 
-cli_entry = main.main
+cli_entry = cli.main
@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import struct
+import sys
+from collections.abc import Callable
+from datetime import date, datetime, timedelta
+from operator import attrgetter
+
+import attr
+
+from .models import FundInfo
+
+
+__all__ = ["CODEC_VERSION", "CodecError", "encode_fund_info", "decode_fund_info"]
+
+
+class CodecError(ValueError):
+    """The data is not a fund info encoded by any known version of the codec"""
+
+
+# The version of the encoding. Bump it whenever the layout changes, and register a
+# migration from the previous version in `MIGRATIONS`.
+CODEC_VERSION = 1
+
+# The layout of version 1, all little-endian. A fixed-size head is followed by the
+# UTF-8 bytes of the strings, concatenated.
+#
+#   B      codec version
+#   I      净值日期, as date ordinal
+#   d      单位净值
+#   d      日增长率
+#   d      上一天净值
+#   I      上一天净值日期, as date ordinal
+#   q      估算日期, as microseconds since datetime.min
+#   d      实时估值
+#   d      估算增长率
+#   I      同类排名截止日期, as date ordinal
+#   11H    byte lengths of the strings, see `STRING_FIELDS`
+#
+# NaN of placeholder sections is kept as is. date.min and datetime.min map to ordinal
+# 1 and microsecond 0 respectively.
+HEAD = struct.Struct("<BIdddIqddI11H")
+
+# The fields of FundInfo, in order of its initializer's parameters
+FIELD_NAMES = [
+    "净值日期",
+    "单位净值",
+    "日增长率",
+    "分红送配",
+    "上一天净值",
+    "上一天净值日期",
+    "基金代码",
+    "基金名称",
+    "估算日期",
+    "实时估值",
+    "估算增长率",
+    "同类排名截止日期",
+    "近1周同类排名",
+    "近1月同类排名",
+    "近3月同类排名",
+    "近6月同类排名",
+    "今年来同类排名",
+    "近1年同类排名",
+    "近2年同类排名",
+    "近3年同类排名",
+]
+
+assert FIELD_NAMES == [field.name for field in attr.fields(FundInfo)]
+
+STRING_FIELDS = ["分红送配", "基金代码", "基金名称", *FIELD_NAMES[12:]]
+
+get_strings = attrgetter(*STRING_FIELDS)
+
+MAX_STRING_LENGTH = 0xFFFF
+
+ONE_MICROSECOND = timedelta(microseconds=1)
+
+# Forward migrations, from the encoding of a version to that of the next version. Old
+# entries are migrated lazily on decoding, so that a new version doesn't invalidate
+# the cache.
+MIGRATIONS: dict[int, Callable[[bytes], bytes]] = {}
+
+
+def encode_fund_info(fund_info: FundInfo) -> bytes:
+    """
+    Encode the fund info in the compact binary layout of the current codec version.
+    It's several times smaller and faster to encode and decode than pickle, and unlike
+    pickle, it isn't tied to the layout of the classes.
+    """
+
+    strings = [string.encode() for string in get_strings(fund_info)]
+
+    if any(len(string) > MAX_STRING_LENGTH for string in strings):
+        raise CodecError(f"String too long to encode in fund info {fund_info.基金代码}")
+
+    head = HEAD.pack(
+        CODEC_VERSION,
+        fund_info.净值日期.toordinal(),
+        fund_info.单位净值,
+        fund_info.日增长率,
+        fund_info.上一天净值,
+        fund_info.上一天净值日期.toordinal(),
+        (fund_info.估算日期 - datetime.min) // ONE_MICROSECOND,
+        fund_info.实时估值,
+        fund_info.估算增长率,
+        fund_info.同类排名截止日期.toordinal(),
+        *map(len, strings),
+    )
+
+    return head + b"".join(strings)
+
+
+def migrate(data: bytes) -> bytes:
+    """Migrate the encoded data forward to the current codec version"""
+
+    if not data:
+        raise CodecError("Empty data")
+
+    version = data[0]
+
+    if version > CODEC_VERSION:
+        raise CodecError(f"Encoded by a newer codec version {version}")
+
+    while version < CODEC_VERSION:
+        if version not in MIGRATIONS:
+            raise CodecError(f"No migration from codec version {version}")
+        data = MIGRATIONS[version](data)
+        version += 1
+
+    return data
+
+
+def decode_fund_info(data: bytes) -> FundInfo:
+    """
+    Decode the fund info, migrating it forward first if it's encoded by an older codec
+    version. Raise `CodecError` if the data is encoded by a newer codec version, or is
+    otherwise undecodable.
+    """
+
+    data = migrate(data)
+
+    try:
+        (
+            _,
+            net_value_date,
+            net_value,
+            growth_rate,
+            last_net_value,
+            last_net_value_date,
+            estimate_microseconds,
+            estimate_value,
+            estimate_growth_rate,
+            IARBC_date,
+            *lengths,
+        ) = HEAD.unpack_from(data)
+
+        # Interned, since the same strings, e.g., empty ones, recur across entries
+        strings = []
+        offset = HEAD.size
+        for length in lengths:
+            strings.append(sys.intern(data[offset : offset + length].decode()))
+            offset += length
+
+        if offset != len(data):
+            raise CodecError("Truncated or trailing bytes")
+
+        dividend, fund_code, fund_name, *ranks = strings
+
+        # Positional arguments, in the order of `FIELD_NAMES`, are several times faster
+        # to pass than keyword arguments
+        return FundInfo(
+            date.fromordinal(net_value_date),
+            net_value,
+            growth_rate,
+            dividend,
+            last_net_value,
+            date.fromordinal(last_net_value_date),
+            fund_code,
+            fund_name,
+            datetime.min + estimate_microseconds * ONE_MICROSECOND,
+            estimate_value,
+            estimate_growth_rate,
+            date.fromordinal(IARBC_date),
+            *ranks,
+        )
+
+    except CodecError:
+        raise
+
+    # Out-of-range ordinals and malformed UTF-8 raise ValueError
+    except (struct.error, ValueError, OverflowError) as exc:
+        raise CodecError("Corrupted data") from exc
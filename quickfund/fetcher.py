@@ -1,27 +1,256 @@
+from __future__ import annotations
+
 import asyncio
-import json
+import functools
 import random
 import string
-from collections.abc import Mapping
-from datetime import datetime
-from types import MethodType
-from typing import Union, cast
+import time
+from collections.abc import Awaitable, Callable, Mapping, Sequence
+from datetime import date, timedelta
+from types import MethodType, TracebackType
+from typing import Any, Optional, TypeVar, Union, cast
+from urllib.parse import urlsplit
 
-import aiohttp
-import pandas
 import regex
-from aiohttp import ClientSession
+from aiohttp import ClientSession, hdrs
 from aiohttp_retry import ListRetry, RetryClient
 from lxml import etree
 from more_itertools import one
 
-from .models import FundEstimateInfo, FundIARBCInfo, FundInfo, FundNetValueInfo
+from .hedging import Hedger
+from .models import (
+    FundEstimateInfo,
+    FundIARBCInfo,
+    FundInfo,
+    FundNetValueHistory,
+    FundNetValueInfo,
+    is_market_opening,
+)
+from .ratelimit import RateLimiter, RequestScheduler, create_rate_limits
+from .session import (
+    ACCEPT_ENCODING,
+    MarkerScanner,
+    SessionConfig,
+    SessionStats,
+    create_connector,
+    create_decoder,
+    warm_up,
+)
+from .utils.datetime import china_now, is_weekend
+from .utils.decoding import loads, parse_date, parse_minute_datetime, strip_jsonp
 from .utils.misc import on_failure_raises
+from .utils.typing import IdentityDecorator
 
 
 __all__ = ["FundInfoFetcher"]
 
 
+R = TypeVar("R")
+
+
+# The hosts of the endpoints that fund infos are fetched from
+KNOWN_HOSTS = ["fund.eastmoney.com", "fundgz.1234567.com.cn"]
+
+# The size of chunks in which response bodies are read
+CHUNK_SIZE = 16 * 1024
+
+# The IARBC info lies in the fund info page before the end of the element
+# `li#increaseAmount_stage`, and the rest of the page is never used.
+IARBC_FRAGMENT_END_MARKERS = [b'id="increaseAmount_stage"', b"</li>"]
+
+NET_VALUE_API = "https://fund.eastmoney.com/f10/F10DataApi.aspx"
+
+# The maximum number of records per page that the net value API serves
+NET_VALUE_HISTORY_PAGE_SIZE = 49
+
+
+RANK_LIST_API = "https://fund.eastmoney.com/data/rankhandler.aspx"
+
+# The rank list API refuses requests not referred from the fund ranking page
+RANK_LIST_REFERER = "https://fund.eastmoney.com/data/fundranking.html"
+
+# The number of records per page requested from the rank list API
+RANK_LIST_PAGE_SIZE = 1000
+
+
+# The priority classes of endpoints during trading hours, the lower the earlier.
+# Estimates are time-sensitive during trading hours, while the IARBC info changes at
+# most daily. Outside of trading hours, all endpoints are of the same priority class.
+ENDPOINT_PRIORITIES = {
+    "estimate": 0,
+    "net_value": 1,
+    "other": 1,
+    "rank_list": 1,
+    "IARBC": 2,
+    "history": 3,
+}
+
+
+def priority_of(endpoint: str) -> int:
+    now = china_now()
+    if is_weekend(now.date()) or not is_market_opening(now.time()):
+        return 0
+    return ENDPOINT_PRIORITIES.get(endpoint, ENDPOINT_PRIORITIES["other"])
+
+
+def parse_net_value_history_page(text: str) -> tuple[FundNetValueHistory, int]:
+    """
+    Parse a page of response from the net value API. Return the net value history in
+    the page, and the total number of pages.
+    """
+
+    m = regex.search(r"pages:(?P<pages>\d+)", text)
+    pages = int(m.group("pages"))
+
+    html = etree.HTML(text)
+    headers = [th.text for th in cast(list, html.xpath("//thead/tr/th"))]
+
+    # Money market funds have different columns. They are not supported.
+    if not {"净值日期", "单位净值", "累计净值", "日增长率"} <= set(headers):
+        raise RuntimeError(f"不支持的历史净值表格格式：{headers}")
+
+    history = FundNetValueHistory()
+
+    for tr in cast(list, html.xpath("//tbody/tr")):
+        cells = dict(zip(headers, ("".join(td.itertext()).strip() for td in tr)))
+
+        # A placeholder row is present when there is no record
+        if "净值日期" not in cells or not regex.fullmatch(
+            r"\d{4}-\d{2}-\d{2}", cells["净值日期"]
+        ):
+            continue
+
+        growth_rate = cells["日增长率"].rstrip("% ")
+
+        history.append(
+            净值日期=date.fromisoformat(cells["净值日期"]),
+            单位净值=float(cells["单位净值"]),
+            累计净值=float(cells["累计净值"] or "nan"),
+            日增长率=float(growth_rate) * 0.01 if growth_rate else float("nan"),
+            分红送配=cells.get("分红送配", ""),
+        )
+
+    return history, pages
+
+
+def parse_rank_list_page(text: str) -> tuple[list[list[str]], int]:
+    """
+    Parse a page of response from the rank list API. Return the records in the page,
+    each a list of column values, and the total number of pages.
+    """
+
+    m = regex.search(r"datas:(?P<datas>\[.*?\])\s*,", text, flags=regex.DOTALL)
+    records = [record.split(",") for record in loads(m.group("datas"))]
+
+    m = regex.search(r"allPages:(?P<pages>\d+)", text)
+    pages = int(m.group("pages"))
+
+    return records, pages
+
+
+def parse_net_value(text: str) -> FundNetValueInfo:
+    """
+    Parse the response from the net value API, of the latest two records, into the net
+    value info.
+    """
+
+    html = etree.HTML(text)
+    headers = [th.text for th in cast(list, html.xpath("//thead/tr/th"))]
+
+    latest, last = (
+        dict(zip(headers, ("".join(td.itertext()).strip() for td in tr)))
+        for tr in cast(list, html.xpath("//tbody/tr"))[:2]
+    )
+
+    return FundNetValueInfo(
+        净值日期=parse_date(latest["净值日期"]),
+        单位净值=float(latest["单位净值"]),
+        日增长率=float(latest["日增长率"].rstrip("% ")) * 0.01,
+        分红送配=latest["分红送配"],
+        上一天净值=float(last["单位净值"]),
+        上一天净值日期=parse_date(last["净值日期"]),
+    )  # type: ignore # FIXME https://github.com/python-attrs/attrs/issues/795
+
+
+def parse_estimate(text: str) -> FundEstimateInfo:
+    """Parse the response from the estimate API into the estimate info"""
+
+    # TODO the most rubost approach is to use a JavaScript parser to parse the text
+    # argument.
+
+    data = loads(strip_jsonp(text, "jsonpgz"))
+
+    return FundEstimateInfo(
+        基金代码=data["fundcode"],
+        基金名称=data["name"],
+        估算日期=parse_minute_datetime(data["gztime"]),
+        实时估值=float(data["gsz"]),
+        # The estimate growth rate from API is itself a percentage number (despite
+        # that it doesn't come with a % mark), so we need to multiply it by 0.01.
+        估算增长率=float(data["gszzl"]) * 0.01,
+    )  # type: ignore # FIXME https://github.com/python-attrs/attrs/issues/795
+
+
+# The periods of IARBC, in the order of the columns of the IARBC table, and of the
+# fields of FundIARBCInfo
+IARBC_PERIODS = ["近1周", "近1月", "近3月", "近6月", "今年来", "近1年", "近2年", "近3年"]
+
+
+def reformat_IARBC(IARBC: str) -> str:
+    m = regex.fullmatch(r"(?P<rank>\d+) \| (?P<total>\d+)", IARBC)
+    rank, total = m.group("rank", "total")
+    return rank + "/" + total
+
+
+def parse_IARBC(text: str) -> FundIARBCInfo:
+    """
+    Parse the fund info page, or its fragment up to the end of the IARBC table, into
+    the IARBC info.
+    """
+
+    html = etree.HTML(text)
+
+    cutoff_date = parse_date(one(cast(list, html.xpath("//span[@id='jdzfDate']"))).text)
+
+    table = one(cast(list, html.xpath("//li[@id='increaseAmount_stage']/table")))
+    periods = ["".join(th.itertext()).strip() for th in table.xpath("tr/th")]
+
+    # Rows are labelled by the text of `div.typeName`, excluding the hidden tips in it
+    row = one(
+        tr
+        for tr in table.xpath("tr")
+        if tr.xpath("normalize-space(td[1]/div[@class='typeName']/text())") == "同类排名"
+    )
+    IARBCs = dict(zip(periods, ("".join(td.itertext()).strip() for td in row)))
+
+    return FundIARBCInfo(
+        同类排名截止日期=cutoff_date,
+        **{
+            f"{period}同类排名": reformat_IARBC(IARBCs[period])
+            for period in IARBC_PERIODS
+        },
+    )  # type: ignore # FIXME https://github.com/python-attrs/attrs/issues/795
+
+
+def single_flight(endpoint: str) -> IdentityDecorator:
+    """
+    Return a decorator for fetch methods of `FundInfoFetcher`, so that concurrent
+    fetches of the same fund code from the same endpoint share one in-flight request,
+    and results are reused within the fetcher's result TTL.
+    """
+
+    def decorator(func: Callable[..., Awaitable[R]]) -> Callable[..., Awaitable[R]]:
+        @functools.wraps(func)
+        async def wrapper(self: FundInfoFetcher, fund_code: str) -> R:
+            return await self._single_flight(
+                (endpoint, fund_code), lambda: func(self, fund_code)
+            )
+
+        return wrapper
+
+    return decorator  # type: ignore
+
+
 class FundInfoFetcher:
     """
     A fetcher that handles fetching fund infos.
@@ -31,23 +260,101 @@ class FundInfoFetcher:
     fetcher's life-cycle should be shorter than the life-cyle of the event loop within
     which it is created.
 
+    Use it as an async context manager, so that its HTTP session is closed gracefully
+    however the block exits. A fetcher can be reused across batches within the same
+    event loop, even entered again after being closed, in which case a new HTTP
+    session is opened.
+
     Ref: https://docs.aiohttp.org/en/stable/faq.html#why-is-creating-a-clientsession-outside-of-an-event-loop-dangerous
     Quote: "Why is creating a ClientSession outside of an event loop dangerous? Short answer is: life-cycle of all asyncio objects should be shorter than life-cycle of event loop."
     """
 
-    def __init__(self) -> None:
-        self._session: ClientSession = self.initialize_session()
+    def __init__(
+        self,
+        result_ttl: float = 30,
+        session_config: SessionConfig = SessionConfig(),
+        rate_limits: Mapping[str, RateLimiter] = None,
+    ) -> None:
+        """
+        `result_ttl` is the time, in seconds, that fetched results are kept in memory
+        and reused. Set it to zero to disable the in-memory result cache.
+
+        `session_config` configures the connection pool of the underlying HTTP session.
 
-    __slots__ = ["_session"]
+        `rate_limits` maps hosts to the rate limiters, e.g. token buckets, of requests
+        to them. Requests are scheduled by priority and fairly across fund codes under
+        the rate limits. Pass buckets shared with other processes to enforce a global
+        rate limit. By default, they are created according to the session config.
+
+        Slow requests are hedged as configured by the session config. See `Hedger`.
+        """
+
+        if rate_limits is None and session_config.rate_limit_per_host:
+            rate_limits = create_rate_limits(
+                KNOWN_HOSTS, session_config.rate_limit_per_host
+            )
+
+        self._session_config = session_config
+        self._scheduler = RequestScheduler(rate_limits or {})
+        self.stats = SessionStats()
+        self._hedger = Hedger(
+            session_config.hedge_percentile, session_config.hedge_budget, self.stats
+        )
+        self._session: ClientSession = self.initialize_session()
+        self._closed = False
+
+        self._result_ttl = result_ttl
+        # Map from (endpoint, fund code) to in-flight request
+        self._inflight: dict[tuple[str, str], asyncio.Future] = {}
+        # Map from in-flight request to the number of its waiters
+        self._waiters: dict[asyncio.Future, int] = {}
+        # Map from (endpoint, fund code) to (expiry time, result)
+        self._results: dict[tuple[str, str], tuple[float, Any]] = {}
+
+    __slots__ = [
+        "_session_config",
+        "_scheduler",
+        "stats",
+        "_hedger",
+        "_session",
+        "_closed",
+        "_result_ttl",
+        "_inflight",
+        "_waiters",
+        "_results",
+    ]
+
+    # Sweep expired results once the in-memory result cache grows beyond this size
+    RESULTS_SWEEP_THRESHOLD = 4096
+
+    # The time, in seconds, that closing waits for in-flight requests to complete
+    DRAIN_TIMEOUT = 10
+
+    # The time, in seconds, given to the underlying SSL transports to shut down after
+    # the session is closed. Otherwise they are aborted at event loop shutdown, with
+    # "unclosed transport" warnings.
+    # Ref: https://docs.aiohttp.org/en/stable/client_advanced.html#graceful-shutdown
+    SSL_SHUTDOWN_GRACE = 0.25
+
+    @property
+    def session_config(self) -> SessionConfig:
+        return self._session_config
 
     def initialize_session(self) -> ClientSession:
 
-        # Restrict the size of the connection pool for scraping ethic
-        conn = aiohttp.TCPConnector(limit_per_host=30)
+        conn = create_connector(self._session_config)
         retry_options = ListRetry(
             timeouts=[0, 0, 0.6, 1.2], statuses={500, 502, 503, 504, 514}
         )
-        retry_client = RetryClient(connector=conn, retry_options=retry_options)
+        # Response bodies are decoded by ourselves, so that we can measure the bytes
+        # on the wire, and decode incrementally.
+        retry_client = RetryClient(
+            connector=conn,
+            retry_options=retry_options,
+            headers={hdrs.ACCEPT_ENCODING: ACCEPT_ENCODING},
+            auto_decompress=False,
+            trace_configs=[self.stats.trace_config()],
+        )
 
         # TODO we should inform the type checker that RetryClient has the same interface
         # with that of ClientSession. We can either do it nominally by making
@@ -74,85 +381,264 @@ class FundInfoFetcher:
 
         return session
 
+    async def warm_up(self) -> None:
+        """
+        Pre-resolve and pre-connect to the known hosts, so that the first burst of
+        requests doesn't pay DNS resolutions and TLS handshakes all at the same time.
+        """
+
+        connections = self._session_config.warm_up_connections
+        if connections:
+            await warm_up(self._session, KNOWN_HOSTS, connections)
+
+    async def close(self) -> None:
+        """
+        Close the underlying HTTP session gracefully. In-flight requests are drained
+        first, i.e., waited for to complete within `DRAIN_TIMEOUT`, and cancelled after
+        that. Closing a closed fetcher does nothing.
+        """
+
+        if self._closed:
+            return
+        self._closed = True
+
+        inflight = list(self._inflight.values())
+        if inflight:
+            _, pending = await asyncio.wait(inflight, timeout=self.DRAIN_TIMEOUT)
+            for future in pending:
+                future.cancel()
+
+        await self._session.close()
+
+        if self.stats.requests:
+            await asyncio.sleep(self.SSL_SHUTDOWN_GRACE)
+
+    async def __aenter__(self) -> FundInfoFetcher:
+        if self._closed:
+            self._session = self.initialize_session()
+            self._closed = False
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: type[BaseException] = None,
+        exc_value: BaseException = None,
+        traceback: TracebackType = None,
+    ) -> None:
+        await self.close()
+
+    async def _single_flight(
+        self, key: tuple[str, str], fetch: Callable[[], Awaitable[R]]
+    ) -> R:
+        """
+        Return the unexpired result of the key if there is one. Otherwise join the
+        in-flight request of the key, or start one if there is none. The request is
+        cancelled once all its waiters are, e.g., when the iteration of
+        `iter_updated_fund_infos()` is abandoned.
+        """
+
+        cached = self._results.get(key)
+        if cached is not None:
+            expiry, result = cached
+            if time.monotonic() < expiry:
+                return result
+            del self._results[key]
+
+        future = self._inflight.get(key)
+
+        if future is None:
+            future = asyncio.ensure_future(fetch())
+            self._inflight[key] = future
+            future.add_done_callback(functools.partial(self._on_fetch_done, key))
+
+        # Shield the shared request, so that one cancelled waiter doesn't cancel it
+        # for every other waiter.
+        self._waiters[future] = self._waiters.get(future, 0) + 1
+        try:
+            return await asyncio.shield(future)
+        finally:
+            self._waiters[future] -= 1
+            if not self._waiters[future]:
+                del self._waiters[future]
+                if not future.done():
+                    # Later fetches of the key start afresh
+                    future.cancel()
+                    del self._inflight[key]
+
+    def _on_fetch_done(self, key: tuple[str, str], future: asyncio.Future) -> None:
+
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+
+        if future.cancelled() or future.exception() is not None or not self._result_ttl:
+            return
+
+        now = time.monotonic()
+
+        if len(self._results) >= self.RESULTS_SWEEP_THRESHOLD:
+            self._results = {k: v for k, v in self._results.items() if now < v[0]}
+
+        self._results[key] = (now + self._result_ttl, future.result())
+
     async def GET_text(
-        self, url: str, *, params: Mapping[str, Union[str, int, float]] = None
+        self,
+        url: str,
+        *,
+        params: Mapping[str, Union[str, int, float]] = None,
+        headers: Mapping[str, str] = None,
+        endpoint: str = "other",
+        fund_code: str = "",
+        until: Sequence[bytes] = (),
     ) -> str:
         """
         Asynchronously send a GET request, and return the textual content of the
         successful response. Raise `ClientResponseError` otherwise.
+
+        `endpoint` labels the request in the transfer statistics, and decides its
+        priority class in the request scheduler. `fund_code` decides its flow in the
+        fair queuing of the request scheduler.
+
+        If `until` markers are given, the content is only decoded up to where all the
+        markers are found in order, since the rest of the content is not needed. For
+        uncompressed response, reading stops right there. For compressed response, the
+        rest of the body is still drained to keep the connection reusable, which is
+        cheap given that it's compressed.
+
+        If hedging is enabled in the session config, a request slow to respond is sent
+        again, and whichever succeeds first wins. The latencies that decide the
+        slowness exclude the time waiting for the rate limits.
         """
 
-        async with self._session.get(url, params=params or {}) as response:
+        host = urlsplit(url).hostname or ""
+        priority = priority_of(endpoint)
+        await self._scheduler.acquire(host, priority, fund_code)
+
+        def send() -> Awaitable[str]:
+            return self._receive_text(url, params, headers, endpoint, until)
+
+        async def send_hedge() -> str:
+            # Hedged requests are subject to the rate limits as well
+            await self._scheduler.acquire(host, priority, fund_code)
+            return await send()
+
+        return await self._hedger.run(endpoint, send, send_hedge)
+
+    async def _receive_text(
+        self,
+        url: str,
+        params: Optional[Mapping[str, Union[str, int, float]]],
+        headers: Optional[Mapping[str, str]],
+        endpoint: str,
+        until: Sequence[bytes],
+    ) -> str:
+        """Send a GET request, and receive the text. See `GET_text()`."""
+
+        async with self._session.get(
+            url, params=params or {}, headers=headers
+        ) as response:
             response.raise_for_status()
-            return await response.text(encoding="utf-8")
+
+            decoder = create_decoder(response.headers.get(hdrs.CONTENT_ENCODING, ""))
+            scanner = MarkerScanner(until)
+            content = bytearray()
+            wire_bytes = 0
+
+            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                wire_bytes += len(chunk)
+
+                if until and scanner.done:
+                    continue
+
+                content += decoder.decompress(chunk) if decoder else chunk
+
+                if until and scanner.scan(content) and not decoder:
+                    break
+
+            if until and scanner.done:
+                # Trim the partially read content to a character boundary
+                del content[scanner.end :]
+            elif decoder:
+                content += decoder.flush()
+
+        self.stats.record_transfer(endpoint, wire_bytes, len(content))
+
+        return content.decode("utf-8")
 
     @on_failure_raises(RuntimeError, "获取基金代码为 {fund_code} 的基金相关净值信息时发生错误")
+    @single_flight("net_value")
     async def fetch_net_value(self, fund_code: str) -> FundNetValueInfo:
         """Fetch the net value related info related to the given fund code"""
 
-        net_value_api = "https://fund.eastmoney.com/f10/F10DataApi.aspx"
         # The word "lsjz" is an abbreviation of the pinyin of the word "历史净值"
         params = {"code": fund_code, "type": "lsjz", "per": 2}
 
-        text = await self.GET_text(net_value_api, params=params)
-
-        # TODO pandas.read_html accept url as argument, we can definitely use this feature
-        # to simplify the code, if it ever supports async/await syntax in the future.
-        # pandas.read_html uses urllib.request.urlopen under the hood and feeds it to etree.html.parse()
-        # For now, pandas.read_html doesn't support HTTPS
-
-        # TODO configure pandas.read_html to use the most performant parser backend
+        text = await self.GET_text(
+            NET_VALUE_API, params=params, endpoint="net_value", fund_code=fund_code
+        )
 
-        # TODO wait for upstream PR to land https://github.com/microsoft/python-type-stubs/pull/85
-        # TODO open a PR on pandas repo about type annotation of `read_html(parse_dates=)`
+        return parse_net_value(text)
 
-        dfs = pandas.read_html(text, parse_dates=["净值日期"], keep_default_na=False)
-        data = one(dfs)
+    @on_failure_raises(RuntimeError, "获取基金代码为 {fund_code} 的基金历史净值信息时发生错误")
+    async def fetch_net_value_history(
+        self, fund_code: str, since: date = None
+    ) -> FundNetValueHistory:
+        """
+        Fetch the net value history related to the given fund code. If `since` is
+        given, only records dated after it are fetched.
 
-        net_value_info = FundNetValueInfo(
-            净值日期=data.净值日期[0].date(),
-            单位净值=data.单位净值[0],
-            日增长率=float(data.日增长率[0].rstrip("% ")) * 0.01,
-            分红送配=data.分红送配[0],
-            上一天净值=data.单位净值[1],
-            上一天净值日期=data.净值日期[1].date(),
-        )  # type: ignore # FIXME https://github.com/python-attrs/attrs/issues/795
+        The first page is fetched to learn the number of pages, and then the rest of
+        the pages are fetched concurrently.
+        """
 
-        return net_value_info
+        params: dict[str, Union[str, int, float]] = {
+            "code": fund_code,
+            "type": "lsjz",
+            "per": NET_VALUE_HISTORY_PAGE_SIZE,
+        }
+        if since is not None:
+            params["sdate"] = (since + timedelta(days=1)).isoformat()
+
+        async def fetch_page(page: int) -> tuple[FundNetValueHistory, int]:
+            text = await self.GET_text(
+                NET_VALUE_API,
+                params={**params, "page": page},
+                endpoint="history",
+                fund_code=fund_code,
+            )
+            return parse_net_value_history_page(text)
+
+        first_page, pages = await fetch_page(1)
+        rest_pages = await asyncio.gather(*map(fetch_page, range(2, pages + 1)))
+
+        # Records are deduplicated by date, in case that pages shift when new records
+        # are published during fetching.
+        records = {
+            record[0]: record
+            for page in [first_page, *(page for page, _ in rest_pages)]
+            for record in page.records()
+            if since is None or record[0] > since
+        }
+
+        history = FundNetValueHistory()
+        for record_date in sorted(records):
+            history.append(*records[record_date])
+
+        return history
 
     @on_failure_raises(RuntimeError, "获取基金代码为 {fund_code} 的基金相关估算信息时发生错误")
+    @single_flight("estimate")
     async def fetch_estimate(self, fund_code: str) -> FundEstimateInfo:
         """Fetch the estimate info related to the given fund code"""
 
         estimate_api = f"https://fundgz.1234567.com.cn/js/{fund_code}.js"
-        text = await self.GET_text(estimate_api)
-
-        # TODO it would greatly simplify the code if json.loads has the same level of input
-        # tolerance with that of pandas.read_html
-
-        # TODO relax the regular expression to be more permissive and
-        # hence more robust to ill input. Remember, we are dealing with
-        # data coming from stranger environment. Better not depend on
-        # some strong assumption made about them.
-
-        # TODO the most rubost approach is to use a JavaScript parser to parse the text
-        # argument.
+        text = await self.GET_text(
+            estimate_api, endpoint="estimate", fund_code=fund_code
+        )
 
-        pattern = r"jsonpgz\((?P<json>.*)\);"
-        data = json.loads(regex.fullmatch(pattern, text).group("json"))
+        estimate_info = parse_estimate(text)
 
         # sanity check
-        assert data["fundcode"] == fund_code
-
-        estimate_info = FundEstimateInfo(
-            基金代码=data["fundcode"],
-            基金名称=data["name"],
-            估算日期=datetime.strptime(data["gztime"], "%Y-%m-%d %H:%M"),
-            实时估值=float(data["gsz"]),
-            # The estimate growth rate from API is itself a percentage number (despite
-            # that it doesn't come with a % mark), so we need to multiply it by 0.01.
-            估算增长率=float(data["gszzl"]) * 0.01,
-        )  # type: ignore # FIXME https://github.com/python-attrs/attrs/issues/795
+        assert estimate_info.基金代码 == fund_code
 
         # TODO what's the range of 估算增长率? Can we give it a bound and use the
         # bound to conduct sanity check?
@@ -162,40 +648,69 @@ class FundInfoFetcher:
         return estimate_info
 
     @on_failure_raises(RuntimeError, "获取基金代码为 {fund_code} 的基金相关同类排名信息时发生错误")
+    @single_flight("IARBC")
     async def fetch_IARBC(self, fund_code: str) -> FundIARBCInfo:
         """Fetch the IARBC info related to the given fund code"""
 
         fund_info_page_url = f"https://fund.eastmoney.com/{fund_code}.html"
-        text = await self.GET_text(fund_info_page_url)
-
-        html = etree.HTML(text)
-
-        matches = cast(list, html.xpath("//span[@id='jdzfDate']"))
-        cutoff_date_str = one(matches).text
-        cutoff_date = datetime.strptime(cutoff_date_str, "%Y-%m-%d").date()
-
-        matches = cast(list, html.xpath("//li[@id='increaseAmount_stage']"))
-        table = etree.tostring(one(matches), encoding=str)
-        df = one(pandas.read_html(table, index_col=0))
-
-        def reformat_IARBC(IARBC: str) -> str:
-            m = regex.fullmatch(r"(?P<rank>\d+) \| (?P<total>\d+)", IARBC)
-            rank, total = m.group("rank", "total")
-            return rank + "/" + total
-
-        IARBC_info = FundIARBCInfo(
-            同类排名截止日期=cutoff_date,
-            近1周同类排名=reformat_IARBC(df.近1周.同类排名),
-            近1月同类排名=reformat_IARBC(df.近1月.同类排名),
-            近3月同类排名=reformat_IARBC(df.近3月.同类排名),
-            近6月同类排名=reformat_IARBC(df.近6月.同类排名),
-            今年来同类排名=reformat_IARBC(df.今年来.同类排名),
-            近1年同类排名=reformat_IARBC(df.近1年.同类排名),
-            近2年同类排名=reformat_IARBC(df.近2年.同类排名),
-            近3年同类排名=reformat_IARBC(df.近3年.同类排名),
-        )  # type: ignore # FIXME https://github.com/python-attrs/attrs/issues/795
-
-        return IARBC_info
+        text = await self.GET_text(
+            fund_info_page_url,
+            endpoint="IARBC",
+            fund_code=fund_code,
+            until=IARBC_FRAGMENT_END_MARKERS,
+        )
+
+        return parse_IARBC(text)
+
+    @on_failure_raises(RuntimeError, "获取类型为 {fund_type} 的基金排行列表时发生错误")
+    async def fetch_rank_list(self, fund_type: str) -> list[list[str]]:
+        """
+        Fetch the rank list of the funds of the given Eastmoney fund type, e.g., "gp"
+        for stock funds. Return the records, each a list of column values.
+
+        The first page is fetched to learn the number of pages, and then the rest of
+        the pages are fetched concurrently.
+        """
+
+        today = china_now().date()
+        params: dict[str, Union[str, int, float]] = {
+            "op": "ph",
+            "dt": "kf",
+            "ft": fund_type,
+            "rs": "",
+            "gs": 0,
+            "sc": "1nzf",
+            "st": "desc",
+            "sd": (today - timedelta(days=365)).isoformat(),
+            "ed": today.isoformat(),
+            "qdii": "",
+            "tabSubtype": ",,,,,",
+            "pn": RANK_LIST_PAGE_SIZE,
+            "dx": 1,
+        }
+
+        async def fetch_page(page: int) -> tuple[list[list[str]], int]:
+            text = await self.GET_text(
+                RANK_LIST_API,
+                params={**params, "pi": page},
+                headers={hdrs.REFERER: RANK_LIST_REFERER},
+                endpoint="rank_list",
+                fund_code=fund_type,
+            )
+            return parse_rank_list_page(text)
+
+        first_page, pages = await fetch_page(1)
+        rest_pages = await asyncio.gather(*map(fetch_page, range(2, pages + 1)))
+
+        # Records are deduplicated by fund code, in case that pages shift when net
+        # values are published during fetching.
+        records = {
+            record[0]: record
+            for page in [first_page, *(page for page, _ in rest_pages)]
+            for record in page
+        }
+
+        return list(records.values())
 
     @on_failure_raises(RuntimeError, "获取基金代码为 {fund_code} 的基金相关信息时发生错误")
     async def fetch(self, fund_code: str) -> FundInfo:
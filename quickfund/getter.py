@@ -1,107 +1,826 @@
 import asyncio
-import pickle
-import shelve
-from collections.abc import Iterable
-from contextlib import nullcontext
+import multiprocessing
+import queue
+import threading
+from collections.abc import (
+    AsyncGenerator,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Iterable,
+    Mapping,
+)
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
 from pathlib import Path
-from shelve import Shelf
-from typing import cast
+from typing import Optional, TypeVar, cast
+
+from platformdirs import user_data_dir
+
+from .backends import CacheBackend, open_backend
+from .bulk import BulkIndex, fetch_bulk_index
+from .cache import JOURNAL_DIR, CachePolicy
+from .fetcher import KNOWN_HOSTS, FundInfoFetcher
+from .history import NetValueHistoryStore
+from .journal import RunJournal
+from .models import (
+    SECTIONS,
+    FundEstimateInfo,
+    FundIARBCInfo,
+    FundInfo,
+    FundNetValueInfo,
+    Section,
+)
+from .ratelimit import SharedTokenBucket, create_shared_rate_limits
+from .session import SessionConfig, SessionStats
+from .utils.eventloop import EventLoopKind, get_event_loop_kind, set_event_loop_kind
+from .utils.misc import Logger, noop
+from .utils.progress import Progress, pgather
+
 
-from platformdirs import user_cache_dir
+__all__ = [
+    "stream_fund_infos",
+    "get_fund_infos",
+    "update_net_value_histories",
+    "compact_net_value_histories",
+]
 
-from .__version__ import __version__
-from .fetcher import FundInfoFetcher
-from .models import FundEstimateInfo, FundIARBCInfo, FundInfo, FundNetValueInfo
-from .utils.tqdm import tqdm_asyncio
 
+T = TypeVar("T")
 
-__all__ = ["get_fund_infos"]
 
+ALL_SECTIONS: frozenset[Section] = frozenset(SECTIONS)
 
-PERSISTENT_CACHE_DIR = Path(
-    user_cache_dir(appname="QuickFund", appauthor="MapleCCC", version=__version__)
+
+def sections_variant(sections: frozenset[Section]) -> str:
+    """Distinguish the journals of runs fetching different sections"""
+    if sections == ALL_SECTIONS:
+        return ""
+    return ",".join(sorted(section.__name__ for section in sections))
+
+
+# Net value histories are expensive to refetch, so they are not stored in the
+# versioned cache directory, which is abandoned on version change.
+NET_VALUE_HISTORY_DIR = (
+    Path(user_data_dir(appname="QuickFund", appauthor="MapleCCC")) / "histories"
 )
-PERSISTENT_CACHE_DIR.mkdir(parents=True, exist_ok=True)
 
 
 async def update_estimate_info(
-    fund_code: str, fund_info_db: Shelf[FundInfo], fund_info_fetcher: FundInfoFetcher
+    fund_code: str,
+    fund_info_db: dict[str, FundInfo],
+    fund_info_fetcher: FundInfoFetcher,
 ) -> None:
     if not FundEstimateInfo.is_latest(fund_info_db[fund_code]):
         estimate_info = await fund_info_fetcher.fetch_estimate(fund_code)
-        fund_info_db[fund_code].replace(estimate_info=estimate_info)
+        fund_info_db[fund_code] = fund_info_db[fund_code].replaced(
+            estimate_info=estimate_info
+        )
+
+
+def lookup_net_value_info(
+    fund_code: str,
+    history_store: Optional[NetValueHistoryStore],
+    bulk_index: Optional[BulkIndex] = None,
+) -> Optional[FundNetValueInfo]:
+    """
+    Look up the net value info in the history store, or else in the bulk index, if
+    it's there and the latest
+    """
+
+    for source in (history_store, bulk_index):
+        if source is None:
+            continue
+        net_value_info = source.net_value_info(fund_code)
+        if net_value_info is not None and net_value_info.is_latest():
+            return net_value_info
+
+    return None
+
+
+def lookup_IARBC_info(
+    fund_code: str,
+    cached: Optional[FundIARBCInfo],
+    bulk_index: Optional[BulkIndex] = None,
+) -> Optional[FundIARBCInfo]:
+    """
+    Look up the IARBC info in the bulk index, if it's there and at least as fresh as
+    the cached one. The cutoff date of the bulk index lags behind, see `BulkIndex`, so
+    it must not replace a fresher IARBC info fetched from the fund page.
+    """
+
+    if bulk_index is None:
+        return None
+
+    IARBC_info = bulk_index.IARBC_info(fund_code)
+    if IARBC_info is None:
+        return None
+
+    if cached is not None and IARBC_info.同类排名截止日期 < cached.同类排名截止日期:
+        return None
+
+    return IARBC_info
+
+
+async def fetch_unless_given(
+    info: Optional[T], fetch: Callable[[str], Awaitable[T]], fund_code: str
+) -> T:
+    return info if info is not None else await fetch(fund_code)
 
 
 async def update_net_value_info(
-    fund_code: str, fund_info_db: Shelf[FundInfo], fund_info_fetcher: FundInfoFetcher
+    fund_code: str,
+    fund_info_db: dict[str, FundInfo],
+    fund_info_fetcher: FundInfoFetcher,
+    history_store: NetValueHistoryStore = None,
+    bulk_index: BulkIndex = None,
 ) -> None:
     if not FundNetValueInfo.is_latest(fund_info_db[fund_code]):
-        net_value_info = await fund_info_fetcher.fetch_net_value(fund_code)
-        fund_info_db[fund_code].replace(net_value_info=net_value_info)
+        net_value_info = await fetch_unless_given(
+            lookup_net_value_info(fund_code, history_store, bulk_index),
+            fund_info_fetcher.fetch_net_value,
+            fund_code,
+        )
+        fund_info_db[fund_code] = fund_info_db[fund_code].replaced(
+            net_value_info=net_value_info
+        )
 
 
 async def update_IARBC_info(
-    fund_code: str, fund_info_db: Shelf[FundInfo], fund_info_fetcher: FundInfoFetcher
+    fund_code: str,
+    fund_info_db: dict[str, FundInfo],
+    fund_info_fetcher: FundInfoFetcher,
+    bulk_index: BulkIndex = None,
 ) -> None:
     if not FundIARBCInfo.is_latest(fund_info_db[fund_code]):
-        IARBC_info = await fund_info_fetcher.fetch_IARBC(fund_code)
-        fund_info_db[fund_code].replace(IARBC_info=IARBC_info)
+        IARBC_info = await fetch_unless_given(
+            lookup_IARBC_info(fund_code, fund_info_db[fund_code], bulk_index),
+            fund_info_fetcher.fetch_IARBC,
+            fund_code,
+        )
+        fund_info_db[fund_code] = fund_info_db[fund_code].replaced(
+            IARBC_info=IARBC_info
+        )
 
 
 # TODO use a database library that supports multiple concurrent read/write
 # TODO use a database library that supports asynchronous non-blocking write
+# Fund infos in the database are replaced as a whole, never mutated in place, so that a
+# shallow copy of the database taken from another thread, e.g., on deadline, sees each
+# fund info either before or after an update, never halfway.
 async def update_fund_info(
-    fund_code: str, fund_info_db: Shelf[FundInfo], fund_info_fetcher: FundInfoFetcher
+    fund_code: str,
+    fund_info_db: dict[str, FundInfo],
+    fund_info_fetcher: FundInfoFetcher,
+    history_store: NetValueHistoryStore = None,
+    bulk_index: BulkIndex = None,
+    sections: frozenset[Section] = ALL_SECTIONS,
 ) -> None:
+    """
+    Update the fund info in the database. Only the given sections are fetched and
+    checked for freshness. Sections never fetched are filled with placeholders.
+    """
 
     if fund_code in fund_info_db:
-        await update_net_value_info(fund_code, fund_info_db, fund_info_fetcher)
-        await update_estimate_info(fund_code, fund_info_db, fund_info_fetcher)
-        await update_IARBC_info(fund_code, fund_info_db, fund_info_fetcher)
-    else:
-        fund_info = await fund_info_fetcher.fetch(fund_code)
-        fund_info_db[fund_code] = fund_info
-
-
-def update_fund_infos(fund_codes: Iterable[str], fund_info_db: Shelf[FundInfo]) -> None:
-    fund_info_fetcher = FundInfoFetcher()
-    tasks = (
-        update_fund_info(fund_code, fund_info_db, fund_info_fetcher)
-        for fund_code in set(fund_codes)
+        if FundNetValueInfo in sections:
+            await update_net_value_info(
+                fund_code, fund_info_db, fund_info_fetcher, history_store, bulk_index
+            )
+        if FundEstimateInfo in sections:
+            await update_estimate_info(fund_code, fund_info_db, fund_info_fetcher)
+        if FundIARBCInfo in sections:
+            await update_IARBC_info(
+                fund_code, fund_info_db, fund_info_fetcher, bulk_index
+            )
+        return
+
+    async def fetch_section(
+        section: Section, given: Optional[T], fetch: Callable[[str], Awaitable[T]]
+    ) -> Optional[T]:
+        if given is not None or section not in sections:
+            return given
+        return await fetch(fund_code)
+
+    net_value_info, estimate_info, IARBC_info = await asyncio.gather(
+        fetch_section(
+            FundNetValueInfo,
+            lookup_net_value_info(fund_code, history_store, bulk_index),
+            fund_info_fetcher.fetch_net_value,
+        ),
+        fetch_section(FundEstimateInfo, None, fund_info_fetcher.fetch_estimate),
+        fetch_section(
+            FundIARBCInfo,
+            lookup_IARBC_info(fund_code, None, bulk_index),
+            fund_info_fetcher.fetch_IARBC,
+        ),
+    )
+
+    fund_info_db[fund_code] = FundInfo.combine(
+        net_value_info or FundNetValueInfo.placeholder(),
+        estimate_info or FundEstimateInfo.placeholder(fund_code),
+        IARBC_info or FundIARBCInfo.placeholder(),
+    )
+
+
+async def iter_updated_fund_infos(
+    fund_codes: Iterable[str],
+    fund_info_db: dict[str, FundInfo],
+    fund_info_fetcher: FundInfoFetcher,
+    history_store: NetValueHistoryStore = None,
+    bulk_index: BulkIndex = None,
+    sections: frozenset[Section] = ALL_SECTIONS,
+    progress: bool = True,
+) -> AsyncIterator[str]:
+    """
+    Update the fund infos in the database with the fetcher concurrently, yielding each
+    fund code as soon as its fund info is updated.
+
+    If the iteration is abandoned halfway, the remaining updates are cancelled.
+    """
+
+    async def update(fund_code: str) -> str:
+        await update_fund_info(
+            fund_code,
+            fund_info_db,
+            fund_info_fetcher,
+            history_store,
+            bulk_index,
+            sections,
+        )
+        return fund_code
+
+    tasks = [asyncio.ensure_future(update(fund_code)) for fund_code in fund_codes]
+
+    try:
+        with Progress(
+            len(tasks), unit="个", desc="获取基金信息", mode=None if progress else "off"
+        ) as progress_bar:
+            for next_completed in asyncio.as_completed(tasks):
+                yield await next_completed
+                progress_bar.update()
+
+    finally:
+        for task in tasks:
+            task.cancel()
+        # Wait for the cancelled updates to unwind, so that none of them is left
+        # running, or destroyed pending, once the iteration ends
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def update_fund_infos_with(
+    fund_codes: Iterable[str],
+    fund_info_db: dict[str, FundInfo],
+    fund_info_fetcher: FundInfoFetcher,
+    history_store: NetValueHistoryStore = None,
+    bulk_index: BulkIndex = None,
+    sections: frozenset[Section] = ALL_SECTIONS,
+    on_completed: Callable[[str], None] = noop,
+    progress: bool = True,
+) -> None:
+    """
+    Update the fund infos in the database with the fetcher, calling `on_completed` with
+    each fund code once its fund info is updated.
+    """
+
+    async for fund_code in iter_updated_fund_infos(
+        fund_codes,
+        fund_info_db,
+        fund_info_fetcher,
+        history_store,
+        bulk_index,
+        sections,
+        progress,
+    ):
+        on_completed(fund_code)
+
+
+async def stream_fund_infos(
+    fund_codes: Iterable[str],
+    fetcher: FundInfoFetcher = None,
+    cache: CacheBackend = None,
+    history_store: NetValueHistoryStore = None,
+    bulk_index: BulkIndex = None,
+    sections: frozenset[Section] = ALL_SECTIONS,
+    checkpoint_interval: int = 100,
+    progress: bool = False,
+    journal_path: Path = None,
+    resume: bool = False,
+    workers: int = 1,
+    bulk: bool = False,
+    on_loaded: Callable[[Mapping[str, FundInfo]], None] = noop,
+    logger: Logger = Logger.null_logger(),
+) -> AsyncGenerator[tuple[str, FundInfo], None]:
+    """
+    Get the fund infos of the fund codes, yielding pairs of fund code and fund info in
+    the order they are completed. Duplicate fund codes are yielded once.
+
+    If the iteration is abandoned halfway, the remaining updates are cancelled, and the
+    fund infos yielded so far are committed, once the generator is closed. Close it
+    with `aclose()` to have it done right away, rather than on garbage collection.
+
+    Run in the caller's event loop. `fetcher` is borrowed if given, so that a
+    long-lived fetcher and its HTTP session can be reused across calls. Otherwise a
+    fetcher is created, and closed once the iteration ends.
+
+    If a cache backend is given, fund infos are served from it when they are fresh,
+    and updated fund infos are written back to it every `checkpoint_interval` yielded
+    fund codes, and once the iteration ends. The cache backend is not closed.
+    `on_loaded` is called with the fund infos loaded from the cache. They are replaced
+    in place as they are updated, so that they can be snapshotted from another thread,
+    see `update_fund_info()`.
+
+    If a journal path is given along with the cache backend, the progress is journaled
+    at each checkpoint. If `resume` is set, fund codes completed by the interrupted run
+    of the journal are yielded as cached, without being updated. See `RunJournal`.
+
+    If a history store is given, net value infos are served from it when it's fresh.
+    If a bulk index is given, or `bulk` is set to fetch one, net value infos and IARBC
+    infos are served from it, approximately, when it covers the fund. See
+    `fetch_bulk_index()`.
+
+    If more than one worker is requested, fund infos are updated in as many worker
+    processes, and merged back, so that the cache is committed from here alone. The
+    statistics of their sessions are merged into those of the fetcher. See
+    `iter_updated_fund_infos_in_workers()`.
+
+    Only the given sections of fund info are fetched, e.g., `{FundEstimateInfo}` for
+    estimates only. See `update_fund_info()`.
+    """
+
+    fund_codes = list(dict.fromkeys(fund_codes))
+    fund_info_db = cache.get_many(fund_codes) if cache is not None else {}
+    on_loaded(fund_info_db)
+
+    def checkpoint(codes: list[str]) -> None:
+        if cache is not None:
+            cache.put_many({code: fund_info_db[code] for code in codes})
+
+    # Journaling is meaningless when there is no persistent cache to resume from
+    journal = RunJournal(
+        journal_path if cache is not None else None,
+        checkpoint,
+        checkpoint_interval,
+        resume,
     )
-    asyncio.run(tqdm_asyncio.gather(*tasks, unit="个", desc="获取基金信息"))
 
+    owns_fetcher = fetcher is None
+    fund_info_fetcher = fetcher or FundInfoFetcher()
+    finished = False
+
+    try:
+        # Fund codes completed in the journal may be absent from the cache, in case the
+        # cache is reset in between, e.g., due to version change.
+        resumed = {
+            code
+            for code in fund_codes
+            if code in journal.completed and code in fund_info_db
+        }
+        for fund_code in fund_codes:
+            if fund_code in resumed:
+                yield fund_code, fund_info_db[fund_code]
+
+        fund_codes = [code for code in fund_codes if code not in resumed]
+
+        # The bulk index serves no estimate info
+        if bulk_index is None and bulk and fund_codes and sections - {FundEstimateInfo}:
+            logger.log("批量获取基金排行列表......")
+            bulk_index = await fetch_bulk_index(fund_info_fetcher)
+            logger.log(f"基金排行列表覆盖 {len(bulk_index)} 个基金")
+
+        if workers > 1 and len(fund_codes) > 1:
+            updated = iter_updated_fund_infos_in_workers(
+                fund_codes,
+                fund_info_db,
+                workers,
+                fund_info_fetcher.session_config,
+                bulk_index,
+                sections,
+                progress,
+                fund_info_fetcher.stats,
+            )
+        else:
+            updated = iter_updated_fund_infos(
+                fund_codes,
+                fund_info_db,
+                fund_info_fetcher,
+                history_store,
+                bulk_index,
+                sections,
+                progress,
+            )
+
+        async for fund_code in updated:
+            journal.record(fund_code)
+            yield fund_code, fund_info_db[fund_code]
+
+        finished = True
+
+    finally:
+        journal.close(finished)
+        if owns_fetcher:
+            await fund_info_fetcher.close()
+
+
+# States of a worker process, set up by `init_worker()`
+worker_results: Optional[multiprocessing.Queue] = None
+worker_rate_limits: Optional[dict[str, SharedTokenBucket]] = None
+
+
+def init_worker(
+    results: multiprocessing.Queue,
+    rate_limits: Optional[dict[str, SharedTokenBucket]],
+    event_loop_kind: EventLoopKind,
+) -> None:
+    global worker_results, worker_rate_limits
+    worker_results = results
+    worker_rate_limits = rate_limits
+    # Spawned worker processes don't inherit the event loop policy
+    set_event_loop_kind(event_loop_kind)
+
+
+def fetch_shard(
+    fund_codes: list[str],
+    fund_info_db: dict[str, FundInfo],
+    session_config: SessionConfig,
+    bulk_index: Optional[BulkIndex],
+    sections: frozenset[Section],
+) -> SessionStats:
+    """
+    Run in a worker process. Update the fund infos of a shard of fund codes, with its
+    own event loop and fetcher. Each updated fund info is sent back to the parent
+    process as soon as it's done. Return the statistics of the session.
+    """
+
+    results = cast(multiprocessing.Queue, worker_results)
+
+    def send_back(fund_code: str) -> None:
+        results.put((fund_code, fund_info_db[fund_code]))
+
+    with ExitStack() as stack:
+
+        history_store = None
+        if NetValueHistoryStore.exists(NET_VALUE_HISTORY_DIR):
+            history_store = stack.enter_context(
+                NetValueHistoryStore(NET_VALUE_HISTORY_DIR)
+            )
+
+        async def main() -> SessionStats:
+            async with FundInfoFetcher(
+                session_config=session_config, rate_limits=worker_rate_limits
+            ) as fund_info_fetcher:
+
+                warm_up_task = asyncio.create_task(fund_info_fetcher.warm_up())
+
+                await update_fund_infos_with(
+                    fund_codes,
+                    fund_info_db,
+                    fund_info_fetcher,
+                    history_store,
+                    bulk_index,
+                    sections,
+                    on_completed=send_back,
+                    progress=False,
+                )
+
+                await warm_up_task
+
+            return fund_info_fetcher.stats
+
+        return asyncio.run(main())
+
+
+async def iter_updated_fund_infos_in_workers(
+    fund_codes: list[str],
+    fund_info_db: dict[str, FundInfo],
+    workers: int,
+    session_config: SessionConfig = SessionConfig(),
+    bulk_index: BulkIndex = None,
+    sections: frozenset[Section] = ALL_SECTIONS,
+    progress: bool = True,
+    stats: SessionStats = None,
+) -> AsyncIterator[str]:
+    """
+    Update the fund infos in the database, sharding the fund codes across worker
+    processes, so that parsing and TLS are not bottlenecked by a single CPU core.
+
+    The per-host rate limits are shared by all the workers. Updated fund infos are
+    merged back into this process, yielding each fund code as soon as its fund info is
+    merged. The statistics of the sessions of the workers are merged into `stats`, if
+    given.
+    """
+
+    shards = [fund_codes[i::workers] for i in range(min(workers, len(fund_codes)))]
+
+    rate_limits = None
+    if session_config.rate_limit_per_host:
+        rate_limits = create_shared_rate_limits(
+            KNOWN_HOSTS, session_config.rate_limit_per_host
+        )
+
+    results: multiprocessing.Queue = multiprocessing.Queue()
+    stopped = threading.Event()
+    loop = asyncio.get_running_loop()
+
+    with ProcessPoolExecutor(
+        len(shards),
+        initializer=init_worker,
+        initargs=(results, rate_limits, get_event_loop_kind()),
+    ) as executor:
+
+        futures = [
+            executor.submit(
+                fetch_shard,
+                shard,
+                {code: fund_info_db[code] for code in shard if code in fund_info_db},
+                session_config,
+                bulk_index.subset(shard) if bulk_index is not None else None,
+                sections,
+            )
+            for shard in shards
+        ]
+
+        # Run in a thread, not to block the event loop. It gives up once the iteration
+        # ends, so that the thread is not left waiting for results forever.
+        def receive() -> Optional[tuple[str, FundInfo]]:
+            while not stopped.is_set():
+                try:
+                    return results.get(timeout=0.1)
+                except queue.Empty:
+                    for future in futures:
+                        if future.done() and future.exception() is not None:
+                            executor.shutdown(wait=False, cancel_futures=True)
+                            raise cast(BaseException, future.exception())
+            return None
+
+        try:
+            with Progress(
+                len(fund_codes),
+                unit="个",
+                desc="获取基金信息",
+                mode=None if progress else "off",
+            ) as progress_bar:
+                for _ in fund_codes:
+                    result = await loop.run_in_executor(None, receive)
+                    if result is None:
+                        return
+                    fund_code, fund_info = result
+                    fund_info_db[fund_code] = fund_info
+                    yield fund_code
+                    progress_bar.update()
+
+        finally:
+            stopped.set()
+
+        for future in futures:
+            worker_stats = await asyncio.wrap_future(future)
+            if stats is not None:
+                stats.merge(worker_stats)
+
+
+def run_in_background(
+    run: Callable[[], None],
+    timeout: float,
+    logger: Logger = Logger.null_logger(),
+    ready: threading.Event = None,
+) -> bool:
+    """
+    Run in a background thread, and wait for it to finish within the timeout. Return
+    whether it's finished. If `ready` is given, it's waited for beyond the timeout,
+    unless the thread finishes first.
+
+    An error raised before the timeout is re-raised here. One raised afterwards is
+    logged instead, since there is no one waiting for it. The thread is not a daemon,
+    so the process doesn't exit until it's finished.
+    """
+
+    lock = threading.Lock()
+    finished = threading.Event()
+    errors: list[Exception] = []
+    abandoned = False
+
+    def target() -> None:
+        error = None
+        try:
+            run()
+        except Exception as exc:
+            error = exc
+
+        with lock:
+            if ready is not None:
+                ready.set()
+            finished.set()
+            if error is not None and not abandoned:
+                errors.append(error)
+                return
+
+        if error is not None:
+            logger.log(f"后台刷新基金信息时发生错误，已完成的刷新仍已写入缓存：{error!r}")
+
+    threading.Thread(target=target, name="quickfund-refresh").start()
+
+    finished.wait(timeout)
+    if ready is not None:
+        ready.wait()
+
+    with lock:
+        if not finished.is_set():
+            abandoned = True
+            return False
+
+    if errors:
+        raise errors[0]
 
-def check_db_version(fund_info_db: Shelf[FundInfo]) -> None:
-    if fund_info_db.get("version") != __version__:
-        # 缓存数据库的版本不一致或版本信息缺失，清空旧存储, 并重置到当前版本
-        fund_info_db.clear()
-        fund_info_db["version"] = __version__  # type: ignore # we don't trade simplicity of type annotation for a meta edgy case
+    return True
 
 
 def get_fund_infos(
-    fund_codes: list[str], disable_cache: bool = False
+    fund_codes: list[str],
+    disable_cache: bool = False,
+    resume: bool = False,
+    checkpoint_interval: int = 100,
+    session_config: SessionConfig = SessionConfig(),
+    logger: Logger = Logger.null_logger(),
+    cache_url: str = None,
+    cache_policy: CachePolicy = CachePolicy(),
+    workers: int = 1,
+    bulk: bool = False,
+    sections: frozenset[Section] = ALL_SECTIONS,
+    deadline: float = None,
+    on_stale: Callable[[str, Section], None] = noop,
 ) -> list[FundInfo]:
     """
     Input: a list of fund codes
     Output: a list of fund infos corresponding to the fund codes
+
+    Run `stream_fund_infos()` to completion in an event loop of its own.
+
+    Progress of the run is journaled, and updated fund infos are written to the cache
+    every `checkpoint_interval` completed fund codes. If `resume` is set, fund codes
+    completed by the last interrupted run over the same fund codes are skipped.
+
+    The cache is the local one, unless `cache_url` of a shared cache server is given.
+    See `open_backend()` for the URL format. Cache entries are evicted according to
+    `cache_policy`.
+
+    Net value infos are served from the local history store when it's fresh.
+
+    If more than one worker is requested, fund infos are fetched in as many worker
+    processes, and merged back for a single cache commit.
+
+    If `bulk` is set, net value infos and IARBC infos are served approximately from the
+    rank lists fetched in bulk, for the funds they cover. See `fetch_bulk_index()`.
+
+    Only the given sections of fund info are fetched and checked for freshness, e.g.,
+    as derived from the columns of the report by `sections_of()`.
+
+    If a `deadline` in seconds is given, the best fund infos available are returned
+    once it expires: fresh where fetched, and otherwise as cached, or placeholders if
+    never cached. `on_stale` is called with the fund code and section of each section
+    not refreshed in time. The outstanding refreshes continue in a background thread,
+    and update the cache once finished, which keeps the process alive until then.
     """
 
-    FUND_INFO_CACHE_DB_PATH = PERSISTENT_CACHE_DIR / "fund-infos"
+    fund_info_db: Mapping[str, FundInfo] = {}
+    completed: set[str] = set()
+    loaded = threading.Event()
 
-    if disable_cache:
-        null_shelf = cast(Shelf[FundInfo], {})
-        cm = nullcontext(enter_result=null_shelf)
-    else:
-        shelve_config = {"protocol": pickle.HIGHEST_PROTOCOL, "writeback": True}
-        cm = cast(
-            Shelf[FundInfo], shelve.open(str(FUND_INFO_CACHE_DB_PATH), **shelve_config)
-        )
+    def on_loaded(loaded_fund_info_db: Mapping[str, FundInfo]) -> None:
+        nonlocal fund_info_db
+        fund_info_db = loaded_fund_info_db
+        loaded.set()
+
+    async def main(
+        cache: Optional[CacheBackend], history_store: Optional[NetValueHistoryStore]
+    ) -> None:
+        async with FundInfoFetcher(session_config=session_config) as fund_info_fetcher:
 
-    with cm as fund_info_db:
+            # Warm up the connection pool while cached fund infos are being checked,
+            # unless they are fetched in worker processes
+            warm_up_task = None
+            if workers <= 1:
+                warm_up_task = asyncio.create_task(fund_info_fetcher.warm_up())
 
-        check_db_version(fund_info_db)
+            async for fund_code, _ in stream_fund_infos(
+                fund_codes,
+                fund_info_fetcher,
+                cache,
+                history_store,
+                sections=sections,
+                checkpoint_interval=checkpoint_interval,
+                progress=True,
+                journal_path=RunJournal.path_for(
+                    JOURNAL_DIR, fund_codes, variant=sections_variant(sections)
+                ),
+                resume=resume,
+                workers=workers,
+                bulk=bulk,
+                on_loaded=on_loaded,
+                logger=logger,
+            ):
+                completed.add(fund_code)
 
-        update_fund_infos(fund_codes, fund_info_db)
+            if warm_up_task is not None:
+                await warm_up_task
 
+        logger.log(fund_info_fetcher.stats.summary())
+
+    # Run entirely in one thread, since some dbm backends, e.g., dbm.sqlite3, refuse to
+    # be used from threads other than the one opening them.
+    def run() -> None:
+        with ExitStack() as stack:
+
+            cache = None
+            if not disable_cache:
+                cache = stack.enter_context(
+                    open_backend(cache_url, cache_policy, logger)
+                )
+
+            history_store = None
+            if NetValueHistoryStore.exists(NET_VALUE_HISTORY_DIR):
+                history_store = stack.enter_context(
+                    NetValueHistoryStore(NET_VALUE_HISTORY_DIR)
+                )
+
+            asyncio.run(main(cache, history_store))
+
+    if deadline is None:
+        run()
         return [fund_info_db[fund_code] for fund_code in fund_codes]
+
+    # The cache is waited for, however late, since it's the fallback
+    if run_in_background(run, deadline, logger, ready=loaded):
+        return [fund_info_db[fund_code] for fund_code in fund_codes]
+
+    # Both copies are consistent snapshots, see `update_fund_info()`
+    snapshot, done = dict(fund_info_db), set(completed)
+
+    fund_infos = []
+    for fund_code in fund_codes:
+        fund_info = snapshot.get(fund_code) or FundInfo.unfetched(fund_code)
+        # Sections of an unfinished fund code may be refreshed already. They are told
+        # apart by being the latest.
+        if fund_code not in done:
+            for section in sections:
+                if not section.is_latest(fund_info):
+                    on_stale(fund_code, section)
+        fund_infos.append(fund_info)
+
+    return fund_infos
+
+
+def update_net_value_histories(
+    fund_codes: Iterable[str],
+    store: NetValueHistoryStore = None,
+    session_config: SessionConfig = SessionConfig(),
+    logger: Logger = Logger.null_logger(),
+) -> int:
+    """
+    Update the net value histories of the fund codes in the store. Only records newer
+    than the last stored ones are fetched. Return the number of new records.
+    """
+
+    async def update_net_value_history(
+        fund_code: str, fund_info_fetcher: FundInfoFetcher
+    ) -> int:
+        since = store.last_date(fund_code)
+        history = await fund_info_fetcher.fetch_net_value_history(fund_code, since)
+        return store.append(fund_code, history)
+
+    async def main() -> int:
+        async with FundInfoFetcher(session_config=session_config) as fund_info_fetcher:
+            warm_up_task = asyncio.create_task(fund_info_fetcher.warm_up())
+
+            tasks = (
+                update_net_value_history(fund_code, fund_info_fetcher)
+                for fund_code in set(fund_codes)
+            )
+            counts = await pgather(*tasks, unit="个", desc="获取历史净值")
+
+            await warm_up_task
+
+        logger.log(fund_info_fetcher.stats.summary())
+
+        return sum(counts)
+
+    with ExitStack() as stack:
+
+        if store is None:
+            store = stack.enter_context(NetValueHistoryStore(NET_VALUE_HISTORY_DIR))
+
+        count = asyncio.run(main())
+        store.flush()
+
+        return count
+
+
+def compact_net_value_histories() -> tuple[int, int]:
+    """
+    Compact the local history store, to reclaim the space left behind by relocated
+    regions. Return the sizes of its data file before and after, in bytes.
+    """
+
+    if not NetValueHistoryStore.exists(NET_VALUE_HISTORY_DIR):
+        return 0, 0
+
+    with NetValueHistoryStore(NET_VALUE_HISTORY_DIR) as store:
+        return store.compact()
@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import asyncio
+import math
+import time
+from collections import defaultdict, deque
+from collections.abc import Awaitable, Callable
+from typing import Optional, TypeVar
+
+from .session import SessionStats
+
+
+__all__ = ["LatencyTracker", "HedgeBudget", "Hedger"]
+
+
+R = TypeVar("R")
+
+
+class LatencyTracker:
+    """
+    Track the latencies of the recent requests to each endpoint, to estimate their
+    percentiles.
+    """
+
+    def __init__(self, window: int = 256, min_samples: int = 20) -> None:
+        """
+        `window` is the number of the most recent latencies kept per endpoint.
+        Percentiles are not estimated until an endpoint has `min_samples` latencies.
+        """
+
+        self._min_samples = min_samples
+        self._latencies: defaultdict[str, deque[float]] = defaultdict(
+            lambda: deque(maxlen=window)
+        )
+
+    __slots__ = ["_min_samples", "_latencies"]
+
+    def record(self, endpoint: str, latency: float) -> None:
+        self._latencies[endpoint].append(latency)
+
+    def percentile(self, endpoint: str, percentile: float) -> Optional[float]:
+        """
+        Return the percentile, e.g., 95, of the recent latencies of the endpoint, by
+        the nearest-rank method. Return None if there are too few samples.
+        """
+
+        latencies = self._latencies.get(endpoint)
+        if latencies is None or len(latencies) < self._min_samples:
+            return None
+
+        rank = math.ceil(percentile / 100 * len(latencies))
+        return sorted(latencies)[max(rank, 1) - 1]
+
+
+class HedgeBudget:
+    """
+    A budget that caps hedged requests at a ratio of all requests, so that hedging
+    doesn't add more than that ratio of load on the server, even if the server slows
+    down as a whole.
+
+    Each request deposits `ratio` token into the budget, and each hedged request
+    withdraws a whole token.
+    """
+
+    def __init__(self, ratio: float, burst: float = 10) -> None:
+        """
+        `ratio` is the maximum ratio of hedged requests to all requests. `burst` is the
+        capacity of the budget, i.e., the number of requests allowed to be hedged at
+        once, after a long run of fast requests.
+        """
+
+        if not 0 <= ratio <= 1:
+            raise ValueError("ratio should be between 0 and 1")
+
+        self._ratio = ratio
+        self._burst = burst
+        self._tokens: float = 0
+
+    __slots__ = ["_ratio", "_burst", "_tokens"]
+
+    def deposit(self) -> None:
+        self._tokens = min(self._tokens + self._ratio, self._burst)
+
+    def withdraw(self) -> bool:
+        """Withdraw a token for a hedged request. Return whether it's affordable."""
+
+        if self._tokens < 1:
+            return False
+
+        self._tokens -= 1
+        return True
+
+
+class Hedger:
+    """
+    Hedge requests that are slow to respond. If a request hasn't responded after the
+    given percentile of the recent latencies of its endpoint, a duplicate request is
+    sent, and whichever succeeds first wins, while the other is cancelled. This cuts
+    the tail latency caused by occasional stalls of the server, at the cost of a few
+    extra requests, capped by a `HedgeBudget`.
+
+    Hedging is disabled if the percentile is zero.
+    """
+
+    def __init__(
+        self, percentile: float, budget: float, stats: SessionStats = None
+    ) -> None:
+        """
+        `percentile` is the percentile, e.g., 95, of the recent latencies after which a
+        request is hedged. `budget` is the maximum ratio of hedged requests to all
+        requests. Hedged requests and hedged requests that win are counted in `stats`.
+        """
+
+        if not 0 <= percentile < 100:
+            raise ValueError("percentile should be between 0 and 100")
+
+        self._percentile = percentile
+        self._budget = HedgeBudget(budget)
+        self._latencies = LatencyTracker()
+        self._stats = stats if stats is not None else SessionStats()
+
+    __slots__ = ["_percentile", "_budget", "_latencies", "_stats"]
+
+    @property
+    def enabled(self) -> bool:
+        return self._percentile > 0
+
+    def delay(self, endpoint: str) -> Optional[float]:
+        """The time, in seconds, after which a request to the endpoint is hedged"""
+        return self._latencies.percentile(endpoint, self._percentile)
+
+    async def run(
+        self,
+        endpoint: str,
+        send: Callable[[], Awaitable[R]],
+        send_hedge: Callable[[], Awaitable[R]] = None,
+    ) -> R:
+        """
+        Send a request to the endpoint with `send()`, hedged with `send_hedge()` if it's
+        slow to respond. `send_hedge` defaults to `send`.
+
+        The error of the request is raised only if the hedged request fails too.
+        """
+
+        if not self.enabled:
+            return await send()
+
+        self._budget.deposit()
+        delay = self.delay(endpoint)
+
+        start = time.monotonic()
+        primary: asyncio.Future[R] = asyncio.ensure_future(send())
+        hedge: Optional[asyncio.Future[R]] = None
+
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait([primary], timeout=delay)
+                if not done and self._budget.withdraw():
+                    hedge_start = time.monotonic()
+                    hedge = asyncio.ensure_future((send_hedge or send)())
+                    self._stats.hedges += 1
+
+            if hedge is None:
+                result = await primary
+                self._latencies.record(endpoint, time.monotonic() - start)
+                return result
+
+            pending: set[asyncio.Future[R]] = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for winner in done:
+                    if winner.exception() is None:
+                        if winner is hedge:
+                            self._stats.hedges_won += 1
+                            latency = time.monotonic() - hedge_start
+                        else:
+                            latency = time.monotonic() - start
+                        # Only the latency of the winner is known, which biases the
+                        # percentile downwards a little, in favor of hedging
+                        self._latencies.record(endpoint, latency)
+                        return winner.result()
+
+            raise primary.exception()  # type: ignore
+
+        finally:
+            for task in (primary, hedge):
+                if task is None:
+                    continue
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    # Mark the error of the loser as retrieved, to not be logged
+                    task.exception()
@@ -0,0 +1,350 @@
+from __future__ import annotations
+
+import json
+import math
+import mmap
+import os
+from datetime import date
+from pathlib import Path
+from types import TracebackType
+from typing import BinaryIO, Optional
+
+import attr
+import numpy as np
+
+from .models import FundNetValueHistory, FundNetValueInfo
+
+
+__all__ = ["NetValueHistoryStore", "RECORD_DTYPE"]
+
+
+# The fixed-width layout of a history record
+RECORD_DTYPE = np.dtype(
+    [
+        ("date", "<i4"),  # Date ordinal
+        ("flags", "<i4"),  # Bit flags, see below
+        ("nav", "<f8"),  # 单位净值
+        ("acc_nav", "<f8"),  # 累计净值
+        ("growth", "<f8"),  # 日增长率, NaN if missing
+    ]
+)
+
+# Set if the record has 分红送配 text, which is kept in the index
+FLAG_DIVIDEND = 0b1
+
+# The minimal capacity, in records, of a fund's region in the data file
+MIN_REGION_CAPACITY = 64
+
+O_BINARY = getattr(os, "O_BINARY", 0)
+
+
+@attr.s(auto_attribs=True)
+class Region:
+    """A dataclass to represent the region of a fund's records in the data file"""
+
+    start: int
+    length: int
+    capacity: int
+
+
+class NetValueHistoryStore:
+    """
+    A store of fund net value histories, in a fixed-width binary layout that can be
+    memory-mapped and viewed zero-copy as NumPy arrays.
+
+    The data file is a sequence of records of `RECORD_DTYPE`. Records of each fund lie
+    contiguously in a region with spare capacity, so that appending usually happens in
+    place. A region that runs out of capacity is relocated to the end of the data file,
+    with its capacity doubled. The index file maps fund codes to their regions.
+
+    Appended records become visible to other readers only when the index is flushed.
+    Data is synced to disk before the index is atomically replaced, so the store stays
+    consistent if the process is interrupted. Compaction writes a new generation of
+    the data file, which takes effect together with the index.
+
+    The store is not meant to be written by multiple processes concurrently.
+    """
+
+    INDEX_FILENAME = "histories.idx.json"
+
+    FORMAT_VERSION = 1
+
+    def __init__(self, directory: Path) -> None:
+        directory.mkdir(parents=True, exist_ok=True)
+
+        self._directory = directory
+        self._index_path = directory / self.INDEX_FILENAME
+
+        self._generation = 0
+        self._regions: dict[str, Region] = {}
+        # Map from fund code to map from date ordinal to 分红送配
+        self._dividends: dict[str, dict[int, str]] = {}
+        self._load_index()
+
+        self._data_file = self._open_data_file(self._generation)
+        self._mmap: Optional[mmap.mmap] = None
+        self._dirty = False
+
+    __slots__ = [
+        "_directory",
+        "_index_path",
+        "_generation",
+        "_regions",
+        "_dividends",
+        "_data_file",
+        "_mmap",
+        "_dirty",
+    ]
+
+    def _data_path(self, generation: int) -> Path:
+        return self._directory / f"histories.{generation}.dat"
+
+    def _open_data_file(self, generation: int) -> BinaryIO:
+        # Neither "r+b" (which doesn't create) nor "a+b" (which only appends) fits
+        fd = os.open(self._data_path(generation), os.O_RDWR | os.O_CREAT | O_BINARY)
+        return open(fd, "r+b")
+
+    @classmethod
+    def exists(cls, directory: Path) -> bool:
+        """Check if there is a store in the directory"""
+        return (directory / cls.INDEX_FILENAME).is_file()
+
+    def _load_index(self) -> None:
+
+        if not self._index_path.is_file():
+            return
+
+        index = json.loads(self._index_path.read_text(encoding="utf-8"))
+
+        if index["version"] != self.FORMAT_VERSION:
+            raise RuntimeError(f"不支持的历史净值存储格式版本：{index['version']}")
+
+        self._generation = index["generation"]
+        self._regions = {
+            fund_code: Region(*region) for fund_code, region in index["regions"].items()
+        }
+        self._dividends = {
+            fund_code: {int(ordinal): text for ordinal, text in dividends.items()}
+            for fund_code, dividends in index["dividends"].items()
+        }
+
+    def flush(self) -> None:
+        """Sync appended records to disk, and then publish them in the index"""
+
+        if not self._dirty:
+            return
+
+        self._data_file.flush()
+        os.fsync(self._data_file.fileno())
+
+        index = {
+            "version": self.FORMAT_VERSION,
+            "generation": self._generation,
+            "regions": {
+                fund_code: attr.astuple(region)
+                for fund_code, region in self._regions.items()
+            },
+            "dividends": self._dividends,
+        }
+
+        tmp_path = self._index_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._index_path)
+
+        self._dirty = False
+
+    def close(self) -> None:
+        self.flush()
+        self._mmap = None
+        self._data_file.close()
+
+    def __enter__(self) -> NetValueHistoryStore:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] = None,
+        exc_value: BaseException = None,
+        traceback: TracebackType = None,
+    ) -> None:
+        self.close()
+
+    def fund_codes(self) -> list[str]:
+        """Return the fund codes that have history stored"""
+        return sorted(self._regions)
+
+    def __len__(self) -> int:
+        return len(self._regions)
+
+    def length(self, fund_code: str) -> int:
+        """Return the number of records stored for the fund"""
+        region = self._regions.get(fund_code)
+        return region.length if region else 0
+
+    def view(self, fund_code: str) -> np.ndarray:
+        """
+        Return a read-only zero-copy view of the records stored for the fund, as a
+        NumPy structured array of `RECORD_DTYPE`. Fields are accessible by name, e.g.
+        `store.view(fund_code)["nav"]`.
+        """
+
+        region = self._regions.get(fund_code)
+        if not region or not region.length:
+            return np.empty(0, dtype=RECORD_DTYPE)
+
+        if self._mmap is None:
+            # Views hold references to the previous mapping, if any, so it's closed
+            # only when they are all gone.
+            self._data_file.flush()
+            fileno = self._data_file.fileno()
+            self._mmap = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+
+        return np.frombuffer(
+            self._mmap,
+            dtype=RECORD_DTYPE,
+            count=region.length,
+            offset=region.start * RECORD_DTYPE.itemsize,
+        )
+
+    def last_date(self, fund_code: str) -> Optional[date]:
+        """Return the date of the last record stored for the fund, if any"""
+
+        records = self.view(fund_code)
+        return date.fromordinal(int(records["date"][-1])) if len(records) else None
+
+    def load(self, fund_code: str) -> FundNetValueHistory:
+        """Load the history stored for the fund, as Python objects"""
+
+        records = self.view(fund_code)
+        dividends = self._dividends.get(fund_code, {})
+
+        return FundNetValueHistory(
+            净值日期=list(map(date.fromordinal, records["date"].tolist())),
+            单位净值=records["nav"].tolist(),
+            累计净值=records["acc_nav"].tolist(),
+            日增长率=records["growth"].tolist(),
+            分红送配=[dividends.get(ordinal, "") for ordinal in records["date"].tolist()],
+        )
+
+    def net_value_info(self, fund_code: str) -> Optional[FundNetValueInfo]:
+        """
+        Derive the net value info from the last two records stored for the fund. Return
+        None if there are not enough records, or the records are incomplete.
+        """
+
+        records = self.view(fund_code)[-2:]
+        if len(records) < 2:
+            return None
+
+        previous, latest = records
+        if math.isnan(latest["growth"]):
+            return None
+
+        ordinal = int(latest["date"])
+        dividend = ""
+        if latest["flags"] & FLAG_DIVIDEND:
+            dividend = self._dividends[fund_code][ordinal]
+
+        return FundNetValueInfo(
+            净值日期=date.fromordinal(ordinal),
+            单位净值=float(latest["nav"]),
+            日增长率=float(latest["growth"]),
+            分红送配=dividend,
+            上一天净值=float(previous["nav"]),
+            上一天净值日期=date.fromordinal(int(previous["date"])),
+        )  # type: ignore # FIXME https://github.com/python-attrs/attrs/issues/795
+
+    def _end(self) -> int:
+        """Return the end of the allocated regions, in records"""
+        return max(
+            (region.start + region.capacity for region in self._regions.values()),
+            default=0,
+        )
+
+    def _write_records(self, start: int, records: np.ndarray) -> None:
+        self._data_file.seek(start * RECORD_DTYPE.itemsize)
+        self._data_file.write(records.tobytes())
+
+    def append(self, fund_code: str, history: FundNetValueHistory) -> int:
+        """
+        Append the records in the history that are newer than the stored ones. Return
+        the number of records appended. Call `flush()` to publish them.
+        """
+
+        last_date = self.last_date(fund_code)
+        new_records = [
+            record
+            for record in history.records()
+            if last_date is None or record[0] > last_date
+        ]
+        if not new_records:
+            return 0
+
+        records = np.empty(len(new_records), dtype=RECORD_DTYPE)
+        for i, (净值日期, 单位净值, 累计净值, 日增长率, 分红送配) in enumerate(new_records):
+            flags = FLAG_DIVIDEND if 分红送配 else 0
+            records[i] = (净值日期.toordinal(), flags, 单位净值, 累计净值, 日增长率)
+            if 分红送配:
+                dividends = self._dividends.setdefault(fund_code, {})
+                dividends[净值日期.toordinal()] = 分红送配
+
+        region = self._regions.get(fund_code, Region(self._end(), 0, 0))
+        length = region.length + len(records)
+
+        if length <= region.capacity:
+            self._write_records(region.start + region.length, records)
+            region = Region(region.start, length, region.capacity)
+        else:
+            # Relocate the region to the end of the data file, with more capacity
+            capacity = max(2 * length, MIN_REGION_CAPACITY)
+            relocated = np.concatenate([self.view(fund_code), records])
+            region = Region(self._end(), length, capacity)
+            self._write_records(region.start, relocated)
+
+        self._regions[fund_code] = region
+        self._mmap = None
+        self._dirty = True
+
+        return len(records)
+
+    def data_size(self) -> int:
+        """Return the size of the data file, in bytes"""
+        self._data_file.seek(0, os.SEEK_END)
+        return self._data_file.tell()
+
+    def compact(self) -> tuple[int, int]:
+        """
+        Rewrite the data file without the space wasted by relocated regions and spare
+        capacity. Return the sizes of the data file before and after, in bytes.
+        """
+
+        self.flush()
+        before = self.data_size()
+
+        old_generation, new_generation = self._generation, self._generation + 1
+        data_file = self._open_data_file(new_generation)
+        data_file.truncate()
+
+        regions = {}
+        start = 0
+        for fund_code in self.fund_codes():
+            records = self.view(fund_code)
+            data_file.write(records.tobytes())
+            regions[fund_code] = Region(start, len(records), len(records))
+            start += len(records)
+
+        self._mmap = None
+        self._data_file.close()
+
+        self._data_file = data_file
+        self._generation = new_generation
+        self._regions = regions
+        self._dirty = True
+        self.flush()
+
+        self._data_path(old_generation).unlink()
+
+        return before, self.data_size()
@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import hashlib
+import os
+from collections.abc import Callable, Iterable
+from pathlib import Path
+from types import TracebackType
+from typing import Optional, TextIO
+
+from .utils.misc import noop
+
+
+__all__ = ["RunJournal"]
+
+
+class RunJournal:
+    """
+    A journal that records the progress of a run, so that an interrupted run can be
+    resumed later on.
+
+    The journal is an append-only text file of completed fund codes, one per line.
+    Completed fund codes are buffered in memory, and committed to the journal file
+    every `checkpoint_interval` completions, right after the `checkpoint` callback is
+    called with them (usually persisting their fund infos to the cache). Hence a fund
+    code present in the journal is guaranteed to have its fund info persisted, and the
+    work lost on interruption is bounded by the checkpoint interval.
+
+    Without a path, nothing is journaled, and only the checkpoints are made, e.g., when
+    there is no persistent cache to resume from.
+    """
+
+    def __init__(
+        self,
+        path: Optional[Path],
+        checkpoint: Callable[[list[str]], None] = noop,
+        checkpoint_interval: int = 100,
+        resume: bool = False,
+    ) -> None:
+
+        if checkpoint_interval < 1:
+            raise ValueError("checkpoint_interval should be a positive integer")
+
+        self._path = path
+        self._checkpoint = checkpoint
+        self._checkpoint_interval = checkpoint_interval
+        self._pending: list[str] = []
+
+        self.completed: set[str] = set()
+        self._file: Optional[TextIO] = None
+
+        if path is not None:
+            if resume:
+                self.completed = self.load(path)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(path, "a" if resume else "w", encoding="utf-8")
+            # Start on a line of its own after a torn trailing line
+            if self._file.tell() and not path.read_bytes().endswith(b"\n"):
+                self._file.write("\n")
+
+    __slots__ = [
+        "_path",
+        "_checkpoint",
+        "_checkpoint_interval",
+        "_pending",
+        "_file",
+        "completed",
+    ]
+
+    @staticmethod
+    def path_for(
+        journal_dir: Path, fund_codes: Iterable[str], variant: str = ""
+    ) -> Path:
+        """
+        Return the journal path of a run, which is identified by its set of fund codes,
+        and its variant if any, e.g., which sections of fund info it fetches.
+        """
+
+        key = "\n".join(sorted(set(fund_codes)))
+        if variant:
+            key += f"\n#{variant}"
+
+        digest = hashlib.sha1(key.encode()).hexdigest()
+        return journal_dir / f"{digest}.journal"
+
+    @staticmethod
+    def load(path: Path) -> set[str]:
+        """Load the fund codes recorded in a journal file"""
+
+        if not path.is_file():
+            return set()
+
+        lines = path.read_text(encoding="utf-8").splitlines()
+
+        # A torn trailing line left by a crash is not a valid fund code, hence ignored
+        return {line for line in lines if len(line) == 6 and line.isdigit()}
+
+    def record(self, fund_code: str) -> None:
+        """Record that the fund code is completed"""
+
+        self._pending.append(fund_code)
+
+        if len(self._pending) >= self._checkpoint_interval:
+            self.commit()
+
+    def commit(self) -> None:
+        """Checkpoint, and then commit the pending fund codes to the journal file"""
+
+        if not self._pending:
+            return
+
+        self._checkpoint(list(self._pending))
+
+        if self._file is not None:
+            self._file.write("".join(fund_code + "\n" for fund_code in self._pending))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+        self.completed.update(self._pending)
+        self._pending.clear()
+
+    def close(self, finished: bool = False) -> None:
+        """
+        Commit the pending fund codes and close the journal. The journal file is
+        removed if the run is finished, since there is nothing left to resume.
+        """
+
+        try:
+            self.commit()
+        finally:
+            if self._file is not None:
+                self._file.close()
+
+        if finished and self._path is not None:
+            self._path.unlink(missing_ok=True)
+
+    def __enter__(self) -> RunJournal:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] = None,
+        exc_value: BaseException = None,
+        traceback: TracebackType = None,
+    ) -> None:
+        self.close(finished=exc_type is None)
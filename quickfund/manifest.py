@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from collections.abc import Collection, Iterable, Mapping, Sequence
+from pathlib import Path
+from typing import Any, Optional
+
+import attr
+
+from .models import FundInfo, Section
+
+
+__all__ = ["RowManifest", "RowDiff"]
+
+
+def layout_digest(
+    schema: Sequence[dict[str, Any]], formats: Mapping[str, Any]
+) -> str:
+    layout = {"schema": schema, "formats": formats}
+    return hashlib.sha1(json.dumps(layout, sort_keys=True).encode()).hexdigest()
+
+
+def row_digest(values: Sequence[Any]) -> str:
+    # The repr of the value types in fund infos is deterministic
+    return hashlib.sha1(repr(values).encode()).hexdigest()
+
+
+@attr.s(auto_attribs=True)
+class RowDiff:
+    """
+    A dataclass to represent the difference between the rows of two versions of an
+    Excel document, in fund codes.
+    """
+
+    added: list[str] = attr.ib(factory=list)
+    changed: list[str] = attr.ib(factory=list)
+    removed: list[str] = attr.ib(factory=list)
+    # Set if the rows are reordered, or the layout, i.e., the schema or the formats, is
+    # changed, in which case the document has to be regenerated even if no row is
+    # added, changed or removed.
+    rearranged: bool = False
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.changed or self.removed or self.rearranged)
+
+    def summary(self) -> str:
+        return (
+            f"新增 {len(self.added)} 行，变化 {len(self.changed)} 行，"
+            f"删除 {len(self.removed)} 行"
+        )
+
+
+@attr.s(auto_attribs=True)
+class RowManifest:
+    """
+    A dataclass to represent the manifest of an Excel document, which records the
+    digest of each row, so that the next run can tell what has changed without
+    reading the document.
+
+    A row is digested with its stale sections, which are formatted differently, and
+    the document with its layout: the columns of the schema, their formats, and the
+    other formats the document is written in. So a row or document is regenerated
+    when its formatting would change, even if its values don't.
+
+    The manifest is stored as a sidecar JSON file next to the document.
+    """
+
+    layout: str
+    # Pairs of fund code and row digest, in the order of rows
+    rows: list[tuple[str, str]]
+
+    VERSION = 2
+
+    @staticmethod
+    def path_for(xlsx_filename: Path) -> Path:
+        return xlsx_filename.with_name(f".{xlsx_filename.name}.manifest.json")
+
+    @classmethod
+    def of(
+        cls,
+        fund_infos: Iterable[FundInfo],
+        schema: Sequence[dict[str, Any]],
+        formats: Mapping[str, Any] = None,
+        stale: Mapping[str, Collection[Section]] = None,
+    ) -> RowManifest:
+        names = [field["name"] for field in schema]
+        stale = stale or {}
+
+        rows = []
+        for fund_info in fund_infos:
+            code = fund_info.基金代码
+            values = [getattr(fund_info, name) for name in names]
+            stale_sections = sorted(section.__name__ for section in stale.get(code, ()))
+            rows.append((code, row_digest([*values, stale_sections])))
+
+        return cls(layout_digest(schema, formats or {}), rows)
+
+    @classmethod
+    def load(cls, path: Path) -> Optional[RowManifest]:
+        """Load the manifest. Return None if it's missing, corrupted or outdated."""
+
+        try:
+            obj = json.loads(path.read_text(encoding="utf-8"))
+            if obj["version"] != cls.VERSION:
+                return None
+            return cls(obj["layout"], [tuple(row) for row in obj["rows"]])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def save(self, path: Path) -> None:
+        obj = {"version": self.VERSION, "layout": self.layout, "rows": self.rows}
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(obj), encoding="utf-8")
+        os.replace(tmp_path, path)
+
+    def diff(self, new: RowManifest) -> RowDiff:
+        """Compute the difference from this version to the new version"""
+
+        old_rows, new_rows = dict(self.rows), dict(new.rows)
+
+        return RowDiff(
+            added=[code for code in new_rows if code not in old_rows],
+            changed=[
+                code
+                for code, digest in new_rows.items()
+                if code in old_rows and old_rows[code] != digest
+            ],
+            removed=[code for code in old_rows if code not in new_rows],
+            rearranged=self.layout != new.layout
+            or [code for code, _ in self.rows] != [code for code, _ in new.rows],
+        )
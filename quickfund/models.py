@@ -1,13 +1,24 @@
 from __future__ import annotations
 
+import math
+from collections.abc import Iterable, Iterator
 from datetime import date, datetime, time, timedelta
+from typing import Union
 
 import attr
 
 from .utils.datetime import china_now, is_weekend, last_friday
 
 
-__all__ = ["FundNetValueInfo", "FundEstimateInfo", "FundInfo"]
+__all__ = [
+    "FundNetValueInfo",
+    "FundEstimateInfo",
+    "FundInfo",
+    "FundNetValueHistory",
+    "Section",
+    "SECTIONS",
+    "sections_of",
+]
 
 
 @attr.s(auto_attribs=True)
@@ -37,7 +48,7 @@ class FundNetValueInfo:
 
         now = china_now()
         now_time = now.time()
-        today = china_now.date()
+        today = now.date()
         yesterday = today - timedelta(days=1)
 
         if is_weekend(today):
@@ -48,6 +59,21 @@ class FundNetValueInfo:
         else:
             return self.净值日期 == today
 
+    @classmethod
+    def placeholder(cls) -> FundNetValueInfo:
+        """
+        A placeholder for the net value info that is not fetched. It's never the
+        latest, and never fresher than a fetched one.
+        """
+        return cls(
+            净值日期=date.min,
+            单位净值=math.nan,
+            日增长率=math.nan,
+            分红送配="",
+            上一天净值=math.nan,
+            上一天净值日期=date.min,
+        )  # type: ignore # FIXME https://github.com/python-attrs/attrs/issues/795
+
 
 @attr.s(auto_attribs=True)
 class FundEstimateInfo:
@@ -80,6 +106,20 @@ class FundEstimateInfo:
         else:
             return self.估算日期 == last_market_close_datetime(now)
 
+    @classmethod
+    def placeholder(cls, fund_code: str) -> FundEstimateInfo:
+        """
+        A placeholder for the estimate info that is not fetched. It's never the
+        latest, and never fresher than a fetched one.
+        """
+        return cls(
+            基金代码=fund_code,
+            基金名称="",
+            估算日期=datetime.min,
+            实时估值=math.nan,
+            估算增长率=math.nan,
+        )  # type: ignore # FIXME https://github.com/python-attrs/attrs/issues/795
+
 
 @attr.s(auto_attribs=True)
 class FundIARBCInfo:
@@ -110,6 +150,18 @@ class FundIARBCInfo:
         today = china_now().date()
         return self.同类排名截止日期 == today
 
+    @classmethod
+    def placeholder(cls) -> FundIARBCInfo:
+        """
+        A placeholder for the IARBC info that is not fetched. It's never the latest,
+        and never fresher than a fetched one.
+        """
+        fields = attr.fields(cls)  # type: ignore
+        return cls(
+            同类排名截止日期=date.min,
+            **{field.name: "" for field in fields if field.name != "同类排名截止日期"},
+        )  # type: ignore # FIXME https://github.com/python-attrs/attrs/issues/795
+
 
 @attr.s
 class FundInfo(FundNetValueInfo, FundEstimateInfo, FundIARBCInfo):
@@ -136,6 +188,18 @@ class FundInfo(FundNetValueInfo, FundEstimateInfo, FundIARBCInfo):
             for attribute, value in attr.asdict(IARBC_info).items():
                 setattr(self, attribute, value)
 
+    def replaced(
+        self,
+        net_value_info: FundNetValueInfo = None,
+        estimate_info: FundEstimateInfo = None,
+        IARBC_info: FundIARBCInfo = None,
+    ) -> FundInfo:
+        """Like `replace()`, but return a replaced copy, leaving the fund info intact"""
+
+        fund_info = attr.evolve(self)
+        fund_info.replace(net_value_info, estimate_info, IARBC_info)
+        return fund_info
+
     @classmethod
     def combine(
         cls,
@@ -149,6 +213,84 @@ class FundInfo(FundNetValueInfo, FundEstimateInfo, FundIARBCInfo):
             **attr.asdict(IARBC_info)
         )  # type: ignore # FIXME https://github.com/python-attrs/attrs/issues/795
 
+    @classmethod
+    def unfetched(cls, fund_code: str) -> FundInfo:
+        """A placeholder for the fund info that is neither fetched nor cached"""
+        return cls.combine(
+            FundNetValueInfo.placeholder(),
+            FundEstimateInfo.placeholder(fund_code),
+            FundIARBCInfo.placeholder(),
+        )
+
+    @classmethod
+    def placeholder(cls, fund_code: str = "") -> FundInfo:
+        """
+        Overridden to keep to the contracts of the placeholders of all the sections, so
+        the fund code is optional. Prefer `unfetched()`, which requires it.
+        """
+        return cls.unfetched(fund_code)
+
+
+# A section of fund info, fetched from its own endpoint
+Section = Union[type[FundNetValueInfo], type[FundEstimateInfo], type[FundIARBCInfo]]
+
+# All the sections of fund info
+SECTIONS: tuple[Section, ...] = (FundNetValueInfo, FundEstimateInfo, FundIARBCInfo)
+
+
+def sections_of(field_names: Iterable[str]) -> frozenset[Section]:
+    """
+    Return the sections of fund info that the fields belong to. The fund code is known
+    without fetching any section.
+    """
+
+    field_names = set(field_names) - {"基金代码"}
+
+    return frozenset(
+        section
+        for section in SECTIONS
+        if field_names & {field.name for field in attr.fields(section)}
+    )
+
+
+@attr.s(auto_attribs=True)
+class FundNetValueHistory:
+    """
+    A dataclass to represent fund net value history, in columnar layout, sorted by
+    net value date in ascending order.
+
+    Missing daily growth rates are represented as NaN.
+    """
+
+    净值日期: list[date] = attr.ib(factory=list)
+    单位净值: list[float] = attr.ib(factory=list)
+    累计净值: list[float] = attr.ib(factory=list)
+    日增长率: list[float] = attr.ib(factory=list)
+    分红送配: list[str] = attr.ib(factory=list)
+
+    def __len__(self) -> int:
+        return len(self.净值日期)
+
+    def append(
+        self,
+        净值日期: date,
+        单位净值: float,
+        累计净值: float,
+        日增长率: float,
+        分红送配: str = "",
+    ) -> None:
+        self.净值日期.append(净值日期)
+        self.单位净值.append(单位净值)
+        self.累计净值.append(累计净值)
+        self.日增长率.append(日增长率)
+        self.分红送配.append(分红送配)
+
+    def records(self) -> Iterator[tuple[date, float, float, float, str]]:
+        """Iterate over the history record by record"""
+        return zip(
+            self.净值日期, self.单位净值, self.累计净值, self.日增长率, self.分红送配
+        )
+
 
 def is_market_opening(_time: time = None) -> bool:
     _time = _time or datetime.now().time()
@@ -0,0 +1,244 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import multiprocessing
+import time
+from collections.abc import Iterable, Mapping
+from typing import Optional, Protocol
+
+import attr
+
+
+__all__ = [
+    "RateLimiter",
+    "TokenBucket",
+    "SharedTokenBucket",
+    "create_rate_limits",
+    "create_shared_rate_limits",
+    "RequestScheduler",
+]
+
+
+class RateLimiter(Protocol):
+    async def acquire(self) -> None:
+        """Wait until a request is allowed to be sent"""
+        ...
+
+
+class TokenBucket:
+    """
+    A token bucket to enforce a rate limit within a process.
+
+    Like `SharedTokenBucket`, tokens are reserved rather than waited for.
+    """
+
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        """
+        `rate` is the refill rate, in tokens per second. `burst` is the capacity of the
+        bucket, i.e., the number of requests allowed to be sent at once.
+        """
+
+        if rate <= 0:
+            raise ValueError("rate should be a positive number")
+        if burst < 1:
+            raise ValueError("burst should be a positive integer")
+
+        self._rate = rate
+        self._burst = burst
+        self._tokens: float = burst
+        self._updated_at = time.monotonic()
+
+    __slots__ = ["_rate", "_burst", "_tokens", "_updated_at"]
+
+    def reserve(self) -> float:
+        """Reserve a token. Return the time, in seconds, to wait before using it."""
+
+        now = time.monotonic()
+        elapsed = now - self._updated_at
+        self._tokens = min(self._tokens + elapsed * self._rate, self._burst) - 1
+        self._updated_at = now
+
+        return -self._tokens / self._rate if self._tokens < 0 else 0
+
+    async def acquire(self) -> None:
+        delay = self.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+
+class SharedTokenBucket:
+    """
+    A token bucket that can be shared by multiple processes, to enforce a global rate
+    limit across them. Its state lives in shared memory, guarded by a lock.
+
+    Tokens are reserved rather than waited for: a request takes a token right away,
+    driving the bucket into debt if it's empty, and then sleeps until the token would
+    have been refilled. Hence requests are served in the order they arrive, and the
+    lock is only held for a few arithmetic operations.
+
+    The monotonic clock is system-wide on the supported platforms, so it's comparable
+    across processes.
+    """
+
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        """
+        `rate` is the refill rate, in tokens per second. `burst` is the capacity of the
+        bucket, i.e., the number of requests allowed to be sent at once.
+        """
+
+        if rate <= 0:
+            raise ValueError("rate should be a positive number")
+        if burst < 1:
+            raise ValueError("burst should be a positive integer")
+
+        self._rate = rate
+        self._burst = burst
+        self._lock = multiprocessing.Lock()
+        self._tokens = multiprocessing.RawValue("d", burst)
+        self._updated_at = multiprocessing.RawValue("d", time.monotonic())
+
+    __slots__ = ["_rate", "_burst", "_lock", "_tokens", "_updated_at"]
+
+    def reserve(self) -> float:
+        """Reserve a token. Return the time, in seconds, to wait before using it."""
+
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self._updated_at.value
+            tokens = min(self._tokens.value + elapsed * self._rate, self._burst) - 1
+            self._tokens.value = tokens
+            self._updated_at.value = now
+
+        return -tokens / self._rate if tokens < 0 else 0
+
+    async def acquire(self) -> None:
+        delay = self.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+
+def create_rate_limits(hosts: Iterable[str], rate: float) -> dict[str, TokenBucket]:
+    """
+    Create a token bucket for each host. The burst is one second's worth of requests.
+    """
+    return {host: TokenBucket(rate, burst=max(int(rate), 1)) for host in hosts}
+
+
+def create_shared_rate_limits(
+    hosts: Iterable[str], rate: float
+) -> dict[str, SharedTokenBucket]:
+    """
+    Create a shared token bucket for each host. The burst is one second's worth of
+    requests.
+    """
+    return {host: SharedTokenBucket(rate, burst=max(int(rate), 1)) for host in hosts}
+
+
+@attr.s(auto_attribs=True, order=True)
+class QueuedRequest:
+    priority: int
+    # The virtual start time of the request, for fair queuing across flows
+    start_tag: int
+    sequence: int
+    flow: str = attr.ib(order=False)
+    future: asyncio.Future = attr.ib(order=False)
+
+
+class HostQueue:
+    """The queue of requests waiting to be sent to a host"""
+
+    def __init__(self) -> None:
+        self.heap: list[QueuedRequest] = []
+        # Map from flow to the virtual finish time of its last queued request
+        self.finish_tags: dict[str, int] = {}
+        self.virtual_time = 0
+        self.dispatcher: Optional[asyncio.Task] = None
+
+    __slots__ = ["heap", "finish_tags", "virtual_time", "dispatcher"]
+
+
+class RequestScheduler:
+    """
+    A scheduler that decides when and in which order requests are sent to each host.
+
+    Requests to a host are sent no faster than the host's rate limiter allows, so that
+    the sustained request rate stays below the point where the server starts
+    throttling. Among the waiting requests, those of a higher priority class (a lower
+    number) are sent first. Within a priority class, requests are fairly queued across
+    flows (usually fund codes) by start-time fair queuing: a flow that has many
+    requests queued doesn't starve flows that come later.
+
+    Requests to hosts without a rate limiter are sent right away.
+    """
+
+    def __init__(self, rate_limits: Mapping[str, RateLimiter]) -> None:
+        self._rate_limits = rate_limits
+        self._queues: dict[str, HostQueue] = {}
+        self._sequence = itertools.count()
+
+    __slots__ = ["_rate_limits", "_queues", "_sequence"]
+
+    async def acquire(self, host: str, priority: int = 0, flow: str = "") -> None:
+        """Wait until it's the turn of the request to be sent"""
+
+        rate_limiter = self._rate_limits.get(host)
+        if rate_limiter is None:
+            return
+
+        host_queue = self._queues.setdefault(host, HostQueue())
+
+        start_tag = max(host_queue.finish_tags.get(flow, 0), host_queue.virtual_time)
+        host_queue.finish_tags[flow] = start_tag + 1
+
+        future = asyncio.get_running_loop().create_future()
+        request = QueuedRequest(
+            priority, start_tag, next(self._sequence), flow, future
+        )
+        heapq.heappush(host_queue.heap, request)
+
+        if host_queue.dispatcher is None:
+            host_queue.dispatcher = asyncio.create_task(
+                self._dispatch(host_queue, rate_limiter)
+            )
+
+        await future
+
+    async def _dispatch(self, host_queue: HostQueue, rate_limiter: RateLimiter) -> None:
+
+        heap = host_queue.heap
+
+        def discard_gone() -> None:
+            # Skip requests whose waiters are gone, e.g., cancelled
+            while heap and heap[0].future.done():
+                heapq.heappop(heap)
+
+        try:
+            while True:
+                # Before taking a token, so that requests gone don't use up the rate
+                discard_gone()
+                if not heap:
+                    break
+
+                await rate_limiter.acquire()
+
+                # The token goes to the first request still waiting, since the one it
+                # was taken for may be gone in the meantime
+                discard_gone()
+                if not heap:
+                    break
+
+                request = heapq.heappop(heap)
+                host_queue.virtual_time = request.start_tag
+                request.future.set_result(None)
+
+        finally:
+            # Tags are only meaningful relative to the requests in the queue
+            host_queue.finish_tags.clear()
+            host_queue.virtual_time = 0
+            host_queue.dispatcher = None
+
+            for request in heap:
+                request.future.cancel()
+            heap.clear()
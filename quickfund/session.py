@@ -0,0 +1,311 @@
+from __future__ import annotations
+
+import asyncio
+import ssl
+import time
+import zlib
+from collections import defaultdict
+from collections.abc import Iterable, Sequence
+from types import SimpleNamespace
+from typing import Optional, Protocol
+
+import aiohttp
+import attr
+from aiohttp import ClientSession, TraceConfig
+
+
+try:
+    import brotli
+except ModuleNotFoundError:
+    try:
+        import brotlicffi as brotli
+    except ModuleNotFoundError:
+        brotli = None
+
+
+__all__ = [
+    "SessionConfig",
+    "SessionStats",
+    "create_connector",
+    "warm_up",
+    "ACCEPT_ENCODING",
+    "create_decoder",
+    "MarkerScanner",
+]
+
+
+# Negotiate the best compression that we are able to decode
+ACCEPT_ENCODING = "br, gzip, deflate" if brotli else "gzip, deflate"
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class SessionConfig:
+    """
+    A dataclass to represent the configuration of the HTTP session of a fetcher.
+
+    `limit`: The total size of the connection pool.
+    `limit_per_host`: The size of the connection pool per host. It's restricted for
+        scraping ethic.
+    `keepalive_timeout`: The time, in seconds, that idle connections are kept alive for
+        reuse.
+    `dns_ttl`: The time, in seconds, that DNS resolution results are cached.
+    `tls_session_reuse`: A flag to control whether all connections share one TLS
+        context. Asyncio doesn't support TLS session resumption, so TLS sessions are
+        reused by keeping connections alive, while a shared TLS context saves loading
+        the trust store again for every new connection.
+    `warm_up_connections`: The number of connections pre-opened to each known host.
+        Set it to zero to disable warm-up.
+    `rate_limit_per_host`: The maximum number of requests per second sent to each
+        known host, shared by all worker processes. The connection pool only caps
+        concurrency, so fast responses could burst requests well beyond the point
+        where the server starts throttling. Zero, the default, means no limit. Set it
+        to, e.g., 50, if the server throttles.
+    `hedge_percentile`: The percentile, e.g., 95, of the recent latencies of each
+        endpoint, after which a request not yet responded is hedged, i.e., sent again,
+        and whichever succeeds first wins. It cuts the tail latency caused by
+        occasional stalls of the server. Set it to zero to disable hedging.
+    `hedge_budget`: The maximum ratio of hedged requests to all requests, to cap the
+        extra load of hedging on the server.
+    """
+
+    limit: int = 100
+    limit_per_host: int = 30
+    keepalive_timeout: float = 60
+    dns_ttl: int = 600
+    tls_session_reuse: bool = True
+    warm_up_connections: int = 4
+    rate_limit_per_host: float = 0.0
+    hedge_percentile: float = 0.0
+    hedge_budget: float = 0.05
+
+
+@attr.s(auto_attribs=True)
+class SessionStats:
+    """
+    A dataclass to represent the instrumentation statistics of a HTTP session.
+    """
+
+    requests: int = 0
+    connections_created: int = 0
+    connections_reused: int = 0
+    dns_cache_hits: int = 0
+    dns_cache_misses: int = 0
+    # The time, in seconds, from sending requests to receiving response headers
+    first_byte_latency_total: float = 0
+    first_byte_latency_max: float = 0
+    # The number of requests hedged, and of them, the number won by the hedges
+    hedges: int = 0
+    hedges_won: int = 0
+    # Map from endpoint to the number of bytes received on the wire
+    wire_bytes: defaultdict[str, int] = attr.ib(factory=lambda: defaultdict(int))
+    # Map from endpoint to the number of bytes decoded from the received bytes
+    decoded_bytes: defaultdict[str, int] = attr.ib(factory=lambda: defaultdict(int))
+
+    @property
+    def connection_reuse_rate(self) -> float:
+        connections = self.connections_created + self.connections_reused
+        return self.connections_reused / connections if connections else 0
+
+    @property
+    def first_byte_latency_mean(self) -> float:
+        return self.first_byte_latency_total / self.requests if self.requests else 0
+
+    def merge(self, other: SessionStats) -> None:
+        """Merge into this the statistics of another session, e.g., of a worker"""
+
+        self.requests += other.requests
+        self.connections_created += other.connections_created
+        self.connections_reused += other.connections_reused
+        self.dns_cache_hits += other.dns_cache_hits
+        self.dns_cache_misses += other.dns_cache_misses
+        self.first_byte_latency_total += other.first_byte_latency_total
+        self.first_byte_latency_max = max(
+            self.first_byte_latency_max, other.first_byte_latency_max
+        )
+        self.hedges += other.hedges
+        self.hedges_won += other.hedges_won
+        for endpoint in other.wire_bytes:
+            self.record_transfer(
+                endpoint, other.wire_bytes[endpoint], other.decoded_bytes[endpoint]
+            )
+
+    def record_transfer(
+        self, endpoint: str, wire_bytes: int, decoded_bytes: int
+    ) -> None:
+        self.wire_bytes[endpoint] += wire_bytes
+        self.decoded_bytes[endpoint] += decoded_bytes
+
+    def summary(self) -> str:
+        transfers = "，".join(
+            f"{endpoint} 接口传输 {self.wire_bytes[endpoint] / 1024:.1f} KB"
+            f"（解码后 {self.decoded_bytes[endpoint] / 1024:.1f} KB）"
+            for endpoint in self.wire_bytes
+        )
+        return (
+            f"共发送 {self.requests} 个请求，"
+            f"连接复用率 {self.connection_reuse_rate:.1%}"
+            f"（新建 {self.connections_created}，复用 {self.connections_reused}），"
+            f"DNS 缓存命中 {self.dns_cache_hits} 次、未命中 {self.dns_cache_misses} 次，"
+            f"首字节延迟平均 {self.first_byte_latency_mean * 1000:.0f} 毫秒、"
+            f"最大 {self.first_byte_latency_max * 1000:.0f} 毫秒"
+            + (
+                f"，对冲请求 {self.hedges} 个（其中 {self.hedges_won} 个先于原请求成功）"
+                if self.hedges
+                else ""
+            )
+            + (f"；{transfers}" if transfers else "")
+        )
+
+    def trace_config(self) -> TraceConfig:
+        """Return a trace config that collects statistics into this object"""
+
+        trace_config = TraceConfig()
+
+        async def on_request_start(
+            _: ClientSession, context: SimpleNamespace, __: object
+        ) -> None:
+            context.start = time.perf_counter()
+
+        async def on_request_end(
+            _: ClientSession, context: SimpleNamespace, __: object
+        ) -> None:
+            latency = time.perf_counter() - context.start
+            self.requests += 1
+            self.first_byte_latency_total += latency
+            self.first_byte_latency_max = max(self.first_byte_latency_max, latency)
+
+        async def on_connection_create_end(*_: object) -> None:
+            self.connections_created += 1
+
+        async def on_connection_reuseconn(*_: object) -> None:
+            self.connections_reused += 1
+
+        async def on_dns_cache_hit(*_: object) -> None:
+            self.dns_cache_hits += 1
+
+        async def on_dns_cache_miss(*_: object) -> None:
+            self.dns_cache_misses += 1
+
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_request_end.append(on_request_end)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        trace_config.on_dns_cache_hit.append(on_dns_cache_hit)
+        trace_config.on_dns_cache_miss.append(on_dns_cache_miss)
+
+        return trace_config
+
+
+def create_connector(config: SessionConfig) -> aiohttp.TCPConnector:
+    """Create a TCP connector configured by the session config"""
+
+    ssl_context = ssl.create_default_context() if config.tls_session_reuse else None
+
+    return aiohttp.TCPConnector(
+        limit=config.limit,
+        limit_per_host=config.limit_per_host,
+        keepalive_timeout=config.keepalive_timeout,
+        use_dns_cache=True,
+        ttl_dns_cache=config.dns_ttl,
+        ssl=ssl_context,
+    )
+
+
+async def warm_up(
+    session: ClientSession, hosts: Iterable[str], connections: int
+) -> None:
+    """
+    Pre-resolve and pre-connect to the hosts, so that the connections are ready in the
+    pool for following requests. Failures are ignored, since warm-up is best-effort.
+    """
+
+    async def connect(host: str) -> None:
+        async with session.head(f"https://{host}/", allow_redirects=False):
+            pass
+
+    await asyncio.gather(
+        *(connect(host) for host in hosts for _ in range(connections)),
+        return_exceptions=True,
+    )
+
+
+class Decoder(Protocol):
+    def decompress(self, __data: bytes) -> bytes:
+        ...
+
+    def flush(self) -> bytes:
+        ...
+
+
+class BrotliDecoder:
+    """Adapt brotli's decompressor to the interface of zlib's decompressor"""
+
+    def __init__(self) -> None:
+        self._decompressor = brotli.Decompressor()
+
+    def decompress(self, data: bytes) -> bytes:
+        return self._decompressor.process(data)
+
+    def flush(self) -> bytes:
+        return b""
+
+
+def create_decoder(content_encoding: str) -> Optional[Decoder]:
+    """
+    Create an incremental decoder for the content encoding. Return None for identity
+    encoding.
+    """
+
+    content_encoding = content_encoding.strip().lower()
+
+    if content_encoding in ("", "identity"):
+        return None
+    elif content_encoding == "gzip":
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif content_encoding == "deflate":
+        return zlib.decompressobj(zlib.MAX_WBITS)
+    elif content_encoding == "br" and brotli:
+        return BrotliDecoder()
+    else:
+        raise ValueError(f"Unsupported content encoding: {content_encoding}")
+
+
+class MarkerScanner:
+    """
+    Incrementally scan a growing buffer for a sequence of markers, which should be
+    found in order.
+    """
+
+    def __init__(self, markers: Sequence[bytes]) -> None:
+        self._markers = markers
+        self._index = 0
+        # Where the search of the current marker resumes
+        self._start = 0
+        self._end = 0
+
+    @property
+    def done(self) -> bool:
+        """Whether all the markers are found"""
+        return self._index >= len(self._markers)
+
+    @property
+    def end(self) -> int:
+        """The end position of the last found marker in the buffer"""
+        return self._end
+
+    def scan(self, buffer: bytes | bytearray) -> bool:
+        """Scan the newly appended part of the buffer. Return whether all are found."""
+
+        while not self.done:
+            marker = self._markers[self._index]
+            found = buffer.find(marker, self._start)
+
+            if found < 0:
+                # The marker may be split across the end of the buffer
+                self._start = max(len(buffer) - len(marker) + 1, self._start)
+                break
+
+            self._index += 1
+            self._start = self._end = found + len(marker)
+
+        return self.done
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import json
+from datetime import date, datetime
+from typing import Any, Union
+
+
+try:
+    import orjson
+except ModuleNotFoundError:
+    orjson = None
+
+
+__all__ = [
+    "loads",
+    "dumps",
+    "strip_jsonp",
+    "parse_date",
+    "parse_datetime",
+    "parse_minute_datetime",
+]
+
+
+def stdlib_default(o: Any) -> str:
+    if isinstance(o, (date, datetime)):
+        return o.isoformat()
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+
+    def loads(data: Union[str, bytes]) -> Any:
+        """Decode JSON, with orjson if it's installed, or else the stdlib"""
+        return orjson.loads(data)
+
+    def dumps(obj: Any) -> bytes:
+        """
+        Encode as JSON, with orjson if it's installed, or else the stdlib. Dates and
+        datetimes are encoded in ISO format. Non-ASCII characters are not escaped.
+        """
+        return orjson.dumps(obj)
+
+else:
+
+    def loads(data: Union[str, bytes]) -> Any:
+        """Decode JSON, with orjson if it's installed, or else the stdlib"""
+        return json.loads(data)
+
+    def dumps(obj: Any) -> bytes:
+        """
+        Encode as JSON, with orjson if it's installed, or else the stdlib. Dates and
+        datetimes are encoded in ISO format. Non-ASCII characters are not escaped.
+        """
+        return json.dumps(
+            obj, ensure_ascii=False, separators=(",", ":"), default=stdlib_default
+        ).encode()
+
+
+def strip_jsonp(text: str, callback: str) -> str:
+    """
+    Strip the JSONP wrapper, i.e., `callback(...);`, by slicing, which is much cheaper
+    than matching a regular expression over the whole text.
+    """
+
+    start = len(callback) + 1
+    end = text.rfind(")")
+
+    if (
+        not text.startswith(callback)
+        or text[start - 1 : start] != "("
+        or end < start
+        or text[end + 1 :].strip() not in ("", ";")
+    ):
+        raise ValueError(f"Not a JSONP response of callback {callback}: {text[:50]!r}")
+
+    return text[start:end]
+
+
+DATE_FORMAT_LENGTH = len("YYYY-MM-DD")
+MINUTE_DATETIME_FORMAT_LENGTH = len("YYYY-MM-DD HH:MM")
+
+
+def parse_date(s: str) -> date:
+    """
+    Parse a date of fixed format YYYY-MM-DD. It's many times faster than
+    `datetime.strptime()`, which interprets the format string on every call.
+    """
+
+    if len(s) != DATE_FORMAT_LENGTH:
+        raise ValueError(f"Not a date of format YYYY-MM-DD: {s!r}")
+    return date.fromisoformat(s)
+
+
+def parse_minute_datetime(s: str) -> datetime:
+    """
+    Parse a datetime of fixed format YYYY-MM-DD HH:MM. It's many times faster than
+    `datetime.strptime()`, which interprets the format string on every call.
+    """
+
+    if len(s) != MINUTE_DATETIME_FORMAT_LENGTH or s[10] != " ":
+        raise ValueError(f"Not a datetime of format YYYY-MM-DD HH:MM: {s!r}")
+    return datetime.fromisoformat(s)
+
+
+def parse_datetime(s: str) -> datetime:
+    """Parse a datetime in ISO format, as encoded by `dumps()`"""
+    return datetime.fromisoformat(s)
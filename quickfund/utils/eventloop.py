@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Literal
+
+
+try:
+    import uvloop
+except ModuleNotFoundError:
+    uvloop = None
+
+
+__all__ = ["EventLoopKind", "set_event_loop_kind", "get_event_loop_kind"]
+
+
+EventLoopKind = Literal["asyncio", "uvloop"]
+
+# The process-wide event loop kind, set by `set_event_loop_kind()`
+event_loop_kind: EventLoopKind = "asyncio"
+
+
+def set_event_loop_kind(kind: EventLoopKind) -> None:
+    """
+    Set the process-wide kind of event loops created afterwards, e.g., by
+    `asyncio.run()`.
+
+    `asyncio`: The event loop of the standard library.
+    `uvloop`: The event loop of uvloop, a drop-in replacement built on libuv. It's
+        optional, and unavailable on Windows. No benefit of it is measured by
+        `benchmarks/bench_event_loop.py` beyond noise.
+    """
+
+    global event_loop_kind
+
+    if kind == "uvloop":
+        if uvloop is None:
+            raise RuntimeError("uvloop 未安装，请先安装 uvloop，或使用 asyncio 事件循环")
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    else:
+        asyncio.set_event_loop_policy(None)
+
+    event_loop_kind = kind
+
+
+def get_event_loop_kind() -> EventLoopKind:
+    """Get the process-wide event loop kind, e.g., to pass on to worker processes"""
+    return event_loop_kind
@@ -0,0 +1,239 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import math
+import os
+import sys
+import time
+from collections.abc import Awaitable, Iterable, Iterator
+from types import TracebackType
+from typing import Literal, Optional, TextIO, TypeVar
+
+from colorama import Fore, Style
+
+
+__all__ = ["Progress", "set_progress_mode", "penumerate", "pgather"]
+
+
+T = TypeVar("T")
+
+
+ProgressMode = Literal["auto", "bar", "json", "off"]
+
+# The process-wide progress mode, set by `set_progress_mode()`
+progress_mode: ProgressMode = "auto"
+
+
+def set_progress_mode(mode: ProgressMode) -> None:
+    """
+    Set the process-wide progress mode.
+
+    `bar`: Render a progress bar.
+    `json`: Emit progress events as JSON lines, for consumption by other programs.
+    `off`: Report no progress.
+    `auto`: Render a progress bar if the stream is a terminal, otherwise emit JSON.
+    """
+
+    global progress_mode
+    progress_mode = mode
+
+
+# Refer to https://github.com/tqdm/tqdm/issues/454
+BAR_CHARS = "#" if os.name == "nt" else "█"
+
+BAR_WIDTH = 20
+
+
+def format_interval(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours:d}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes:02d}:{seconds:02d}"
+
+
+class Progress:
+    """
+    A low-overhead progress reporter.
+
+    Updating is cheap: it only bumps a counter, until a batch of updates has been
+    counted. Only then is the clock read, and the progress rendered if the last render
+    is at least `min_interval` seconds ago. The batch size adapts to the update rate,
+    so that the clock is read about a few times per render interval, no matter how
+    fast updates come.
+
+    Progress is rendered as a progress bar on terminals, and as JSON lines of events
+    otherwise, whose fields are `event` ("start", "progress" or "end"), `desc`, `unit`,
+    `n`, `total`, `elapsed` (in seconds) and `rate` (in units per second).
+    """
+
+    def __init__(
+        self,
+        total: Optional[int] = None,
+        desc: str = "",
+        unit: str = "it",
+        min_interval: float = None,
+        mode: ProgressMode = None,
+        stream: TextIO = None,
+    ) -> None:
+        """
+        `min_interval` defaults to 0.1 seconds for progress bar, and 1 second for JSON.
+        `mode` defaults to the process-wide progress mode. `stream` defaults to stderr.
+        """
+
+        stream = stream or sys.stderr
+        mode = mode or progress_mode
+        if mode == "auto":
+            mode = "bar" if stream.isatty() else "json"
+
+        self.total = total
+        self.desc = desc
+        self.unit = unit
+        self.n = 0
+
+        self._mode = mode
+        self._stream = stream
+        self._min_interval = (
+            min_interval if min_interval is not None else 0.1 if mode == "bar" else 1
+        )
+        self._start = self._last_render = time.perf_counter()
+        self._last_render_n = 0
+        # Check whether to render when the counter reaches this value
+        self._next_check = math.inf if mode == "off" else 1
+        self._batch = 1
+        self._closed = False
+
+        if mode == "bar":
+            self._stream.write(Style.BRIGHT + Fore.GREEN + "\n")
+            self._render(self._start)
+        elif mode == "json":
+            self._emit("start", self._start)
+
+    def update(self, n: int = 1) -> None:
+        self.n += n
+        if self.n >= self._next_check:
+            self._check()
+
+    def _check(self) -> None:
+        now = time.perf_counter()
+        since_render = now - self._last_render
+
+        if since_render > 0:
+            # Aim at checking the clock about four times per render interval
+            rate = (self.n - self._last_render_n) / since_render
+            self._batch = max(int(rate * self._min_interval / 4), 1)
+
+        if since_render >= self._min_interval:
+            self._last_render = now
+            self._last_render_n = self.n
+            self._render(now)
+
+        self._next_check = self.n + self._batch
+
+    def _render(self, now: float) -> None:
+        if self._mode == "bar":
+            self._stream.write("\r" + self._format_bar(now))
+            self._stream.flush()
+        elif self._mode == "json":
+            self._emit("progress", now)
+
+    def _format_bar(self, now: float) -> str:
+        elapsed = now - self._start
+        rate = self.n / elapsed if elapsed else 0
+        rate_str = f"{rate:.2f}{self.unit}/s" if rate else f"?{self.unit}/s"
+
+        if not self.total:
+            return (
+                f"{self.desc}: {self.n}{self.unit} "
+                f"[{format_interval(elapsed)}, {rate_str}]"
+            )
+
+        fraction = min(self.n / self.total, 1)
+        filled = int(fraction * BAR_WIDTH)
+        bar = BAR_CHARS * filled + " " * (BAR_WIDTH - filled)
+        remaining = (self.total - self.n) / rate if rate else 0
+
+        return (
+            f"{self.desc}: {fraction:4.0%}|{bar}| {self.n}/{self.total} "
+            f"[{format_interval(elapsed)}<{format_interval(remaining)}, {rate_str}]"
+        )
+
+    def _emit(self, event: str, now: float) -> None:
+        elapsed = now - self._start
+        record = {
+            "event": event,
+            "desc": self.desc,
+            "unit": self.unit,
+            "n": self.n,
+            "total": self.total,
+            "elapsed": round(elapsed, 3),
+            "rate": round(self.n / elapsed, 3) if elapsed else None,
+        }
+        self._stream.write(json.dumps(record) + "\n")
+        self._stream.flush()
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+
+        now = time.perf_counter()
+
+        if self._mode == "bar":
+            self._stream.write("\r" + self._format_bar(now) + "\n" + Style.RESET_ALL)
+            self._stream.flush()
+        elif self._mode == "json":
+            self._emit("end", now)
+
+    def __enter__(self) -> Progress:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] = None,
+        exc_value: BaseException = None,
+        traceback: TracebackType = None,
+    ) -> None:
+        self.close()
+
+
+def penumerate(
+    iterable: Iterable[T],
+    start: int = 0,
+    total: int = None,
+    desc: str = "",
+    unit: str = "it",
+    disable: bool = False,
+) -> Iterator[tuple[int, T]]:
+    """Like `enumerate()`, with progress reported"""
+
+    if disable:
+        yield from enumerate(iterable, start)
+        return
+
+    if total is None and hasattr(iterable, "__len__"):
+        total = len(iterable)  # type: ignore
+
+    with Progress(total, desc, unit) as progress:
+        for item in enumerate(iterable, start):
+            yield item
+            progress.update()
+
+
+async def pgather(
+    *aws: Awaitable[T], desc: str = "", unit: str = "it", disable: bool = False
+) -> list[T]:
+    """Like `asyncio.gather()`, with progress reported"""
+
+    if disable:
+        return await asyncio.gather(*aws)
+
+    with Progress(len(aws), desc, unit) as progress:
+
+        async def track(aw: Awaitable[T]) -> T:
+            result = await aw
+            progress.update()
+            return result
+
+        return await asyncio.gather(*map(track, aws))
@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import socket
+from collections.abc import Sequence
+from types import TracebackType
+from typing import Union, cast
+from urllib.parse import unquote, urlsplit
+
+
+__all__ = ["RESPClient", "RESPError", "Reply", "Argument"]
+
+
+Reply = Union[None, int, bytes, str, list["Reply"]]
+Argument = Union[str, bytes, int, float]
+
+
+class RESPError(RuntimeError):
+    """An error reply from the server"""
+
+
+class RESPClient:
+    """
+    A minimal synchronous client of the Redis serialization protocol (RESP), which is
+    spoken by Redis and many compatible key-value servers.
+
+    Commands are sent as arrays of bulk strings. Pipelining is supported to save round
+    trips. It's not thread-safe.
+    """
+
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = 6379,
+        db: int = 0,
+        password: str = None,
+        username: str = None,
+        timeout: float = 10,
+    ) -> None:
+
+        self._sock = socket.create_connection((host, port), timeout=timeout)
+        self._reader = self._sock.makefile("rb")
+
+        if password is not None:
+            if username is not None:
+                self.execute("AUTH", username, password)
+            else:
+                self.execute("AUTH", password)
+
+        if db:
+            self.execute("SELECT", db)
+
+    __slots__ = ["_sock", "_reader"]
+
+    @classmethod
+    def from_url(cls, url: str, timeout: float = 10) -> RESPClient:
+        """
+        Create a client from a URL of form
+        `redis://[[username]:password@]host[:port][/db]`.
+        """
+
+        parts = urlsplit(url)
+
+        if parts.scheme != "redis":
+            raise ValueError(f"Unsupported URL scheme: {parts.scheme}")
+
+        db = int(parts.path.lstrip("/") or 0)
+        password = unquote(parts.password) if parts.password is not None else None
+        username = unquote(parts.username) if parts.username else None
+
+        return cls(
+            parts.hostname or "localhost",
+            parts.port or 6379,
+            db=db,
+            password=password,
+            username=username,
+            timeout=timeout,
+        )
+
+    def close(self) -> None:
+        self._reader.close()
+        self._sock.close()
+
+    def __enter__(self) -> RESPClient:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] = None,
+        exc_value: BaseException = None,
+        traceback: TracebackType = None,
+    ) -> None:
+        self.close()
+
+    def execute(self, *command: Argument) -> Reply:
+        """Send a command and return its reply. Raise `RESPError` on error reply."""
+        return self.pipeline([command])[0]
+
+    def pipeline(self, commands: Sequence[Sequence[Argument]]) -> list[Reply]:
+        """
+        Send the commands in one go, and then read their replies in order. Raise
+        `RESPError` on the first error reply, after all the replies are read.
+        """
+
+        if not commands:
+            return []
+
+        self._sock.sendall(b"".join(map(encode_command, commands)))
+
+        replies = [self._read_reply() for _ in commands]
+
+        for reply in replies:
+            if isinstance(reply, RESPError):
+                raise reply
+
+        return cast(list[Reply], replies)
+
+    def _read_line(self) -> bytes:
+        line = self._reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("Connection closed by the server")
+        return line[:-2]
+
+    def _read_reply(self) -> Union[Reply, RESPError]:
+
+        line = self._read_line()
+        prefix, payload = line[:1], line[1:]
+
+        if prefix == b"+":
+            return payload.decode()
+
+        elif prefix == b"-":
+            return RESPError(payload.decode())
+
+        elif prefix == b":":
+            return int(payload)
+
+        elif prefix == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            data = self._reader.read(length + 2)
+            if len(data) != length + 2:
+                raise ConnectionError("Connection closed by the server")
+            return data[:-2]
+
+        elif prefix == b"*":
+            length = int(payload)
+            if length < 0:
+                return None
+            # Errors nested in arrays, e.g. replies of EXEC, are returned as they are
+            return [self._read_reply() for _ in range(length)]  # type: ignore
+
+        else:
+            raise ValueError(f"Unexpected reply from the server: {line!r}")
+
+
+def encode_argument(argument: Argument) -> bytes:
+    if isinstance(argument, bytes):
+        return argument
+    return str(argument).encode()
+
+
+def encode_command(command: Sequence[Argument]) -> bytes:
+    """Encode a command as a RESP array of bulk strings"""
+
+    chunks = [b"*%d\r\n" % len(command)]
+
+    for argument in map(encode_argument, command):
+        chunks.append(b"$%d\r\n%s\r\n" % (len(argument), argument))
+
+    return b"".join(chunks)
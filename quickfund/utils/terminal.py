@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import sys
+import unicodedata
+from collections.abc import Sequence
+from typing import Literal, TextIO
+
+
+__all__ = ["display_width", "pad", "TerminalTable"]
+
+
+CSI = "\x1b["
+
+
+def char_width(char: str) -> int:
+    return 2 if unicodedata.east_asian_width(char) in "WF" else 1
+
+
+def display_width(s: str) -> int:
+    """The number of columns the string occupies on terminal, e.g., CJK take two"""
+    return sum(map(char_width, s))
+
+
+def pad(s: str, width: int, align: Literal["left", "right"] = "left") -> str:
+    """Pad the string to the display width, truncating it if it's wider"""
+
+    if display_width(s) > width:
+        truncated, used = [], 0
+        for char in s:
+            if used + char_width(char) > width - 1:
+                break
+            truncated.append(char)
+            used += char_width(char)
+        s = "".join(truncated) + "…"
+
+    padding = " " * (width - display_width(s))
+    return s + padding if align == "left" else padding + s
+
+
+class TerminalTable:
+    """
+    A table drawn on terminal, which is redrawn in place with only the changed cells
+    rewritten, so that a refresh costs output proportional to the change.
+
+    The table takes over the screen, with the header at the first line, the rows below
+    it, and a status line after a blank line.
+    """
+
+    def __init__(
+        self, columns: Sequence[tuple[str, int]], stream: TextIO = None
+    ) -> None:
+        """
+        `columns` are pairs of column header and column display width.
+        `stream` defaults to stdout.
+        """
+
+        self._columns = columns
+        self._stream = stream or sys.stdout
+        self._offsets = []
+        offset = 1
+        for _, width in columns:
+            self._offsets.append(offset)
+            offset += width + 1
+
+        # The cells currently on screen. None before the first draw.
+        self._screen: list[list[str]] = None  # type: ignore
+        self._status = ""
+
+    __slots__ = ["_columns", "_stream", "_offsets", "_screen", "_status"]
+
+    def _move(self, line: int, column: int) -> str:
+        return f"{CSI}{line};{column}H"
+
+    def _cell(self, line: int, col: int, text: str) -> str:
+        return self._move(line, self._offsets[col]) + text
+
+    def draw(self, rows: Sequence[Sequence[str]], status: str) -> None:
+        """
+        Draw the rows, whose cells are already padded to the column widths, and may
+        contain color codes. Only cells different from those on screen are rewritten.
+        """
+
+        out = []
+
+        if self._screen is None:
+            # Clear screen, and hide cursor
+            out.append(f"{CSI}2J{CSI}?25l")
+            for col, (header, width) in enumerate(self._columns):
+                out.append(self._cell(1, col, pad(header, width)))
+            self._screen = []
+
+        screen = self._screen
+
+        if len(rows) != len(screen):
+            # The status line moves with the number of rows
+            out.append(self._move(len(screen) + 3, 1) + f"{CSI}2K")
+            self._status = ""
+
+        for r, row in enumerate(rows):
+            line = r + 2
+            if r >= len(screen):
+                screen.append([""] * len(row))
+            for c, cell in enumerate(row):
+                if screen[r][c] != cell:
+                    out.append(self._cell(line, c, cell))
+                    screen[r][c] = cell
+
+        # Clear the lines of the rows gone
+        if len(rows) < len(screen):
+            for line in range(len(rows) + 2, len(screen) + 2):
+                out.append(self._move(line, 1) + f"{CSI}2K")
+            del screen[len(rows) :]
+
+        if status != self._status:
+            status_line = len(rows) + 3
+            out.append(self._move(status_line, 1) + f"{CSI}2K" + status)
+            self._status = status
+
+        if out:
+            self._stream.write("".join(out))
+            self._stream.flush()
+
+    def close(self) -> None:
+        """Move the cursor below the table, and show cursor"""
+
+        if self._screen is None:
+            return
+
+        self._stream.write(self._move(len(self._screen) + 4, 1) + f"{CSI}?25h")
+        self._stream.flush()
@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections.abc import Sequence
+from datetime import datetime
+
+from colorama import Fore, Style
+
+from .fetcher import FundInfoFetcher
+from .models import FundEstimateInfo
+from .session import SessionConfig
+from .utils.terminal import TerminalTable, pad
+
+
+__all__ = ["watch_estimates"]
+
+
+# Pairs of column header and column display width
+WATCH_COLUMNS = [
+    ("基金代码", 8),
+    ("基金名称", 26),
+    ("估算时间", 8),
+    ("实时估值", 10),
+    ("估算增长率", 10),
+]
+
+
+def colorize_growth_rate(text: str, growth_rate: float) -> str:
+    # Red for rise and green for fall, as is the convention in China
+    if growth_rate > 0:
+        return Fore.RED + text + Style.RESET_ALL
+    if growth_rate < 0:
+        return Fore.GREEN + text + Style.RESET_ALL
+    return text
+
+
+def format_row(fund_code: str, estimate_info: FundEstimateInfo = None) -> list[str]:
+    widths = [width for _, width in WATCH_COLUMNS]
+
+    if estimate_info is None:
+        values = [fund_code, "-", "-", "-", "-"]
+        return [pad(value, width) for value, width in zip(values, widths)]
+
+    growth_rate = estimate_info.估算增长率
+    return [
+        pad(fund_code, widths[0]),
+        pad(estimate_info.基金名称, widths[1]),
+        pad(estimate_info.估算日期.strftime("%H:%M"), widths[2]),
+        pad(f"{estimate_info.实时估值:.4f}", widths[3], "right"),
+        colorize_growth_rate(
+            pad(f"{growth_rate:+.2%}", widths[4], "right"), growth_rate
+        ),
+    ]
+
+
+def format_rows(
+    fund_codes: Sequence[str], estimate_infos: dict[str, FundEstimateInfo]
+) -> list[list[str]]:
+    """Format the rows, sorted by estimate growth rate, with funds not yet got last"""
+
+    got = sorted(
+        (code for code in fund_codes if code in estimate_infos),
+        key=lambda code: estimate_infos[code].估算增长率,
+        reverse=True,
+    )
+    not_got = [code for code in fund_codes if code not in estimate_infos]
+
+    return [
+        *(format_row(code, estimate_infos[code]) for code in got),
+        *(format_row(code) for code in not_got),
+    ]
+
+
+async def watch_estimates(
+    fund_codes: Sequence[str],
+    interval: float,
+    session_config: SessionConfig = SessionConfig(),
+    table: TerminalTable = None,
+) -> None:
+    """
+    Poll the estimate infos of the funds every `interval` seconds, and redraw the
+    changed cells of a terminal table, sorted by estimate growth rate, until cancelled.
+
+    Only the estimate endpoint is polled, with one fetcher kept open throughout, so
+    that each refresh costs one request per fund over warm connections.
+
+    If a fund fails to be fetched, its last estimate info is kept on display.
+    """
+
+    table = table or TerminalTable(WATCH_COLUMNS)
+    estimate_infos: dict[str, FundEstimateInfo] = {}
+
+    # Results must not be reused across refreshes
+    async with FundInfoFetcher(
+        result_ttl=0, session_config=session_config
+    ) as fund_info_fetcher:
+        try:
+            await fund_info_fetcher.warm_up()
+
+            while True:
+                start = time.perf_counter()
+
+                results = await asyncio.gather(
+                    *map(fund_info_fetcher.fetch_estimate, fund_codes),
+                    return_exceptions=True,
+                )
+
+                failures = 0
+                for fund_code, result in zip(fund_codes, results):
+                    if isinstance(result, FundEstimateInfo):
+                        estimate_infos[fund_code] = result
+                    else:
+                        failures += 1
+
+                status = f"更新于 {datetime.now():%H:%M:%S}，每 {interval:g} 秒刷新"
+                if failures:
+                    status += f"，{failures} 个基金获取失败"
+                status += "，按 Ctrl-C 退出"
+
+                table.draw(format_rows(fund_codes, estimate_infos), status)
+
+                await asyncio.sleep(max(interval - (time.perf_counter() - start), 0))
+
+        finally:
+            table.close()
@@ -1,81 +1,497 @@
+from __future__ import annotations
+
+import csv
+import math
+from collections.abc import Collection, Mapping, Sequence
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
 from pathlib import Path
+from types import TracebackType
+from typing import Any, Optional
 
+import attr
 import xlsxwriter
+from xlsxwriter.worksheet import Worksheet
 
-from .models import FundInfo
-from .utils.tqdm import tenumerate
+from .manifest import RowDiff, RowManifest
+from .models import FundInfo, Section, sections_of
 from .utils.misc import Logger, on_failure_raises
+from .utils.progress import penumerate
 
 
-__all__ = ["write_to_xlsx"]
+__all__ = [
+    "Increment",
+    "plan_increment",
+    "select_schema",
+    "WorkbookBuilder",
+    "write_to_xlsx",
+    "write_portfolios_to_xlsx",
+    "write_many_to_xlsx",
+]
 
 
-@on_failure_raises(RuntimeError, "获取基金信息并写入 Excel 文档 {xlsx_filename} 的时候发生错误")
-def write_to_xlsx(
+SCHEMA: list[dict[str, Any]] = [
+    {"name": "基金名称", "width": 22},
+    {"name": "基金代码"},
+    {"name": "上一天净值日期", "width": 14, "format": {"num_format": "yyyy-mm-dd"}},
+    {"name": "上一天净值", "width": 10, "format": {"bg_color": "yellow"}},
+    {"name": "净值日期", "width": 13, "format": {"num_format": "yyyy-mm-dd"}},
+    {"name": "单位净值", "format": {"bg_color": "yellow"}},
+    {"name": "日增长率", "format": {"num_format": "0.00%"}},
+    {"name": "估算日期", "width": 17, "format": {"num_format": "yyyy-mm-dd hh:mm"}},
+    {"name": "实时估值", "width": 11, "format": {"bg_color": "B4D6E4"}},
+    {"name": "估算增长率", "width": 11, "format": {"num_format": "0.00%"}},
+    {"name": "分红送配"},
+    {"name": "近1周同类排名", "width": 13},
+    {"name": "近1月同类排名", "width": 13},
+    {"name": "近3月同类排名", "width": 13},
+    {"name": "近6月同类排名", "width": 13},
+    {"name": "今年来同类排名", "width": 13},
+    {"name": "近1年同类排名", "width": 13},
+    {"name": "近2年同类排名", "width": 13},
+    {"name": "近3年同类排名", "width": 13},
+]
+
+FUND_CODE_COLUMN_NAME = "基金代码"
+
+CHANGE_SHEET_NAME = "变化"
+CHANGE_KIND_COLUMN = "变化类型"
+
+
+def select_schema(columns: Sequence[str]) -> list[dict[str, Any]]:
+    """
+    Select the fields of the schema by column names, in the given order. The fund code
+    column is always selected, at first if not given, since it identifies the rows.
+    """
+
+    fields = {field["name"]: field for field in SCHEMA}
+
+    unknown = [column for column in columns if column not in fields]
+    if unknown:
+        raise ValueError(
+            f"未知的列：{'、'.join(unknown)}，可选的列有：{'、'.join(fields)}"
+        )
+
+    columns = list(dict.fromkeys(columns))
+    if FUND_CODE_COLUMN_NAME not in columns:
+        columns.insert(0, FUND_CODE_COLUMN_NAME)
+
+    return [fields[column] for column in columns]
+
+
+def fund_code_column(schema: Sequence[dict[str, Any]]) -> int:
+    return [field["name"] for field in schema].index(FUND_CODE_COLUMN_NAME)
+
+
+@attr.s(auto_attribs=True)
+class Increment:
+    """
+    A dataclass to represent an incremental update of an Excel document.
+
+    `manifest`: The manifest of the new version, saved after the document is written.
+    `diff`: The difference from the previous version. None if there is no previous
+        version.
+    `delta`: The forms in which the difference is additionally written. "sheet" for an
+        extra worksheet in the document, and "csv" for a sidecar CSV file.
+    """
+
+    manifest: RowManifest
+    diff: Optional[RowDiff]
+    delta: Collection[str] = ()
+
+    @property
+    def unchanged(self) -> bool:
+        return self.diff is not None and not self.diff
+
+
+def plan_increment(
     fund_infos: list[FundInfo],
     xlsx_filename: Path,
-    logger: Logger = Logger.null_logger(),
+    delta: Collection[str] = (),
+    schema: Sequence[dict[str, Any]] = SCHEMA,
+    stale: Mapping[str, Collection[Section]] = None,
+) -> Increment:
+    """
+    Compare the fund infos with the manifest of the existing Excel document, to plan an
+    incremental update. `stale` is as of `WorkbookBuilder`, since stale sections are
+    formatted differently.
+    """
+
+    manifest = RowManifest.of(fund_infos, schema, LAYOUT_FORMATS, stale)
+
+    diff = None
+    if xlsx_filename.is_file():
+        previous = RowManifest.load(RowManifest.path_for(xlsx_filename))
+        if previous is not None:
+            diff = previous.diff(manifest)
+
+    return Increment(manifest, diff, delta)
+
+
+def change_rows(
+    fund_infos: list[FundInfo], diff: RowDiff
+) -> list[tuple[str, str, Optional[FundInfo]]]:
+    """
+    Return the rows of the difference, as triples of change kind, fund code and fund
+    info. The fund info of a removed row is None.
+    """
+
+    table = {fund_info.基金代码: fund_info for fund_info in fund_infos}
+
+    return [
+        *(("新增", code, table[code]) for code in diff.added),
+        *(("变化", code, table[code]) for code in diff.changed),
+        *(("删除", code, None) for code in diff.removed),
+    ]
+
+
+def write_delta_csv(
+    rows: list[tuple[str, str, Optional[FundInfo]]],
+    csv_filename: Path,
+    schema: Sequence[dict[str, Any]] = SCHEMA,
 ) -> None:
+
+    # Encode with BOM so that Excel recognizes the encoding
+    with open(csv_filename, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow([CHANGE_KIND_COLUMN, *(field["name"] for field in schema)])
+
+        for kind, fund_code, fund_info in rows:
+            if fund_info is None:
+                values = [""] * len(schema)
+                values[fund_code_column(schema)] = fund_code
+            else:
+                values = [getattr(fund_info, field["name"]) for field in schema]
+            writer.writerow([kind, *values])
+
+
+SUMMARY_SHEET_NAME = "汇总"
+
+SUMMARY_SCHEMA: list[dict[str, Any]] = [
+    {"name": "组合", "width": 22},
+    {"name": "基金数量", "width": 10},
+    {"name": "平均日增长率", "width": 13, "format": {"num_format": "0.00%"}},
+    {"name": "平均估算增长率", "width": 15, "format": {"num_format": "0.00%"}},
+    {"name": "估算上涨数量", "width": 13},
+    {"name": "估算下跌数量", "width": 13},
+]
+
+HEADER_FORMAT = dict(bold=True, align="center", valign="top", border=1)
+
+# Overlaid on the format of cells of stale sections, i.e., served from the cache since
+# they were not refreshed before the deadline
+STALE_FORMAT = dict(font_color="gray", italic=True)
+
+# Bump it on changes to how cells are written, other than by the formats, e.g., of
+# placeholder values, so that documents of incremental runs are regenerated
+RENDERING_VERSION = 1
+
+# The formats of the document other than those of the schema, recorded in the manifest
+LAYOUT_FORMATS = {
+    "header": HEADER_FORMAT,
+    "stale": STALE_FORMAT,
+    "rendering": RENDERING_VERSION,
+}
+
+# Characters not allowed in worksheet names
+INVALID_SHEET_NAME_CHARS = str.maketrans({c: "_" for c in "[]:*?/\\"})
+
+MAX_SHEET_NAME_LENGTH = 31
+
+
+def is_placeholder(value: Any) -> bool:
+    """Check if the value is of a placeholder section, i.e., never fetched"""
+    if isinstance(value, float):
+        return math.isnan(value)
+    return value in (date.min, datetime.min)
+
+
+def mean(values: Sequence[float]) -> Optional[float]:
+    """The mean of the values, ignoring NaN, e.g., of sections not fetched"""
+    values = [value for value in values if not math.isnan(value)]
+    return sum(values) / len(values) if values else None
+
+
+class WorkbookBuilder:
     """
-    Structuralize a list of fund infos to an Excel document.
+    A builder of an Excel document of fund infos, with one or more worksheets.
 
-    Input: a list of fund infos, and an Excel filename.
+    The formats of the schema are compiled once per workbook, and shared by all the
+    worksheets. The workbook is written in constant memory mode, where each row is
+    flushed to disk as soon as the next row is started, so that memory usage doesn't
+    grow with the size of the report. Hence worksheets must be written one at a time,
+    row by row.
+
+    Fund infos are written in the columns of `schema`, a selection of `SCHEMA`.
+
+    `stale`: A mapping from fund codes to their stale sections, whose cells are grayed
+        out in italics. Cells of placeholder sections, never fetched, are left blank.
     """
 
-    # TODO profile to see whether and how much setting constant_memory improves
-    # performance.
-    with xlsxwriter.Workbook(xlsx_filename) as workbook:
-
-        logger.log("新建 Excel 文档......")
-        worksheet = workbook.add_worksheet()
-
-        schema = [
-            {"name": "基金名称", "width": 22},
-            {"name": "基金代码"},
-            {"name": "上一天净值日期", "width": 14, "format": {"num_format": "yyyy-mm-dd"}},
-            {"name": "上一天净值", "width": 10, "format": {"bg_color": "yellow"}},
-            {"name": "净值日期", "width": 13, "format": {"num_format": "yyyy-mm-dd"}},
-            {"name": "单位净值", "format": {"bg_color": "yellow"}},
-            {"name": "日增长率", "format": {"num_format": "0.00%"}},
-            {"name": "估算日期", "width": 17, "format": {"num_format": "yyyy-mm-dd hh:mm"}},
-            {"name": "实时估值", "width": 11, "format": {"bg_color": "B4D6E4"}},
-            {"name": "估算增长率", "width": 11, "format": {"num_format": "0.00%"}},
-            {"name": "分红送配"},
-            {"name": "近1周同类排名", "width": 13},
-            {"name": "近1月同类排名", "width": 13},
-            {"name": "近3月同类排名", "width": 13},
-            {"name": "近6月同类排名", "width": 13},
-            {"name": "今年来同类排名", "width": 13},
-            {"name": "近1年同类排名", "width": 13},
-            {"name": "近2年同类排名", "width": 13},
-            {"name": "近3年同类排名", "width": 13},
+    def __init__(
+        self,
+        xlsx_filename: Path,
+        schema: Sequence[dict[str, Any]] = SCHEMA,
+        constant_memory: bool = True,
+        stale: Mapping[str, Collection[Section]] = None,
+    ) -> None:
+
+        self._workbook = xlsxwriter.Workbook(
+            str(xlsx_filename), {"constant_memory": constant_memory}
+        )
+        self._sheet_names: set[str] = set()
+        self._schema = schema
+
+        self._header_format = self._workbook.add_format(HEADER_FORMAT)
+        # Judging from source code of xlsxwriter, add_format(None) is equivalent to
+        # default format.
+        self._cell_formats = [
+            self._workbook.add_format(field.get("format")) for field in schema
+        ]
+        self._stale_cell_formats = [
+            self._workbook.add_format({**field.get("format", {}), **STALE_FORMAT})
+            for field in schema
         ]
+        self._column_sections = [sections_of([field["name"]]) for field in schema]
+        self._stale = stale or {}
+        self._summary_formats = [
+            self._workbook.add_format(field.get("format")) for field in SUMMARY_SCHEMA
+        ]
+
+    __slots__ = [
+        "_workbook",
+        "_sheet_names",
+        "_schema",
+        "_header_format",
+        "_cell_formats",
+        "_stale_cell_formats",
+        "_column_sections",
+        "_stale",
+        "_summary_formats",
+    ]
 
-        logger.log("调整列宽......")
-        for col, field in enumerate(schema):
+    def close(self) -> None:
+        self._workbook.close()
+
+    def __enter__(self) -> WorkbookBuilder:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] = None,
+        exc_value: BaseException = None,
+        traceback: TracebackType = None,
+    ) -> None:
+        self.close()
+
+    def _add_worksheet(self, name: str = None) -> Worksheet:
+        """Add a worksheet, with the name sanitized and deduplicated if given"""
+
+        if name is None:
+            return self._workbook.add_worksheet()
+
+        name = name.translate(INVALID_SHEET_NAME_CHARS)[:MAX_SHEET_NAME_LENGTH] or "_"
+        base, suffix = name, 1
+        while name.lower() in self._sheet_names:
+            suffix += 1
+            tag = f"_{suffix}"
+            name = base[: MAX_SHEET_NAME_LENGTH - len(tag)] + tag
+        self._sheet_names.add(name.lower())
+
+        return self._workbook.add_worksheet(name)
+
+    def _write_header(
+        self, worksheet: Worksheet, schema: Sequence[dict[str, Any]], start: int = 0
+    ) -> None:
+
+        for col, field in enumerate(schema, start):
             # FIXME Despite the xlsxwriter doc saying that set_column(i, i, None) doesn't
             # change the column width, some simple tests show that it does. The source
             # code of xlsxwriter is too complex that I can't figure out where the
             # bug originates.
             worksheet.set_column(col, col, field.get("width"))
 
-        header_format = workbook.add_format(
-            dict(bold=True, align="center", valign="top", border=1)
-        )
+        for col, field in enumerate(schema, start):
+            worksheet.write_string(0, col, field["name"], self._header_format)
 
-        logger.log("写入文档头......")
-        for col, field in enumerate(schema):
-            worksheet.write_string(0, col, field["name"], header_format)
+    def _write_fund_info(
+        self, worksheet: Worksheet, row: int, fund_info: FundInfo, start: int = 0
+    ) -> None:
+
+        stale = self._stale.get(fund_info.基金代码, ())
+
+        for col, field in enumerate(self._schema):
+            value = getattr(fund_info, field["name"])
+
+            cell_format = self._cell_formats[col]
+            if stale and not self._column_sections[col].isdisjoint(stale):
+                cell_format = self._stale_cell_formats[col]
 
-        cell_formats = [workbook.add_format(field.get("format")) for field in schema]
+            if is_placeholder(value):
+                worksheet.write_blank(row, col + start, None, cell_format)
+            else:
+                worksheet.write(row, col + start, value, cell_format)
+
+    def add_fund_sheet(
+        self,
+        fund_infos: list[FundInfo],
+        name: str = None,
+        logger: Logger = Logger.null_logger(),
+        progress: bool = False,
+    ) -> None:
+        """Add a worksheet of the fund infos, one per row"""
+
+        worksheet = self._add_worksheet(name)
+
+        logger.log("写入文档头......")
+        self._write_header(worksheet, self._schema)
 
         logger.log("写入文档体......")
-        for row, fund_info in tenumerate(fund_infos, start=1, unit="行", desc="写入基金信息"):
-            for col, field in enumerate(schema):
-                # Judging from source code of xlsxwriter, add_format(None) is equivalent
-                # to default format.
-                worksheet.write(
-                    row, col, getattr(fund_info, field["name"]), cell_formats[col]
-                )
+        for row, fund_info in penumerate(
+            fund_infos, start=1, unit="行", desc="写入基金信息", disable=not progress
+        ):
+            self._write_fund_info(worksheet, row, fund_info)
+
+    def add_change_sheet(self, rows: list[tuple[str, str, Optional[FundInfo]]]) -> None:
+        """Add a worksheet of the rows returned by `change_rows()`"""
+
+        worksheet = self._add_worksheet(CHANGE_SHEET_NAME)
+
+        worksheet.set_column(0, 0, 9)
+        worksheet.write_string(0, 0, CHANGE_KIND_COLUMN, self._header_format)
+        self._write_header(worksheet, self._schema, start=1)
+
+        code_column = 1 + fund_code_column(self._schema)
+        for row, (kind, fund_code, fund_info) in enumerate(rows, start=1):
+            worksheet.write_string(row, 0, kind)
+            if fund_info is None:
+                worksheet.write_string(row, code_column, fund_code)
+            else:
+                self._write_fund_info(worksheet, row, fund_info, start=1)
+
+    def add_summary_sheet(self, portfolios: list[tuple[str, list[FundInfo]]]) -> None:
+        """Add a worksheet summarizing the portfolios, one per row"""
+
+        worksheet = self._add_worksheet(SUMMARY_SHEET_NAME)
+        self._write_header(worksheet, SUMMARY_SCHEMA)
+
+        for row, (name, fund_infos) in enumerate(portfolios, start=1):
+            estimate_growth_rates = [fund_info.估算增长率 for fund_info in fund_infos]
+            values = [
+                name,
+                len(fund_infos),
+                mean([fund_info.日增长率 for fund_info in fund_infos]),
+                mean(estimate_growth_rates),
+                sum(rate > 0 for rate in estimate_growth_rates),
+                sum(rate < 0 for rate in estimate_growth_rates),
+            ]
+            for col, value in enumerate(values):
+                if value is not None:
+                    worksheet.write(row, col, value, self._summary_formats[col])
+
+
+@on_failure_raises(RuntimeError, "获取基金信息并写入 Excel 文档 {xlsx_filename} 的时候发生错误")
+def write_to_xlsx(
+    fund_infos: list[FundInfo],
+    xlsx_filename: Path,
+    logger: Logger = Logger.null_logger(),
+    progress: bool = True,
+    increment: Increment = None,
+    schema: Sequence[dict[str, Any]] = SCHEMA,
+    stale: Mapping[str, Collection[Section]] = None,
+) -> None:
+    """
+    Structuralize a list of fund infos to an Excel document.
+
+    Input: a list of fund infos, and an Excel filename.
+    `progress`: A flag to control whether should display progress bar.
+    `increment`: The incremental update planned by `plan_increment()`, if any. Its
+        delta is written as requested, and its manifest is saved.
+    `schema`: The columns to write, a selection of `SCHEMA` by `select_schema()`.
+    `stale`: The stale sections of fund infos, grayed out. See `WorkbookBuilder`.
+    """
+
+    diff = increment.diff if increment is not None else None
+    delta = increment.delta if diff is not None else ()
+    rows = change_rows(fund_infos, diff) if diff is not None else []
+
+    logger.log("新建 Excel 文档......")
+    with WorkbookBuilder(xlsx_filename, schema, stale=stale) as builder:
+
+        builder.add_fund_sheet(fund_infos, logger=logger, progress=progress)
+
+        if "sheet" in delta:
+            logger.log("写入变化工作表......")
+            builder.add_change_sheet(rows)
+
+        logger.log("Flush 到硬盘......")
+
+    if "csv" in delta:
+        csv_filename = xlsx_filename.with_suffix(".delta.csv")
+        logger.log(f'写入变化 CSV 文件 "{csv_filename}"......')
+        write_delta_csv(rows, csv_filename, schema)
+
+    if increment is not None:
+        increment.manifest.save(RowManifest.path_for(xlsx_filename))
+
+
+@on_failure_raises(RuntimeError, "获取基金信息并写入 Excel 文档 {xlsx_filename} 的时候发生错误")
+def write_portfolios_to_xlsx(
+    portfolios: list[tuple[str, list[FundInfo]]],
+    xlsx_filename: Path,
+    logger: Logger = Logger.null_logger(),
+    progress: bool = True,
+    schema: Sequence[dict[str, Any]] = SCHEMA,
+    stale: Mapping[str, Collection[Section]] = None,
+) -> None:
+    """
+    Structuralize portfolios of fund infos to an Excel document, with a summary sheet
+    followed by one sheet per portfolio.
+
+    Input: a list of pairs of a portfolio name and a list of fund infos, and an Excel
+    filename.
+    """
+
+    logger.log("新建 Excel 文档......")
+    with WorkbookBuilder(xlsx_filename, schema, stale=stale) as builder:
+
+        logger.log("写入汇总工作表......")
+        builder.add_summary_sheet(portfolios)
+
+        for _, (name, fund_infos) in penumerate(
+            portfolios, unit="个", desc="写入组合工作表", disable=not progress
+        ):
+            builder.add_fund_sheet(fund_infos, name)
 
         logger.log("Flush 到硬盘......")
+
+
+def write_many_to_xlsx(
+    jobs: Sequence[tuple[list[FundInfo], Path, Optional[Increment]]],
+    schema: Sequence[dict[str, Any]] = SCHEMA,
+    max_workers: int = None,
+    stale: Mapping[str, Collection[Section]] = None,
+) -> None:
+    """
+    Structuralize lists of fund infos to their respective Excel documents, in parallel.
+
+    Input: a sequence of triples of a list of fund infos, an Excel filename, and an
+    optional incremental update.
+    """
+
+    # Generating Excel document is CPU-bound, so we resort to multiprocessing.
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(
+                write_to_xlsx,
+                fund_infos,
+                xlsx_filename,
+                progress=False,
+                increment=increment,
+                schema=schema,
+                stale=stale,
+            )
+            for fund_infos, xlsx_filename, increment in jobs
+        ]
+        for future in futures:
+            future.result()
@@ -24,5 +24,8 @@ setuptools.setup(
     ],
     python_requires=">=3.9",
     install_requires=open("requirements/install.txt", "r").read().splitlines(),
+    extras_require={
+        "fast": ["orjson~=3.6", "uvloop~=0.16.0; sys_platform != 'win32'"]
+    },
     entry_points={"console_scripts": ["quickfund=quickfund.__main__:main",]},
 )
@@ -0,0 +1,113 @@
+"""
+The mocked responses of the endpoints, and variants of them synthesized in the same
+format, to exercise the parsers beyond the few values of the mocks.
+"""
+
+import json
+from collections.abc import Iterable
+from datetime import date, datetime
+from pathlib import Path
+
+import regex
+
+from quickfund.fetcher import IARBC_FRAGMENT_END_MARKERS
+from quickfund.session import MarkerScanner
+
+
+__all__ = [
+    "NET_VALUE_TEXT",
+    "ESTIMATE_TEXT",
+    "FUND_INFO_PAGE_TEXT",
+    "net_value_text",
+    "estimate_text",
+    "fund_info_page_text",
+    "IARBC_fragment",
+]
+
+
+MOCKS_DIR = Path(__file__).resolve().parent.parent / "mocks"
+
+
+def read_mock(name: str) -> str:
+    return (MOCKS_DIR / name).read_text(encoding="utf-8")
+
+
+NET_VALUE_TEXT = read_mock("net_value_api_response_text.txt")
+ESTIMATE_TEXT = read_mock("estimate_api_response_text.txt")
+FUND_INFO_PAGE_TEXT = read_mock("fund_info_page_html_text.txt")
+
+
+def net_value_text(records: Iterable[tuple[date, str, str, str]]) -> str:
+    """
+    Synthesize a response of the net value API, of the records of date, net value,
+    growth rate and dividend, all but the date formatted as by the API, e.g., "3.1709",
+    "-1.13%" and "".
+    """
+
+    head, _, rest = NET_VALUE_TEXT.partition("<tbody>")
+    _, _, tail = rest.partition("</tbody>")
+
+    rows = "".join(
+        f"<tr><td>{record_date.isoformat()}</td>"
+        f"<td class='tor bold'>{net_value}</td><td class='tor bold'>{net_value}</td>"
+        f"<td class='tor bold grn'>{growth_rate}</td>"
+        f"<td>开放申购</td><td>开放赎回</td><td class='red unbold'>{dividend}</td></tr>"
+        for record_date, net_value, growth_rate, dividend in records
+    )
+
+    return f"{head}<tbody>{rows}</tbody>{tail}"
+
+
+def estimate_text(
+    fund_code: str, name: str, estimate_datetime: datetime, estimate: str, rate: str
+) -> str:
+    """
+    Synthesize a response of the estimate API. The estimate and its growth rate are
+    formatted as by the API, e.g., "3.1345" and "-1.15".
+    """
+
+    data = {
+        "fundcode": fund_code,
+        "name": name,
+        "jzrq": "2021-12-17",
+        "dwjz": "3.1709",
+        "gsz": estimate,
+        "gszzl": rate,
+        "gztime": estimate_datetime.strftime("%Y-%m-%d %H:%M"),
+    }
+
+    return f"jsonpgz({json.dumps(data, ensure_ascii=False)});"
+
+
+def fund_info_page_text(
+    cutoff_date: date, IARBCs: Iterable[tuple[object, object]]
+) -> str:
+    """
+    Synthesize a fund info page, with the IARBC cutoff date, and the eight IARBCs, as
+    pairs of rank and total, in place of those of the mocked page
+    """
+
+    start = FUND_INFO_PAGE_TEXT.index('id="increaseAmount_stage"')
+    end = FUND_INFO_PAGE_TEXT.index("</li>", start)
+
+    cells = iter(IARBCs)
+    table = regex.sub(
+        r'<div class="Rdata">\d+ \| \d+</div>',
+        lambda _: '<div class="Rdata">{} | {}</div>'.format(*next(cells)),
+        FUND_INFO_PAGE_TEXT[start:end],
+    )
+
+    page = FUND_INFO_PAGE_TEXT[:start] + table + FUND_INFO_PAGE_TEXT[end:]
+
+    return regex.sub(
+        r'(?<=<span id="jdzfDate">)[^<]*', cutoff_date.isoformat(), page, count=1
+    )
+
+
+def IARBC_fragment(page: str) -> str:
+    """The fragment of the fund info page received by `FundInfoFetcher.fetch_IARBC()`"""
+
+    content = page.encode("utf-8")
+    scanner = MarkerScanner(IARBC_FRAGMENT_END_MARKERS)
+    scanner.scan(content)
+    return content[: scanner.end].decode("utf-8")
@@ -0,0 +1,78 @@
+"""
+The reference parsers of the responses of the endpoints, i.e., the parsing logic of
+`FundInfoFetcher` before it was split out from the I/O and optimized. They are slow,
+but proven in production, so faster parsers are checked against them.
+"""
+
+import json
+from datetime import datetime
+from typing import cast
+
+import pandas
+import regex
+from lxml import etree
+from more_itertools import one
+
+from quickfund.models import FundEstimateInfo, FundIARBCInfo, FundNetValueInfo
+
+
+__all__ = ["parse_net_value", "parse_estimate", "parse_IARBC"]
+
+
+def parse_net_value(text: str) -> FundNetValueInfo:
+
+    dfs = pandas.read_html(text, parse_dates=["净值日期"], keep_default_na=False)
+    data = one(dfs)
+
+    return FundNetValueInfo(
+        净值日期=data.净值日期[0].date(),
+        单位净值=data.单位净值[0],
+        日增长率=float(data.日增长率[0].rstrip("% ")) * 0.01,
+        分红送配=data.分红送配[0],
+        上一天净值=data.单位净值[1],
+        上一天净值日期=data.净值日期[1].date(),
+    )  # type: ignore # FIXME https://github.com/python-attrs/attrs/issues/795
+
+
+def parse_estimate(text: str) -> FundEstimateInfo:
+
+    pattern = r"jsonpgz\((?P<json>.*)\);"
+    data = json.loads(regex.fullmatch(pattern, text).group("json"))
+
+    return FundEstimateInfo(
+        基金代码=data["fundcode"],
+        基金名称=data["name"],
+        估算日期=datetime.strptime(data["gztime"], "%Y-%m-%d %H:%M"),
+        实时估值=float(data["gsz"]),
+        估算增长率=float(data["gszzl"]) * 0.01,
+    )  # type: ignore # FIXME https://github.com/python-attrs/attrs/issues/795
+
+
+def parse_IARBC(text: str) -> FundIARBCInfo:
+
+    html = etree.HTML(text)
+
+    matches = cast(list, html.xpath("//span[@id='jdzfDate']"))
+    cutoff_date_str = one(matches).text
+    cutoff_date = datetime.strptime(cutoff_date_str, "%Y-%m-%d").date()
+
+    matches = cast(list, html.xpath("//li[@id='increaseAmount_stage']"))
+    table = etree.tostring(one(matches), encoding=str)
+    df = one(pandas.read_html(table, index_col=0))
+
+    def reformat_IARBC(IARBC: str) -> str:
+        m = regex.fullmatch(r"(?P<rank>\d+) \| (?P<total>\d+)", IARBC)
+        rank, total = m.group("rank", "total")
+        return rank + "/" + total
+
+    return FundIARBCInfo(
+        同类排名截止日期=cutoff_date,
+        近1周同类排名=reformat_IARBC(df.近1周.同类排名),
+        近1月同类排名=reformat_IARBC(df.近1月.同类排名),
+        近3月同类排名=reformat_IARBC(df.近3月.同类排名),
+        近6月同类排名=reformat_IARBC(df.近6月.同类排名),
+        今年来同类排名=reformat_IARBC(df.今年来.同类排名),
+        近1年同类排名=reformat_IARBC(df.近1年.同类排名),
+        近2年同类排名=reformat_IARBC(df.近2年.同类排名),
+        近3年同类排名=reformat_IARBC(df.近3年.同类排名),
+    )  # type: ignore # FIXME https://github.com/python-attrs/attrs/issues/795
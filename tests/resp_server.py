@@ -0,0 +1,189 @@
+"""
+An in-process stand-in of a Redis-compatible key-value server, speaking just enough
+of the RESP protocol to serve `RESPClient` and `NetworkBackend` in tests.
+"""
+
+from __future__ import annotations
+
+import socketserver
+import threading
+from collections.abc import Callable
+from typing import Any, Optional, Union, cast
+
+
+__all__ = ["RESPServer"]
+
+
+Value = Union[bytes, dict[bytes, bytes]]
+
+
+class WrongType(Exception):
+    pass
+
+
+def encode_reply(reply: Any) -> bytes:
+    if reply is None:
+        return b"$-1\r\n"
+    if isinstance(reply, Exception):
+        return b"-ERR %s\r\n" % str(reply).encode()
+    if isinstance(reply, str):
+        return b"+%s\r\n" % reply.encode()
+    if isinstance(reply, int):
+        return b":%d\r\n" % reply
+    if isinstance(reply, bytes):
+        return b"$%d\r\n%s\r\n" % (len(reply), reply)
+    if isinstance(reply, list):
+        return b"*%d\r\n" % len(reply) + b"".join(map(encode_reply, reply))
+    raise TypeError(reply)
+
+
+class RESPServer(socketserver.ThreadingTCPServer):
+    """
+    Keys expire by the clock of the server, which tests may advance instead of
+    sleeping.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, password: str = None) -> None:
+        super().__init__(("127.0.0.1", 0), RESPHandler)
+
+        self.password = password
+        self.now = 0.0
+        self.data: dict[bytes, Value] = {}
+        self.expires: dict[bytes, float] = {}
+        self.lock = threading.Lock()
+
+        self._thread = threading.Thread(
+            target=self.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True
+        )
+
+    @property
+    def url(self) -> str:
+        host, port = cast(tuple[str, int], self.server_address)
+        auth = f":{self.password}@" if self.password else ""
+        return f"redis://{auth}{host}:{port}"
+
+    def __enter__(self) -> RESPServer:
+        self._thread.start()
+        return self
+
+    def __exit__(self, *_: Any) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def advance(self, seconds: float) -> None:
+        with self.lock:
+            self.now += seconds
+
+    def _lookup(self, key: bytes) -> Optional[Value]:
+        if key in self.expires and self.expires[key] <= self.now:
+            del self.data[key], self.expires[key]
+        return self.data.get(key)
+
+    def _hash(self, key: bytes) -> dict[bytes, bytes]:
+        value = self._lookup(key)
+        if value is None:
+            value = self.data[key] = {}
+        if not isinstance(value, dict):
+            raise WrongType("WRONGTYPE Operation against a key holding the wrong kind")
+        return value
+
+    def _string(self, key: bytes) -> Optional[bytes]:
+        value = self._lookup(key)
+        if isinstance(value, dict):
+            raise WrongType("WRONGTYPE Operation against a key holding the wrong kind")
+        return value
+
+    def execute(self, name: str, args: list[bytes], authenticated: bool) -> Any:
+        handlers: dict[str, Callable[..., Any]] = {
+            "PING": lambda: "PONG",
+            "SELECT": lambda db: "OK",
+            "GET": self._string,
+            "SET": self._set,
+            "MGET": lambda *keys: [self._string(key) for key in keys],
+            "DEL": lambda *keys: sum(self._delete(key) for key in keys),
+            "HGET": lambda key, field: self._hash(key).get(field),
+            "HSET": self._hset,
+            "EXPIRE": self._expire,
+            "TTL": self._ttl,
+        }
+
+        with self.lock:
+            if self.password is not None and not authenticated:
+                return Exception("NOAUTH Authentication required")
+            if name not in handlers:
+                return Exception(f"unknown command '{name}'")
+
+            try:
+                return handlers[name](*args)
+            except (TypeError, WrongType) as exc:
+                return Exception(str(exc))
+
+    def _set(self, key: bytes, value: bytes, *options: bytes) -> str:
+        self.data[key] = value
+        self.expires.pop(key, None)
+        if options and options[0].upper() == b"EX":
+            self.expires[key] = self.now + int(options[1])
+        return "OK"
+
+    def _delete(self, key: bytes) -> int:
+        self.expires.pop(key, None)
+        return int(self.data.pop(key, None) is not None)
+
+    def _hset(self, key: bytes, *pairs: bytes) -> int:
+        fields = self._hash(key)
+        added = sum(field not in fields for field in pairs[::2])
+        fields.update(zip(pairs[::2], pairs[1::2]))
+        return added
+
+    def _expire(self, key: bytes, seconds: bytes) -> int:
+        if self._lookup(key) is None:
+            return 0
+        self.expires[key] = self.now + int(seconds)
+        return 1
+
+    def _ttl(self, key: bytes) -> int:
+        if self._lookup(key) is None:
+            return -2
+        if key not in self.expires:
+            return -1
+        return int(self.expires[key] - self.now)
+
+
+class RESPHandler(socketserver.StreamRequestHandler):
+
+    server: RESPServer
+
+    def _read_line(self) -> Optional[bytes]:
+        line = self.rfile.readline()
+        return line[:-2] if line.endswith(b"\r\n") else None
+
+    def _read_command(self) -> Optional[list[bytes]]:
+        line = self._read_line()
+        if not line:
+            return None
+        assert line[:1] == b"*", "Commands are sent as arrays of bulk strings"
+
+        command = []
+        for _ in range(int(line[1:])):
+            header = self._read_line()
+            assert header is not None and header[:1] == b"$"
+            command.append(self.rfile.read(int(header[1:]) + 2)[:-2])
+        return command
+
+    def handle(self) -> None:
+        authenticated = False
+
+        while (command := self._read_command()) is not None:
+            name, args = command[0].decode().upper(), command[1:]
+
+            if name == "AUTH":
+                # Either AUTH password or AUTH username password
+                authenticated = args[-1].decode() == self.server.password
+                reply: Any = "OK" if authenticated else Exception("WRONGPASS")
+            else:
+                reply = self.server.execute(name, args, authenticated)
+
+            self.wfile.write(encode_reply(reply))
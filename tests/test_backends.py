@@ -0,0 +1,137 @@
+"""
+Tests of the network cache backend and its RESP client, against an in-process
+stand-in of a Redis-compatible server.
+"""
+
+import socket
+from collections.abc import Iterator
+from datetime import timedelta
+
+import attr
+import pytest
+
+from quickfund.backends import Freshness, LocalBackend, NetworkBackend, open_backend
+from quickfund.cache import CachePolicy
+from quickfund.fetcher import parse_estimate, parse_IARBC, parse_net_value
+from quickfund.models import FundInfo
+from quickfund.utils.resp import RESPClient, RESPError
+
+from .payloads import ESTIMATE_TEXT, FUND_INFO_PAGE_TEXT, NET_VALUE_TEXT
+from .resp_server import RESPServer
+
+
+FUND_CODE = "000001"
+
+
+@pytest.fixture
+def server() -> Iterator[RESPServer]:
+    with RESPServer() as server:
+        yield server
+
+
+@pytest.fixture
+def fund_info() -> FundInfo:
+    return FundInfo.unfetched(FUND_CODE).replaced(
+        net_value_info=parse_net_value(NET_VALUE_TEXT),
+        estimate_info=parse_estimate(ESTIMATE_TEXT),
+        IARBC_info=parse_IARBC(FUND_INFO_PAGE_TEXT),
+    )
+
+
+def unused_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_client_round_trip(server: RESPServer) -> None:
+    with RESPClient.from_url(server.url) as client:
+        assert client.execute("PING") == "PONG"
+        assert client.execute("SET", "a", b"\x00\r\n\xff") == "OK"
+        assert client.execute("GET", "a") == b"\x00\r\n\xff"
+        assert client.execute("GET", "missing") is None
+
+        assert client.pipeline([("SET", "b", 2), ("MGET", "a", "b", "missing")]) == [
+            "OK",
+            [b"\x00\r\n\xff", b"2", None],
+        ]
+
+        # Replies of the pipeline are all read before raising, so the connection is
+        # still usable afterwards
+        with pytest.raises(RESPError):
+            client.pipeline([("HGET", "a", "field"), ("GET", "b")])
+        assert client.execute("GET", "b") == b"2"
+
+
+def test_client_expiry(server: RESPServer) -> None:
+    with RESPClient.from_url(server.url) as client:
+        client.execute("SET", "a", "1", "EX", 10)
+        assert client.execute("TTL", "a") == 10
+
+        server.advance(9)
+        assert client.execute("GET", "a") == b"1"
+
+        server.advance(1)
+        assert client.execute("GET", "a") is None
+
+
+def test_client_auth() -> None:
+    with RESPServer(password="p@ss") as server:
+        with RESPClient.from_url(server.url.replace("p@ss", "p%40ss")) as client:
+            assert client.execute("PING") == "PONG"
+
+        with pytest.raises(RESPError):
+            RESPClient.from_url(server.url.replace("p@ss", "wrong"))
+
+
+def test_network_backend_round_trip(server: RESPServer, fund_info: FundInfo) -> None:
+    with open_backend(server.url) as backend:
+        assert isinstance(backend, NetworkBackend)
+        assert backend.get_many([FUND_CODE]) == {}
+
+        backend.put_many({FUND_CODE: fund_info})
+
+        assert backend.get_many([FUND_CODE, "000002"]) == {FUND_CODE: fund_info}
+        assert backend.freshness_many([FUND_CODE]) == {
+            FUND_CODE: Freshness.of(fund_info)
+        }
+
+
+def test_network_backend_keeps_fresher_sections(
+    server: RESPServer, fund_info: FundInfo
+) -> None:
+    with open_backend(server.url) as backend:
+        backend.put_many({FUND_CODE: fund_info})
+
+        # Another user writes a fund info of which the estimate is staler
+        staler = attr.evolve(fund_info, 估算日期=fund_info.估算日期 - timedelta(days=1))
+        backend.put_many({FUND_CODE: staler})
+
+        assert backend.get_many([FUND_CODE]) == {FUND_CODE: fund_info}
+
+
+def test_network_backend_expiry(server: RESPServer, fund_info: FundInfo) -> None:
+    policy = CachePolicy(max_idle=timedelta(seconds=100))
+
+    with open_backend(server.url, policy) as backend:
+        backend.put_many({FUND_CODE: fund_info})
+
+        # Access refreshes the expiration
+        server.advance(60)
+        assert backend.get_many([FUND_CODE]) == {FUND_CODE: fund_info}
+        server.advance(60)
+        assert backend.get_many([FUND_CODE]) == {FUND_CODE: fund_info}
+
+        server.advance(100)
+        assert backend.get_many([FUND_CODE]) == {}
+        assert backend.freshness_many([FUND_CODE]) == {}
+
+
+def test_open_backend_falls_back_to_local(monkeypatch: pytest.MonkeyPatch) -> None:
+    opened = []
+    monkeypatch.setattr(LocalBackend, "__init__", lambda self, **_: opened.append(1))
+    monkeypatch.setattr(LocalBackend, "close", lambda self: None)
+
+    with open_backend(f"redis://127.0.0.1:{unused_port()}") as backend:
+        assert isinstance(backend, LocalBackend)
+    assert opened
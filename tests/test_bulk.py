@@ -0,0 +1,92 @@
+"""
+Tests of the bulk index built from the rank lists, in particular that funds are ranked
+within the whole list of each type, however the types take precedence, and that its
+approximate IARBC infos never replace fresher ones.
+"""
+
+import asyncio
+from datetime import date
+from typing import cast
+
+import attr
+import pytest
+
+from quickfund.bulk import RANK_FIELDS, BulkIndex
+from quickfund.fetcher import FundInfoFetcher
+from quickfund.getter import update_IARBC_info
+from quickfund.models import FundIARBCInfo, FundInfo
+
+
+def record(fund_code: str, returns: float) -> list[str]:
+    """A record of the rank lists, with the same returns in all periods"""
+    return [
+        fund_code,
+        f"基金{fund_code}",
+        "JJ",
+        "2021-12-17",
+        "1.2345",
+        "2.3456",
+        "0.50",
+        *[f"{returns:.2f}"] * len(RANK_FIELDS),
+        "",
+    ]
+
+
+def test_ranked_within_whole_list() -> None:
+    # 000001 is listed under both gp and hh, and indexed under gp, which takes
+    # precedence
+    index = BulkIndex.build(
+        {
+            "gp": [record("000002", 30), record("000001", 20), record("000003", 10)],
+            "hh": [record("000001", 20), record("000004", 5)],
+        }
+    )
+
+    gp_fund = index.IARBC_info("000001")
+    assert gp_fund is not None
+    assert gp_fund.近1周同类排名 == gp_fund.近3年同类排名 == "2/3"
+
+    # 000004 is ranked after 000001 among the whole hh list
+    hh_fund = index.IARBC_info("000004")
+    assert hh_fund is not None
+    assert hh_fund.近1周同类排名 == hh_fund.近3年同类排名 == "2/2"
+    assert hh_fund.同类排名截止日期 == date(2021, 12, 17)
+
+    assert len(index) == 4
+    assert set(index.net_value_infos) == {"000001", "000002", "000003", "000004"}
+
+
+class FakeFetcher:
+    def __init__(self, IARBC_info: FundIARBCInfo) -> None:
+        self.IARBC_info = IARBC_info
+        self.fetched: list[str] = []
+
+    async def fetch_IARBC(self, fund_code: str) -> FundIARBCInfo:
+        self.fetched.append(fund_code)
+        return self.IARBC_info
+
+
+@pytest.mark.parametrize(
+    "bulk_date, fetched", [(date(2021, 12, 16), True), (date(2021, 12, 17), False)]
+)
+def test_bulk_IARBC_freshness(bulk_date: date, fetched: bool) -> None:
+    cached = attr.evolve(FundIARBCInfo.placeholder(), 同类排名截止日期=date(2021, 12, 17))
+    fund_info_db = {"000001": FundInfo.unfetched("000001").replaced(IARBC_info=cached)}
+
+    bulk_IARBC_info = attr.evolve(cached, 同类排名截止日期=bulk_date, 近1周同类排名="1/2")
+    bulk_index = BulkIndex(IARBC_infos={"000001": bulk_IARBC_info})
+
+    fetched_IARBC_info = attr.evolve(cached, 同类排名截止日期=date(2021, 12, 20))
+    fetcher = FakeFetcher(fetched_IARBC_info)
+
+    asyncio.run(
+        update_IARBC_info(
+            "000001", fund_info_db, cast(FundInfoFetcher, fetcher), bulk_index
+        )
+    )
+
+    # A bulk IARBC info older than the cached one doesn't replace it
+    expected = fetched_IARBC_info if fetched else bulk_IARBC_info
+    assert fetcher.fetched == (["000001"] if fetched else [])
+    assert fund_info_db["000001"].同类排名截止日期 == expected.同类排名截止日期
+    assert fund_info_db["000001"].近1周同类排名 == expected.近1周同类排名
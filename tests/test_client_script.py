@@ -0,0 +1,140 @@
+"""
+Tests of the update path of the launcher: the background update check marking a
+downloaded update as pending, and the next launch applying it. pip is faked, and the
+launcher directory is redirected to a temporary directory.
+"""
+
+import json
+import subprocess
+from collections.abc import Sequence
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+import client_script
+
+
+DEPENDENCY_WHEEL = "aiohttp-3.8.1-cp39-cp39-manylinux_2_17_x86_64.whl"
+
+UPDATE_WHEEL = "QuickFund-0.3.10-py3-none-any.whl"
+
+
+class FakePip:
+    def __init__(self, wheels: Sequence[str] = (), fail: bool = False) -> None:
+        self.wheels = wheels
+        self.fail = fail
+        self.commands: list[list[str]] = []
+
+    def __call__(self, command: list[str], **_: Any) -> None:
+        self.commands.append(command)
+
+        if self.fail:
+            raise subprocess.CalledProcessError(1, command)
+
+        if "download" in command:
+            client_script.WHEEL_DIR.mkdir(parents=True, exist_ok=True)
+            for wheel in self.wheels:
+                (client_script.WHEEL_DIR / wheel).touch()
+
+
+@pytest.fixture(autouse=True)
+def launcher_dir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    for name, path in [
+        ("LAUNCHER_DIR", tmp_path),
+        ("WHEEL_DIR", tmp_path / "wheels"),
+        ("PENDING_UPDATE_PATH", tmp_path / "pending-update.json"),
+        ("LAST_CHECK_PATH", tmp_path / "last-check"),
+        ("CHECK_LOCK_PATH", tmp_path / "check.lock"),
+    ]:
+        monkeypatch.setattr(client_script, name, path)
+
+    monkeypatch.setattr(client_script, "installed_version", lambda: "0.3.2")
+
+    return tmp_path
+
+
+def pending_version() -> str:
+    pending_update = client_script.PENDING_UPDATE_PATH.read_text(encoding="utf-8")
+    return json.loads(pending_update)["version"]
+
+
+@pytest.mark.parametrize("project_name", ["QuickFund", "quickfund"])
+def test_check_update(monkeypatch: pytest.MonkeyPatch, project_name: str) -> None:
+    wheels = [
+        f"{project_name}-0.3.10-py3-none-any.whl",
+        f"{project_name}-0.3.9-py3-none-any.whl",
+        DEPENDENCY_WHEEL,
+    ]
+    monkeypatch.setattr(subprocess, "run", FakePip(wheels))
+
+    client_script.check_update()
+
+    assert pending_version() == "0.3.10"
+    assert client_script.LAST_CHECK_PATH.is_file()
+    assert not client_script.CHECK_LOCK_PATH.exists()
+
+
+def test_check_update_up_to_date(monkeypatch: pytest.MonkeyPatch) -> None:
+    wheels = ["QuickFund-0.3.2-py3-none-any.whl"]
+    monkeypatch.setattr(subprocess, "run", FakePip(wheels))
+
+    client_script.check_update()
+
+    assert not client_script.PENDING_UPDATE_PATH.exists()
+    assert client_script.LAST_CHECK_PATH.is_file()
+
+
+def test_apply_pending_update(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(subprocess, "run", FakePip([UPDATE_WHEEL, DEPENDENCY_WHEEL]))
+    client_script.check_update()
+
+    pip = FakePip()
+    monkeypatch.setattr(subprocess, "run", pip)
+
+    client_script.apply_pending_update()
+
+    (command,) = pip.commands
+    assert command[-1] == "quickfund==0.3.10"
+    assert "--no-index" in command
+    assert not client_script.PENDING_UPDATE_PATH.exists()
+    # The wheels of dependencies are kept for the next download
+    assert [path.name for path in client_script.WHEEL_DIR.iterdir()] == [
+        DEPENDENCY_WHEEL
+    ]
+
+
+def test_apply_pending_update_failure(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(subprocess, "run", FakePip([UPDATE_WHEEL]))
+    client_script.check_update()
+
+    monkeypatch.setattr(subprocess, "run", FakePip(fail=True))
+
+    client_script.apply_pending_update()
+
+    assert not client_script.PENDING_UPDATE_PATH.exists()
+    assert not client_script.WHEEL_DIR.exists()
+
+
+def test_apply_pending_update_already_installed(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    client_script.PENDING_UPDATE_PATH.write_text(
+        json.dumps({"version": "0.3.2"}), encoding="utf-8"
+    )
+    pip = FakePip()
+    monkeypatch.setattr(subprocess, "run", pip)
+
+    client_script.apply_pending_update()
+
+    assert not pip.commands
+    assert not client_script.PENDING_UPDATE_PATH.exists()
+
+
+def test_no_pending_update(monkeypatch: pytest.MonkeyPatch) -> None:
+    pip = FakePip()
+    monkeypatch.setattr(subprocess, "run", pip)
+
+    client_script.apply_pending_update()
+
+    assert not pip.commands
@@ -0,0 +1,125 @@
+"""
+Tests of the binary codec of cached fund infos: round trips, including the NaN and
+minimal dates of placeholders, version checks, migrations, and corrupted data.
+"""
+
+import math
+from collections.abc import Callable
+from datetime import date, datetime
+
+import attr
+import pytest
+
+from quickfund import codec
+from quickfund.codec import CodecError, decode_fund_info, encode_fund_info
+from quickfund.fetcher import parse_estimate, parse_IARBC, parse_net_value
+from quickfund.models import FundInfo
+
+from .payloads import ESTIMATE_TEXT, FUND_INFO_PAGE_TEXT, NET_VALUE_TEXT
+
+
+def same(a: FundInfo, b: FundInfo) -> bool:
+    """Equality, but with NaN equal to NaN"""
+
+    def key(value: object) -> object:
+        return "NaN" if isinstance(value, float) and math.isnan(value) else value
+
+    return [key(value) for value in attr.astuple(a)] == [
+        key(value) for value in attr.astuple(b)
+    ]
+
+
+@pytest.fixture
+def fund_info() -> FundInfo:
+    return FundInfo.combine(
+        parse_net_value(NET_VALUE_TEXT),
+        parse_estimate(ESTIMATE_TEXT),
+        parse_IARBC(FUND_INFO_PAGE_TEXT),
+    )
+
+
+def test_round_trip(fund_info: FundInfo) -> None:
+    assert decode_fund_info(encode_fund_info(fund_info)) == fund_info
+
+
+def test_round_trip_unfetched() -> None:
+    fund_info = FundInfo.unfetched("000001")
+
+    decoded = decode_fund_info(encode_fund_info(fund_info))
+
+    assert same(decoded, fund_info)
+    assert math.isnan(decoded.单位净值) and math.isnan(decoded.实时估值)
+    assert decoded.净值日期 == decoded.同类排名截止日期 == date.min
+    assert decoded.估算日期 == datetime.min
+    assert decoded.基金代码 == "000001"
+
+
+def test_round_trip_non_ascii(fund_info: FundInfo) -> None:
+    fund_info = attr.evolve(fund_info, 基金名称="华夏回报混合（QDII）", 分红送配="每份派现金0.05元")
+    assert decode_fund_info(encode_fund_info(fund_info)) == fund_info
+
+
+def test_newer_version(fund_info: FundInfo) -> None:
+    data = encode_fund_info(fund_info)
+    newer = bytes([codec.CODEC_VERSION + 1]) + data[1:]
+
+    with pytest.raises(CodecError, match="newer"):
+        decode_fund_info(newer)
+
+
+@pytest.mark.parametrize(
+    "corrupt",
+    [
+        lambda data: b"",
+        lambda data: data[:10],
+        lambda data: data[:-1],
+        lambda data: data + b"\0",
+        lambda data: data[:1] + b"garbage",
+        # An out-of-range date ordinal
+        lambda data: data[:1] + b"\0\0\0\0" + data[5:],
+        # Malformed UTF-8 in place of the fund code
+        lambda data: data.replace("000001".encode(), b"\xff" * 6),
+    ],
+    ids=["empty", "short head", "truncated", "trailing", "garbage", "ordinal", "utf8"],
+)
+def test_corrupted(corrupt: Callable[[bytes], bytes], fund_info: FundInfo) -> None:
+    data = encode_fund_info(attr.evolve(fund_info, 基金代码="000001"))
+
+    with pytest.raises(CodecError):
+        decode_fund_info(corrupt(data))
+
+
+def test_migration(fund_info: FundInfo, monkeypatch: pytest.MonkeyPatch) -> None:
+    data = encode_fund_info(fund_info)
+
+    migrated: list[bytes] = []
+
+    # A version 2 of the same layout, and its migration from version 1
+    def migrate_from_1(data: bytes) -> bytes:
+        migrated.append(data)
+        return bytes([2]) + data[1:]
+
+    monkeypatch.setattr(codec, "CODEC_VERSION", 2)
+    monkeypatch.setitem(codec.MIGRATIONS, 1, migrate_from_1)
+
+    assert decode_fund_info(data) == fund_info
+    assert migrated == [data]
+    assert encode_fund_info(fund_info)[0] == 2
+
+
+def test_missing_migration(
+    fund_info: FundInfo, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    data = encode_fund_info(fund_info)
+
+    monkeypatch.setattr(codec, "CODEC_VERSION", 2)
+
+    with pytest.raises(CodecError, match="migration"):
+        decode_fund_info(data)
+
+
+def test_string_too_long(fund_info: FundInfo) -> None:
+    fund_info = attr.evolve(fund_info, 基金名称="x" * (codec.MAX_STRING_LENGTH + 1))
+
+    with pytest.raises(CodecError):
+        encode_fund_info(fund_info)
@@ -0,0 +1,151 @@
+"""
+Differential tests of the parsers of the responses of the endpoints, against the
+reference parsers, over the mocked responses and variants synthesized from them.
+"""
+
+from collections.abc import Callable
+from datetime import date, datetime
+from typing import Any
+
+import pytest
+from hypothesis import given, settings
+from hypothesis import strategies as st
+
+from quickfund.fetcher import parse_estimate, parse_IARBC, parse_net_value
+
+from . import reference_parsers
+from .payloads import (
+    ESTIMATE_TEXT,
+    FUND_INFO_PAGE_TEXT,
+    NET_VALUE_TEXT,
+    IARBC_fragment,
+    estimate_text,
+    fund_info_page_text,
+    net_value_text,
+)
+
+
+Parser = Callable[[str], Any]
+
+# Map from endpoint to its reference parser, and the parsers checked against it.
+# Register alternative parsers here, e.g., faster ones, to have them checked as well.
+PARSERS: dict[str, tuple[Parser, list[Parser]]] = {
+    "net_value": (reference_parsers.parse_net_value, [parse_net_value]),
+    "estimate": (reference_parsers.parse_estimate, [parse_estimate]),
+    "IARBC": (reference_parsers.parse_IARBC, [parse_IARBC]),
+}
+
+
+def candidates(endpoint: str) -> pytest.MarkDecorator:
+    return pytest.mark.parametrize(
+        "parse", PARSERS[endpoint][1], ids=lambda parse: parse.__name__
+    )
+
+
+def assert_agree(endpoint: str, parse: Parser, text: str) -> None:
+    reference = PARSERS[endpoint][0]
+    assert parse(text) == reference(text)
+
+
+# The reference parsers are slow, and are of variable speed on first call
+differential = settings(max_examples=50, deadline=None)
+
+dates = st.dates(date(2000, 1, 1), date(2030, 12, 31))
+
+net_values = st.integers(1, 10 ** 6).map(lambda n: f"{n / 10000:.4f}")
+
+growth_rates = st.integers(-(10 ** 4), 10 ** 4).map(lambda n: f"{n / 100:.2f}")
+
+dividends = st.sampled_from(
+    ["", "每份派现金0.0500元", "每份基金份额折算1.0123份", "每份基金份额分拆2.0000份"]
+)
+
+net_value_records = st.lists(
+    st.tuples(dates, net_values, growth_rates.map(lambda rate: rate + "%"), dividends),
+    min_size=2,
+    max_size=4,
+    unique_by=lambda record: record[0],
+).map(lambda records: sorted(records, reverse=True))
+
+IARBCs = st.lists(
+    st.integers(1, 20000).flatmap(
+        lambda total: st.tuples(st.integers(1, total), st.just(total))
+    ),
+    min_size=8,
+    max_size=8,
+)
+
+
+@candidates("net_value")
+def test_net_value_mock(parse: Parser) -> None:
+    assert_agree("net_value", parse, NET_VALUE_TEXT)
+
+
+@candidates("net_value")
+@differential
+@given(records=net_value_records)
+def test_net_value_variants(parse: Parser, records: list) -> None:
+    assert_agree("net_value", parse, net_value_text(records))
+
+
+@candidates("estimate")
+def test_estimate_mock(parse: Parser) -> None:
+    assert_agree("estimate", parse, ESTIMATE_TEXT)
+
+
+@candidates("estimate")
+@differential
+@given(
+    fund_code=st.from_regex(r"\d{6}", fullmatch=True),
+    name=st.text(st.characters(blacklist_categories=["Cs"]), max_size=20),
+    estimate_datetime=st.datetimes(datetime(2000, 1, 1), datetime(2030, 12, 31)).map(
+        lambda dt: dt.replace(second=0, microsecond=0)
+    ),
+    estimate=net_values,
+    rate=growth_rates,
+)
+def test_estimate_variants(parse: Parser, **fields: Any) -> None:
+    assert_agree("estimate", parse, estimate_text(**fields))
+
+
+@candidates("IARBC")
+@pytest.mark.parametrize(
+    "text",
+    [FUND_INFO_PAGE_TEXT, IARBC_fragment(FUND_INFO_PAGE_TEXT)],
+    ids=["page", "fragment"],
+)
+def test_IARBC_mock(parse: Parser, text: str) -> None:
+    assert_agree("IARBC", parse, text)
+
+
+@candidates("IARBC")
+@differential
+@given(cutoff_date=dates, IARBCs=IARBCs)
+def test_IARBC_variants(parse: Parser, cutoff_date: date, IARBCs: list) -> None:
+    page = fund_info_page_text(cutoff_date, IARBCs)
+    assert_agree("IARBC", parse, page)
+    assert_agree("IARBC", parse, IARBC_fragment(page))
+
+
+@candidates("IARBC")
+def test_IARBC_values(parse: Parser) -> None:
+    # Pinned down literally, since the reference parser shares the way of reformatting
+    page = fund_info_page_text(date(2021, 12, 17), [(n, n * 100) for n in range(1, 9)])
+
+    IARBC_info = parse(page)
+
+    assert IARBC_info.同类排名截止日期 == date(2021, 12, 17)
+    assert IARBC_info.近1周同类排名 == "1/100"
+    assert IARBC_info.今年来同类排名 == "5/500"
+    assert IARBC_info.近3年同类排名 == "8/800"
+
+
+@candidates("IARBC")
+def test_IARBC_unranked(parse: Parser) -> None:
+    # Funds too new to be ranked for a period are not supported by either
+    page = fund_info_page_text(date(2021, 12, 17), [("--", "--")] * 8)
+
+    with pytest.raises(Exception):
+        PARSERS["IARBC"][0](page)
+    with pytest.raises(Exception):
+        parse(page)
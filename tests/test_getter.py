@@ -0,0 +1,324 @@
+"""
+Tests of getting fund infos end to end, with the HTTP requests of the fetcher faked to
+respond with the mocked payloads, optionally only once a gate is opened, and the cache
+and the journals redirected to a temporary directory.
+
+Worker processes are forked, and so inherit the fakes.
+"""
+
+import asyncio
+import threading
+import time
+from datetime import date
+from pathlib import Path
+from typing import Any, Optional
+
+import pytest
+
+from quickfund import getter
+from quickfund.backends import CacheBackend, LocalBackend
+from quickfund.fetcher import FundInfoFetcher, parse_net_value
+from quickfund.getter import get_fund_infos, stream_fund_infos
+from quickfund.journal import RunJournal
+from quickfund.models import SECTIONS, FundInfo, Section
+from quickfund.session import SessionStats
+
+from .payloads import ESTIMATE_TEXT, FUND_INFO_PAGE_TEXT, NET_VALUE_TEXT
+
+
+MOCKED_FUND_CODE = "000478"
+
+FUND_CODES = ["000001", "000002", "000003", "000004", "000005"]
+
+
+class FakeServer:
+    """
+    Respond to the requests of the fetcher, once the gate is open. Requests of the
+    failing fund codes fail, and those of the stalled fund codes stall until cancelled.
+    """
+
+    def __init__(self) -> None:
+        self.gate = threading.Event()
+        self.gate.set()
+        self.failing: set[str] = set()
+        self.stalled: set[str] = set()
+        self.requests: list[tuple[str, str]] = []
+        self.cancelled: set[str] = set()
+
+    async def respond(
+        self, fetcher: FundInfoFetcher, endpoint: str, fund_code: str
+    ) -> str:
+        self.requests.append((endpoint, fund_code))
+
+        if fund_code in self.stalled:
+            try:
+                await asyncio.Event().wait()
+            except asyncio.CancelledError:
+                self.cancelled.add(fund_code)
+                raise
+
+        while not self.gate.is_set():
+            await asyncio.sleep(0.01)
+
+        if fund_code in self.failing:
+            raise ConnectionResetError(fund_code)
+
+        if endpoint == "estimate":
+            text = ESTIMATE_TEXT.replace(MOCKED_FUND_CODE, fund_code)
+        elif endpoint == "net_value":
+            text = NET_VALUE_TEXT
+        else:
+            text = FUND_INFO_PAGE_TEXT
+
+        fetcher.stats.requests += 1
+        fetcher.stats.record_transfer(endpoint, len(text), len(text))
+
+        return text
+
+
+@pytest.fixture
+def server(monkeypatch: pytest.MonkeyPatch) -> FakeServer:
+    server = FakeServer()
+
+    async def GET_text(
+        self: FundInfoFetcher,
+        url: str,
+        *,
+        endpoint: str = "other",
+        fund_code: str = "",
+        **_: Any,
+    ) -> str:
+        return await server.respond(self, endpoint, fund_code)
+
+    async def warm_up(self: FundInfoFetcher) -> None:
+        pass
+
+    monkeypatch.setattr(FundInfoFetcher, "GET_text", GET_text)
+    monkeypatch.setattr(FundInfoFetcher, "warm_up", warm_up)
+
+    return server
+
+
+@pytest.fixture
+def cache_path(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    path = tmp_path / "fund-infos"
+
+    monkeypatch.setattr(getter, "open_backend", lambda *_: LocalBackend(path))
+    monkeypatch.setattr(getter, "JOURNAL_DIR", tmp_path / "journals")
+    monkeypatch.setattr(getter, "NET_VALUE_HISTORY_DIR", tmp_path / "histories")
+
+    return path
+
+
+def stale_fund_info(fund_code: str) -> FundInfo:
+    return FundInfo.unfetched(fund_code).replaced(
+        net_value_info=parse_net_value(NET_VALUE_TEXT)
+    )
+
+
+def collect(
+    fund_codes: list[str], workers: int, cache: Optional[CacheBackend] = None
+) -> tuple[dict[str, FundInfo], SessionStats]:
+    async def main() -> tuple[dict[str, FundInfo], SessionStats]:
+        async with FundInfoFetcher() as fetcher:
+            fund_infos = {
+                code: fund_info
+                async for code, fund_info in stream_fund_infos(
+                    fund_codes, fetcher, cache, workers=workers
+                )
+            }
+        return fund_infos, fetcher.stats
+
+    return asyncio.run(main())
+
+
+def join_background_refresh(timeout: float = 10) -> None:
+    for thread in threading.enumerate():
+        if thread.name == "quickfund-refresh":
+            thread.join(timeout)
+            assert not thread.is_alive()
+
+
+def test_deadline(server: FakeServer, cache_path: Path) -> None:
+    cached = stale_fund_info("000001")
+    with LocalBackend(cache_path) as cache:
+        cache.put_many({"000001": cached})
+
+    stale: list[tuple[str, Section]] = []
+
+    # No request is responded until the deadline expires
+    server.gate.clear()
+    try:
+        deadline = 0.2
+        start = time.monotonic()
+        fund_infos = get_fund_infos(
+            ["000001", "000002"],
+            deadline=deadline,
+            on_stale=lambda *args: stale.append(args),
+        )
+        elapsed = time.monotonic() - start
+    finally:
+        server.gate.set()
+
+    assert deadline <= elapsed < deadline + 1
+
+    # As cached, or a placeholder if never cached
+    assert fund_infos[0].基金代码 == "000001"
+    assert fund_infos[0].净值日期 == cached.净值日期
+    assert fund_infos[1].基金代码 == "000002"
+    assert fund_infos[1].净值日期 == date.min
+
+    assert sorted(stale, key=repr) == sorted(
+        [(code, section) for code in ["000001", "000002"] for section in SECTIONS],
+        key=repr,
+    )
+
+    # The refresh goes on in the background, and writes the cache once finished
+    join_background_refresh()
+
+    with LocalBackend(cache_path) as cache:
+        refreshed = cache.get_many(["000001", "000002"])
+
+    assert refreshed["000002"].基金代码 == "000002"
+    assert refreshed["000002"].净值日期 == parse_net_value(NET_VALUE_TEXT).净值日期
+    assert refreshed["000001"].估算日期 == refreshed["000002"].估算日期
+    assert {code for _, code in server.requests} == {"000001", "000002"}
+
+
+@pytest.mark.parametrize(
+    "journal_codes, variant, resumed",
+    [
+        (FUND_CODES, "", True),
+        (FUND_CODES[:4], "", False),
+        (FUND_CODES, "FundEstimateInfo", False),
+    ],
+    ids=["same run", "other fund codes", "other variant"],
+)
+def test_resume(
+    server: FakeServer,
+    cache_path: Path,
+    journal_codes: list[str],
+    variant: str,
+    resumed: bool,
+) -> None:
+    committed = FUND_CODES[:3]
+
+    # A run interrupted after committing some fund codes
+    with LocalBackend(cache_path) as cache:
+        cache.put_many({code: stale_fund_info(code) for code in committed})
+    journal_path = RunJournal.path_for(getter.JOURNAL_DIR, journal_codes, variant)
+    with pytest.raises(KeyboardInterrupt), RunJournal(journal_path) as journal:
+        for fund_code in committed:
+            journal.record(fund_code)
+        raise KeyboardInterrupt
+
+    fund_infos = get_fund_infos(FUND_CODES, resume=True)
+
+    assert [fund_info.基金代码 for fund_info in fund_infos] == FUND_CODES
+    fetched = {code for _, code in server.requests}
+    assert fetched == (set(FUND_CODES) - set(committed) if resumed else set(FUND_CODES))
+
+    # The journal of the run is removed once it's finished
+    assert not RunJournal.path_for(getter.JOURNAL_DIR, FUND_CODES).exists()
+
+
+def test_workers(server: FakeServer, cache_path: Path) -> None:
+    expected, expected_stats = collect(FUND_CODES, workers=1)
+
+    with LocalBackend(cache_path) as cache:
+        fund_infos, stats = collect(FUND_CODES, workers=2, cache=cache)
+
+    assert fund_infos == expected
+
+    # The statistics of the workers are merged
+    assert stats.requests == expected_stats.requests == len(FUND_CODES) * 3
+    assert stats.wire_bytes == expected_stats.wire_bytes
+
+    # And their fund infos are committed to the cache from here
+    with LocalBackend(cache_path) as cache:
+        assert cache.get_many(FUND_CODES) == expected
+
+
+def test_worker_failure(server: FakeServer, cache_path: Path) -> None:
+    server.failing.add(FUND_CODES[-1])
+
+    errors: list[Exception] = []
+
+    def run() -> None:
+        try:
+            collect(FUND_CODES, workers=2)
+        except Exception as exc:
+            errors.append(exc)
+
+    # A daemon thread, so that a hang fails the test rather than blocking it forever
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(30)
+
+    assert not thread.is_alive()
+    assert len(errors) == 1
+    assert isinstance(errors[0], ConnectionResetError)
+    assert str(errors[0]) == FUND_CODES[-1]
+
+
+def test_break_early(server: FakeServer, cache_path: Path, tmp_path: Path) -> None:
+    server.stalled.update(FUND_CODES[2:])
+    journal_path = tmp_path / "run.journal"
+
+    async def main() -> list[str]:
+        yielded: list[str] = []
+
+        with LocalBackend(cache_path) as cache:
+            async with FundInfoFetcher() as fetcher:
+                stream = stream_fund_infos(
+                    FUND_CODES, fetcher, cache, journal_path=journal_path
+                )
+                async for fund_code, _ in stream:
+                    yielded.append(fund_code)
+                    if len(yielded) == 2:
+                        break
+                await stream.aclose()
+
+                # The cancellations are delivered on the next iterations of the loop
+                await asyncio.sleep(0.01)
+                assert server.cancelled == set(FUND_CODES[2:])
+
+        return yielded
+
+    yielded = asyncio.run(main())
+
+    assert set(yielded) == set(FUND_CODES[:2])
+
+    # The fund infos yielded are committed to the cache and the journal, so that the
+    # run can be resumed from there
+    assert RunJournal.load(journal_path) == set(yielded)
+    with LocalBackend(cache_path) as cache:
+        assert set(cache.get_many(FUND_CODES)) == set(yielded)
+
+
+@pytest.mark.parametrize("borrowed", [True, False])
+def test_fetcher_ownership(
+    server: FakeServer, monkeypatch: pytest.MonkeyPatch, borrowed: bool
+) -> None:
+    closed: list[FundInfoFetcher] = []
+    close = FundInfoFetcher.close
+
+    async def spy(self: FundInfoFetcher) -> None:
+        closed.append(self)
+        await close(self)
+
+    monkeypatch.setattr(FundInfoFetcher, "close", spy)
+
+    async def main() -> None:
+        fetcher = FundInfoFetcher() if borrowed else None
+
+        async for _ in stream_fund_infos(FUND_CODES, fetcher):
+            pass
+
+        # A borrowed fetcher is left open for reuse, and one created is closed
+        assert len(closed) == (0 if borrowed else 1)
+
+        if fetcher is not None:
+            await fetcher.close()
+
+    asyncio.run(main())
@@ -0,0 +1,199 @@
+"""
+Tests of request hedging, with fake requests that respond instantly, stall until they
+are cancelled, or fail, so that which request wins doesn't depend on timing.
+"""
+
+import asyncio
+
+import pytest
+
+from quickfund.hedging import HedgeBudget, Hedger, LatencyTracker
+from quickfund.session import SessionStats
+
+
+ENDPOINT = "estimate"
+
+# The time, in seconds, that a slow request takes. The recent latencies are those of
+# instant requests, so a request this slow is always past the hedging delay.
+SLOW = 0.05
+
+
+class Request:
+    """A fake request, which records whether it's sent, and whether it's cancelled"""
+
+    def __init__(self, result: str = "", delay: float = 0, error: bool = False) -> None:
+        self.result = result
+        self.delay = delay
+        self.error = error
+        self.sent = 0
+        self.cancelled = False
+
+    async def __call__(self) -> str:
+        self.sent += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.error:
+            raise RuntimeError(self.result)
+        return self.result
+
+
+def stall() -> Request:
+    return Request("stalled", delay=3600)
+
+
+async def warm_up(hedger: Hedger, requests: int = 20) -> None:
+    for _ in range(requests):
+        await hedger.run(ENDPOINT, Request("fast"))
+
+
+def test_latency_tracker() -> None:
+    tracker = LatencyTracker(window=4, min_samples=2)
+
+    tracker.record(ENDPOINT, 1)
+    assert tracker.percentile(ENDPOINT, 95) is None
+
+    for latency in [2, 3, 4, 5]:
+        tracker.record(ENDPOINT, latency)
+    # Only the latest four are kept
+    assert tracker.percentile(ENDPOINT, 50) == 3
+    assert tracker.percentile(ENDPOINT, 95) == 5
+    assert tracker.percentile("other", 95) is None
+
+
+def test_budget() -> None:
+    budget = HedgeBudget(0.25, burst=2)
+
+    withdrawn = 0
+    for _ in range(100):
+        budget.deposit()
+        withdrawn += budget.withdraw()
+
+    assert withdrawn == 25
+
+    # The budget saves up to the burst
+    for _ in range(100):
+        budget.deposit()
+    assert [budget.withdraw() for _ in range(3)] == [True, True, False]
+
+
+def test_no_hedge_before_min_samples() -> None:
+    async def main() -> None:
+        stats = SessionStats()
+        hedger = Hedger(95, 1.0, stats)
+        await warm_up(hedger, 19)
+
+        primary, hedge = Request("primary", delay=SLOW), Request("hedge")
+        assert await hedger.run(ENDPOINT, primary, hedge) == "primary"
+
+        assert hedge.sent == 0
+        assert stats.hedges == 0
+
+    asyncio.run(main())
+
+
+def test_hedge_wins() -> None:
+    async def main() -> None:
+        stats = SessionStats()
+        hedger = Hedger(95, 1.0, stats)
+        await warm_up(hedger)
+
+        primary, hedge = stall(), Request("hedge")
+        assert await hedger.run(ENDPOINT, primary, hedge) == "hedge"
+
+        # The cancellation is delivered to the loser on the next iteration of the loop
+        await asyncio.sleep(0)
+        assert hedge.sent == 1
+        assert primary.cancelled
+        assert (stats.hedges, stats.hedges_won) == (1, 1)
+
+    asyncio.run(main())
+
+
+def test_primary_wins() -> None:
+    async def main() -> None:
+        stats = SessionStats()
+        hedger = Hedger(95, 1.0, stats)
+        await warm_up(hedger)
+
+        primary, hedge = Request("primary", delay=SLOW), stall()
+        assert await hedger.run(ENDPOINT, primary, hedge) == "primary"
+
+        await asyncio.sleep(0)
+        assert hedge.sent == 1
+        assert hedge.cancelled
+        assert (stats.hedges, stats.hedges_won) == (1, 0)
+
+    asyncio.run(main())
+
+
+def test_budget_caps_hedges() -> None:
+    async def main() -> None:
+        stats = SessionStats()
+        hedger = Hedger(95, 0.1, stats)
+        await warm_up(hedger)
+
+        # Slow requests that fail unless hedged, so that their latencies are not
+        # recorded, and the hedging delay stays put
+        for _ in range(10):
+            primary = Request("primary", delay=SLOW, error=True)
+            try:
+                await hedger.run(ENDPOINT, primary, Request("hedge"))
+            except RuntimeError:
+                pass
+
+        # Of the 30 requests, at most a tenth are hedged
+        assert stats.hedges == 3
+        assert stats.hedges_won == 3
+
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize(
+    "primary_error, hedge_error, expected",
+    [(True, False, "hedge"), (False, True, "primary")],
+)
+def test_one_fails(primary_error: bool, hedge_error: bool, expected: str) -> None:
+    async def main() -> None:
+        hedger = Hedger(95, 1.0)
+        await warm_up(hedger)
+
+        # The failure comes first
+        primary = Request("primary", delay=SLOW, error=primary_error)
+        hedge_delay = SLOW * 2 if primary_error else 0
+        hedge = Request("hedge", delay=hedge_delay, error=hedge_error)
+
+        assert await hedger.run(ENDPOINT, primary, hedge) == expected
+
+    asyncio.run(main())
+
+
+def test_both_fail() -> None:
+    async def main() -> None:
+        hedger = Hedger(95, 1.0)
+        await warm_up(hedger)
+
+        primary = Request("primary", delay=SLOW, error=True)
+        hedge = Request("hedge", error=True)
+
+        with pytest.raises(RuntimeError, match="primary"):
+            await hedger.run(ENDPOINT, primary, hedge)
+
+        assert hedge.sent == 1
+
+    asyncio.run(main())
+
+
+def test_disabled() -> None:
+    async def main() -> None:
+        stats = SessionStats()
+        hedger = Hedger(0, 1.0, stats)
+        await warm_up(hedger)
+
+        primary, hedge = Request("primary", delay=SLOW), Request("hedge")
+        assert await hedger.run(ENDPOINT, primary, hedge) == "primary"
+        assert hedge.sent == 0 and stats.hedges == 0
+
+    asyncio.run(main())
@@ -0,0 +1,48 @@
+"""
+Tests of the local history store, in particular that compaction reclaims the space of
+relocated regions, without losing records.
+"""
+
+from datetime import date, timedelta
+from pathlib import Path
+
+from quickfund.history import MIN_REGION_CAPACITY, RECORD_DTYPE, NetValueHistoryStore
+from quickfund.models import FundNetValueHistory
+
+
+def history(start: date, n: int) -> FundNetValueHistory:
+    history = FundNetValueHistory()
+    for i in range(n):
+        history.append(start + timedelta(days=i), 1 + i / 100, 2 + i / 100, 0.01)
+    history.分红送配[-1] = "每份派现金0.0500元"
+    return history
+
+
+def test_compact(tmp_path: Path) -> None:
+    start = date(2021, 1, 1)
+
+    with NetValueHistoryStore(tmp_path) as store:
+        store.append("000001", history(start, MIN_REGION_CAPACITY))
+        store.append("000002", history(start, 10))
+        # Beyond its capacity, so the region of 000001 is relocated after 000002's
+        store.append("000001", history(start, MIN_REGION_CAPACITY + 1))
+
+        expected = {code: store.load(code) for code in store.fund_codes()}
+        assert store.length("000001") == MIN_REGION_CAPACITY + 1
+
+        before, after = store.compact()
+
+        assert before > after == (MIN_REGION_CAPACITY + 1 + 10) * RECORD_DTYPE.itemsize
+        assert {code: store.load(code) for code in store.fund_codes()} == expected
+
+    # Only the new generation of the data file is left, and it's the one reopened
+    assert len(list(tmp_path.glob("histories.*.dat"))) == 1
+
+    with NetValueHistoryStore(tmp_path) as store:
+        assert {code: store.load(code) for code in store.fund_codes()} == expected
+        assert store.data_size() == after
+
+        # Appending after compaction relocates the region, which has no spare capacity
+        store.append("000002", history(start, 11))
+        assert store.length("000002") == 11
+        assert store.load("000001") == expected["000001"]
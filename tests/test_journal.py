@@ -0,0 +1,98 @@
+"""
+Tests of the run journal: checkpoints, resuming the fund codes committed by an
+interrupted run, the journal paths of runs, and the removal of finished journals.
+"""
+
+from pathlib import Path
+
+import pytest
+
+from quickfund.journal import RunJournal
+
+
+FUND_CODES = ["000001", "000002", "000003", "000004", "000005"]
+
+
+def test_commit_every_interval(tmp_path: Path) -> None:
+    path = tmp_path / "run.journal"
+    checkpoints: list[list[str]] = []
+
+    journal = RunJournal(path, checkpoints.append, checkpoint_interval=2)
+    for fund_code in FUND_CODES[:3]:
+        journal.record(fund_code)
+
+    assert checkpoints == [FUND_CODES[:2]]
+    assert RunJournal.load(path) == set(FUND_CODES[:2])
+    assert journal.completed == set(FUND_CODES[:2])
+
+    # The pending fund code is committed on closing
+    journal.close()
+
+    assert checkpoints == [FUND_CODES[:2], FUND_CODES[2:3]]
+    assert RunJournal.load(path) == set(FUND_CODES[:3])
+
+
+def test_resume(tmp_path: Path) -> None:
+    path = tmp_path / "run.journal"
+
+    with pytest.raises(KeyboardInterrupt):
+        with RunJournal(path, checkpoint_interval=1) as journal:
+            for fund_code in FUND_CODES[:2]:
+                journal.record(fund_code)
+            raise KeyboardInterrupt
+
+    # The journal of an interrupted run is kept, and resumed, even after a crash tears
+    # the line being written
+    with open(path, "a", encoding="utf-8") as file:
+        file.write("0000")
+
+    with RunJournal(path, checkpoint_interval=1, resume=True) as journal:
+        assert journal.completed == set(FUND_CODES[:2])
+        journal.record(FUND_CODES[2])
+        assert RunJournal.load(path) == set(FUND_CODES[:3])
+
+    # Starting over rather than resuming discards the journal
+    with RunJournal(path, checkpoint_interval=1) as journal:
+        assert journal.completed == set()
+        assert RunJournal.load(path) == set()
+
+
+def test_unlinked_once_finished(tmp_path: Path) -> None:
+    path = tmp_path / "run.journal"
+
+    journal = RunJournal(path)
+    journal.record(FUND_CODES[0])
+    journal.close(finished=False)
+    assert path.is_file()
+
+    journal = RunJournal(path, resume=True)
+    journal.close(finished=True)
+    assert not path.exists()
+
+
+def test_without_path() -> None:
+    checkpoints: list[list[str]] = []
+
+    with RunJournal(None, checkpoints.append, checkpoint_interval=2) as journal:
+        for fund_code in FUND_CODES:
+            journal.record(fund_code)
+
+    assert checkpoints == [FUND_CODES[:2], FUND_CODES[2:4], FUND_CODES[4:]]
+
+
+def test_path_for(tmp_path: Path) -> None:
+    path = RunJournal.path_for(tmp_path, FUND_CODES)
+
+    assert path.parent == tmp_path
+
+    # Identified by the set of fund codes
+    assert RunJournal.path_for(tmp_path, reversed(FUND_CODES + FUND_CODES)) == path
+    assert RunJournal.path_for(tmp_path, FUND_CODES[:-1]) != path
+
+    # And by the variant
+    assert RunJournal.path_for(tmp_path, FUND_CODES, variant="") == path
+    variants = {
+        RunJournal.path_for(tmp_path, FUND_CODES, variant=variant)
+        for variant in ["FundEstimateInfo", "FundIARBCInfo"]
+    }
+    assert len(variants) == 2 and path not in variants
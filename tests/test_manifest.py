@@ -0,0 +1,76 @@
+"""
+Tests of the incremental update planning, in particular that rows and documents are
+regenerated when their formatting would change, even if their values don't.
+"""
+
+import copy
+from pathlib import Path
+
+import attr
+import pytest
+
+from quickfund import writter
+from quickfund.fetcher import parse_estimate, parse_IARBC, parse_net_value
+from quickfund.models import FundEstimateInfo, FundInfo
+from quickfund.writter import SCHEMA, plan_increment, write_to_xlsx
+
+from .payloads import ESTIMATE_TEXT, FUND_INFO_PAGE_TEXT, NET_VALUE_TEXT
+
+
+@pytest.fixture
+def fund_infos() -> list[FundInfo]:
+    fund_info = FundInfo.unfetched("000001").replaced(
+        net_value_info=parse_net_value(NET_VALUE_TEXT),
+        estimate_info=parse_estimate(ESTIMATE_TEXT),
+        IARBC_info=parse_IARBC(FUND_INFO_PAGE_TEXT),
+    )
+    # The fund code of the mocked estimate is overridden, to tell the rows apart
+    return [attr.evolve(fund_info, 基金代码=code) for code in ("000001", "000002")]
+
+
+@pytest.fixture
+def xlsx_filename(tmp_path: Path, fund_infos: list[FundInfo]) -> Path:
+    xlsx_filename = tmp_path / "基金信息.xlsx"
+    increment = plan_increment(fund_infos, xlsx_filename)
+    write_to_xlsx(fund_infos, xlsx_filename, progress=False, increment=increment)
+    return xlsx_filename
+
+
+def test_unchanged(xlsx_filename: Path, fund_infos: list[FundInfo]) -> None:
+    assert plan_increment(fund_infos, xlsx_filename).unchanged
+
+
+def test_changed_value(xlsx_filename: Path, fund_infos: list[FundInfo]) -> None:
+    fund_infos[1] = attr.evolve(fund_infos[1], 实时估值=1.2345)
+
+    diff = plan_increment(fund_infos, xlsx_filename).diff
+    assert diff is not None
+    assert diff.changed == ["000002"] and not diff.rearranged
+
+
+def test_changed_staleness(xlsx_filename: Path, fund_infos: list[FundInfo]) -> None:
+    stale = {"000001": {FundEstimateInfo}}
+
+    diff = plan_increment(fund_infos, xlsx_filename, stale=stale).diff
+    assert diff is not None
+    assert diff.changed == ["000001"] and not diff.rearranged
+
+
+def test_changed_schema_format(
+    xlsx_filename: Path, fund_infos: list[FundInfo]
+) -> None:
+    schema = copy.deepcopy(SCHEMA)
+    schema[0]["format"] = {"bg_color": "red"}
+
+    diff = plan_increment(fund_infos, xlsx_filename, schema=schema).diff
+    assert diff is not None and diff.rearranged
+
+
+def test_changed_layout_format(
+    xlsx_filename: Path, fund_infos: list[FundInfo], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    layout_formats = {**writter.LAYOUT_FORMATS, "stale": {"font_color": "red"}}
+    monkeypatch.setattr(writter, "LAYOUT_FORMATS", layout_formats)
+
+    diff = plan_increment(fund_infos, xlsx_filename).diff
+    assert diff is not None and diff.rearranged
@@ -0,0 +1,94 @@
+"""
+Microbenchmarks of the parsers of the responses of the endpoints, and of the reference
+parsers for comparison, over the mocked responses and variants synthesized from them.
+
+The timings are compared against the stored baseline, to catch regressions of the
+parsers before release:
+
+    just bench          # compare against the baseline, failing on regression
+    just bench-save     # store a new baseline, e.g., after an optimization
+
+The baseline is stored per machine, see `pytest --help` on `--benchmark-storage`.
+"""
+
+from collections.abc import Callable
+from datetime import date, datetime
+from typing import Any
+
+import pytest
+
+from quickfund.fetcher import parse_estimate, parse_IARBC, parse_net_value
+
+from . import reference_parsers
+from .payloads import (
+    ESTIMATE_TEXT,
+    FUND_INFO_PAGE_TEXT,
+    NET_VALUE_TEXT,
+    IARBC_fragment,
+    estimate_text,
+    fund_info_page_text,
+    net_value_text,
+)
+
+
+# Map from case name to the text, grouped by endpoint
+TEXTS: dict[str, dict[str, str]] = {
+    "net_value": {
+        "mock": NET_VALUE_TEXT,
+        "dividend": net_value_text(
+            [
+                (date(2021, 12, 17), "1.0512", "-0.35%", "每份派现金0.0500元"),
+                (date(2021, 12, 16), "1.1034", "12.71%", ""),
+            ]
+        ),
+    },
+    "estimate": {
+        "mock": ESTIMATE_TEXT,
+        "long_name": estimate_text(
+            "161725",
+            "招商中证白酒指数(LOF)A" * 3,
+            datetime(2021, 12, 20, 15, 0),
+            "1.2345",
+            "10.00",
+        ),
+    },
+    "IARBC": {
+        "mock": FUND_INFO_PAGE_TEXT,
+        "fragment": IARBC_fragment(FUND_INFO_PAGE_TEXT),
+        "fragment_wide_ranks": IARBC_fragment(
+            fund_info_page_text(date(2021, 12, 17), [(12345, 19999)] * 8)
+        ),
+    },
+}
+
+PARSERS: dict[str, dict[str, Callable[[str], Any]]] = {
+    "net_value": {
+        "parse_net_value": parse_net_value,
+        "reference": reference_parsers.parse_net_value,
+    },
+    "estimate": {
+        "parse_estimate": parse_estimate,
+        "reference": reference_parsers.parse_estimate,
+    },
+    "IARBC": {
+        "parse_IARBC": parse_IARBC,
+        "reference": reference_parsers.parse_IARBC,
+    },
+}
+
+# Cases are parametrized by names, rather than by the texts, which would otherwise be
+# stored in the baseline
+CASES = [
+    (endpoint, parser_name, text_name)
+    for endpoint in TEXTS
+    for parser_name in PARSERS[endpoint]
+    for text_name in TEXTS[endpoint]
+]
+
+
+@pytest.mark.parametrize("endpoint, parser_name, text_name", CASES)
+def test_parser_benchmark(
+    benchmark: Any, endpoint: str, parser_name: str, text_name: str
+) -> None:
+    benchmark.group = endpoint
+    benchmark(PARSERS[endpoint][parser_name], TEXTS[endpoint][text_name])
@@ -0,0 +1,85 @@
+"""
+Tests of the request scheduler, with a rate limiter that hands out tokens on demand,
+so that the tokens taken are counted, and their timing is under control.
+"""
+
+import asyncio
+
+from quickfund.ratelimit import RequestScheduler
+
+
+class ManualRateLimiter:
+    def __init__(self) -> None:
+        self.taken = 0
+        self.tokens = asyncio.Semaphore(0)
+
+    async def acquire(self) -> None:
+        await self.tokens.acquire()
+        self.taken += 1
+
+    def release(self, n: int = 1) -> None:
+        for _ in range(n):
+            self.tokens.release()
+
+
+async def settle() -> None:
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def test_cancelled_requests_use_no_tokens() -> None:
+    async def main() -> None:
+        rate_limiter = ManualRateLimiter()
+        scheduler = RequestScheduler({"host": rate_limiter})
+        sent = []
+
+        async def request(name: str) -> None:
+            await scheduler.acquire("host", flow=name)
+            sent.append(name)
+
+        tasks = {name: asyncio.create_task(request(name)) for name in "abcd"}
+        await settle()
+
+        # The request that the dispatcher waits for a token for, and one queued
+        tasks["a"].cancel()
+        tasks["d"].cancel()
+        await settle()
+
+        rate_limiter.release(2)
+        await settle()
+
+        assert sent == ["b", "c"]
+        assert rate_limiter.taken == 2
+
+        # The dispatcher is gone with the queue, and doesn't take another token for
+        # the cancelled request left in it
+        rate_limiter.release()
+        await settle()
+        assert rate_limiter.taken == 2
+
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+
+    asyncio.run(main())
+
+
+def test_priority_and_fairness() -> None:
+    async def main() -> None:
+        rate_limiter = ManualRateLimiter()
+        scheduler = RequestScheduler({"host": rate_limiter})
+        sent = []
+
+        async def request(name: str, priority: int, flow: str) -> None:
+            await scheduler.acquire("host", priority, flow)
+            sent.append(name)
+
+        requests = [("x1", 1, "x"), ("x2", 1, "x"), ("x3", 1, "x"), ("y1", 1, "y")]
+        requests.append(("urgent", 0, "z"))
+        tasks = [asyncio.create_task(request(*args)) for args in requests]
+        await settle()
+
+        rate_limiter.release(len(tasks))
+        await asyncio.gather(*tasks)
+
+        assert sent == ["urgent", "x1", "y1", "x2", "x3"]
+
+    asyncio.run(main())
@@ -0,0 +1,123 @@
+"""
+Tests of the incremental decoding of response bodies: the decoders of the content
+encodings, and the scanner of the markers after which the rest of a body is not needed,
+fed in small chunks as received from the wire.
+"""
+
+import gzip
+import zlib
+from collections.abc import Callable, Iterator
+
+import pytest
+
+from quickfund import session
+from quickfund.fetcher import IARBC_FRAGMENT_END_MARKERS
+from quickfund.session import MarkerScanner, create_decoder
+
+from .payloads import FUND_INFO_PAGE_TEXT, IARBC_fragment
+
+
+CONTENT = FUND_INFO_PAGE_TEXT.encode("utf-8")
+
+
+def chunks(data: bytes, size: int) -> Iterator[bytes]:
+    for start in range(0, len(data), size):
+        yield data[start : start + size]
+
+
+def scan_in_chunks(markers: list[bytes], data: bytes, size: int) -> MarkerScanner:
+    scanner = MarkerScanner(markers)
+    buffer = bytearray()
+    for chunk in chunks(data, size):
+        buffer += chunk
+        if scanner.scan(buffer):
+            break
+    return scanner
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 1024])
+def test_marker_split_across_chunks(size: int) -> None:
+    data = b"<div>" + b"x" * 10 + b"</table>" + b"y" * 10
+
+    scanner = scan_in_chunks([b"</table>"], data, size)
+
+    assert scanner.done
+    assert scanner.end == data.index(b"</table>") + len(b"</table>")
+
+
+def test_markers_in_order() -> None:
+    # The second marker before the first one doesn't count
+    data = b"B...A...B..."
+
+    scanner = MarkerScanner([b"A", b"B"])
+
+    assert scanner.scan(data[:4]) is False
+    assert scanner.scan(data[:8]) is False
+    assert scanner.scan(data) is True
+    assert scanner.end == data.rindex(b"B") + 1
+
+
+def test_overlapping_markers() -> None:
+    # Each marker is found after the end of the previous one
+    scanner = MarkerScanner([b"ab", b"ba"])
+
+    assert scanner.scan(b"aba") is False
+    assert scanner.scan(b"ababa") is True
+    assert scanner.end == 5
+
+
+def test_markers_absent() -> None:
+    scanner = scan_in_chunks([b"</html>", b"never"], CONTENT, 100)
+
+    assert not scanner.done
+
+
+@pytest.mark.parametrize("size", [1, 16, 1024])
+def test_IARBC_fragment_markers(size: int) -> None:
+    scanner = scan_in_chunks(IARBC_FRAGMENT_END_MARKERS, CONTENT, size)
+
+    assert scanner.done
+    assert CONTENT[: scanner.end].decode("utf-8") == IARBC_fragment(FUND_INFO_PAGE_TEXT)
+
+
+def brotli_compress(data: bytes) -> bytes:
+    return session.brotli.compress(data)
+
+
+@pytest.mark.parametrize(
+    "content_encoding, compress",
+    [
+        ("gzip", gzip.compress),
+        ("deflate", zlib.compress),
+        pytest.param(
+            "br",
+            brotli_compress,
+            marks=pytest.mark.skipif(
+                session.brotli is None, reason="Brotli is not installed"
+            ),
+        ),
+    ],
+)
+@pytest.mark.parametrize("size", [1, 7, 1024])
+def test_decode_in_chunks(
+    content_encoding: str, compress: Callable[[bytes], bytes], size: int
+) -> None:
+    decoder = create_decoder(content_encoding)
+    assert decoder is not None
+
+    decoded = bytearray()
+    for chunk in chunks(compress(CONTENT), size):
+        decoded += decoder.decompress(chunk)
+    decoded += decoder.flush()
+
+    assert decoded == CONTENT
+
+
+@pytest.mark.parametrize("content_encoding", ["", "identity", " Identity "])
+def test_identity(content_encoding: str) -> None:
+    assert create_decoder(content_encoding) is None
+
+
+def test_unsupported_encoding() -> None:
+    with pytest.raises(ValueError):
+        create_decoder("compress")
@@ -0,0 +1,160 @@
+"""
+Tests of the single-flight fetching of `FundInfoFetcher`: concurrent fetches of the
+same key share one request, and results are reused within the result TTL. The requests
+are faked, and counted by fund code.
+"""
+
+import asyncio
+from collections import Counter
+from collections.abc import Awaitable, Callable, Iterator
+from typing import Any
+
+import pytest
+
+from quickfund.fetcher import FundInfoFetcher
+from quickfund.models import FundEstimateInfo
+
+from .payloads import ESTIMATE_TEXT
+
+
+MOCKED_FUND_CODE = "000478"
+
+
+class FakeReceiver:
+    """
+    Respond with the mocked estimate of the fund code after the delay, or fail if told
+    to. Record the requests cancelled.
+    """
+
+    def __init__(self) -> None:
+        self.received: Counter[str] = Counter()
+        self.cancelled: Counter[str] = Counter()
+        self.delay = 0.01
+        self.failures = 0
+
+    async def receive(self, url: str) -> str:
+        fund_code = url.rsplit("/", 1)[-1].removesuffix(".js")
+        self.received[fund_code] += 1
+
+        # Stay in flight long enough for concurrent fetches to join
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled[fund_code] += 1
+            raise
+
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionResetError
+
+        return ESTIMATE_TEXT.replace(MOCKED_FUND_CODE, fund_code)
+
+
+@pytest.fixture
+def receiver(monkeypatch: pytest.MonkeyPatch) -> Iterator[FakeReceiver]:
+    receiver = FakeReceiver()
+
+    async def _receive_text(self: FundInfoFetcher, url: str, *_: Any) -> str:
+        return await receiver.receive(url)
+
+    monkeypatch.setattr(FundInfoFetcher, "_receive_text", _receive_text)
+
+    yield receiver
+
+
+def run_with_fetcher(
+    main: Callable[[FundInfoFetcher], Awaitable[None]], result_ttl: float = 30
+) -> None:
+    async def run() -> None:
+        async with FundInfoFetcher(result_ttl=result_ttl) as fetcher:
+            await main(fetcher)
+
+    asyncio.run(run())
+
+
+def test_coalesced(receiver: FakeReceiver) -> None:
+    async def main(fetcher: FundInfoFetcher) -> None:
+        results = await asyncio.gather(
+            *[fetcher.fetch_estimate(code) for code in ["000001"] * 5 + ["000002"]]
+        )
+
+        assert all(result is results[0] for result in results[:5])
+        assert results[0].基金代码 == "000001"
+        assert results[5].基金代码 == "000002"
+
+    run_with_fetcher(main)
+
+    assert receiver.received == {"000001": 1, "000002": 1}
+
+
+def test_result_ttl(receiver: FakeReceiver) -> None:
+    async def main(fetcher: FundInfoFetcher) -> None:
+        first = await fetcher.fetch_estimate("000001")
+        assert await fetcher.fetch_estimate("000001") is first
+        assert receiver.received["000001"] == 1
+
+        await asyncio.sleep(0.1)
+
+        await fetcher.fetch_estimate("000001")
+        assert receiver.received["000001"] == 2
+
+    run_with_fetcher(main, result_ttl=0.05)
+
+
+def test_result_ttl_zero(receiver: FakeReceiver) -> None:
+    async def main(fetcher: FundInfoFetcher) -> None:
+        await fetcher.fetch_estimate("000001")
+        await fetcher.fetch_estimate("000001")
+        assert receiver.received["000001"] == 2
+
+        # Concurrent fetches are still coalesced
+        await asyncio.gather(*[fetcher.fetch_estimate("000001") for _ in range(5)])
+        assert receiver.received["000001"] == 3
+
+    run_with_fetcher(main, result_ttl=0)
+
+
+def test_failure_not_cached(receiver: FakeReceiver) -> None:
+    receiver.failures = 1
+
+    async def main(fetcher: FundInfoFetcher) -> None:
+        # The waiters of the failed request all fail with it
+        results = await asyncio.gather(
+            *[fetcher.fetch_estimate("000001") for _ in range(3)],
+            return_exceptions=True,
+        )
+        assert isinstance(results[0], Exception)
+        assert all(result is results[0] for result in results)
+        assert receiver.received["000001"] == 1
+
+        estimate_info = await fetcher.fetch_estimate("000001")
+        assert isinstance(estimate_info, FundEstimateInfo)
+        assert receiver.received["000001"] == 2
+
+    run_with_fetcher(main)
+
+
+def test_cancelled_with_all_waiters(receiver: FakeReceiver) -> None:
+    receiver.delay = 3600
+
+    async def main(fetcher: FundInfoFetcher) -> None:
+        waiters = [
+            asyncio.ensure_future(fetcher.fetch_estimate("000001")) for _ in range(2)
+        ]
+        await asyncio.sleep(0.01)
+
+        # The request goes on for the other waiter
+        waiters[0].cancel()
+        await asyncio.sleep(0.01)
+        assert receiver.cancelled["000001"] == 0
+
+        waiters[1].cancel()
+        await asyncio.sleep(0.01)
+        assert receiver.cancelled["000001"] == 1
+
+        # A later fetch starts afresh
+        receiver.delay = 0
+        await fetcher.fetch_estimate("000001")
+        assert receiver.received["000001"] == 2
+
+    run_with_fetcher(main)